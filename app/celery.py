@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 
 os.environ.setdefault(
     "DJANGO_SETTINGS_MODULE", "local_settings"
@@ -11,3 +12,16 @@ app = Celery('movie_ticketing')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+@worker_process_init.connect
+def use_worker_connection_pools(**kwargs):
+    from app.commons.db.pool import connection_pools
+    connection_pools.set_role('worker')
+
+
+@worker_process_shutdown.connect
+def close_connection_pools(**kwargs):
+    from app.commons.db.pool import connection_pools
+    connection_pools.close()
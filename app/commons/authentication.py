@@ -0,0 +1,114 @@
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenVersions(object):
+    """
+    a version per user in the AUTH_TOKEN_VERSION_ALIAS cache, shared by all processes. Logout, a password
+    or permission change and deleting the user bump it, cached entries stored under an older version are not used.
+    """
+    key_template = 'auth-token-version:{}'
+
+    @property
+    def cache(self):
+        return caches[settings.AUTH_TOKEN_VERSION_ALIAS]
+
+    def get(self, user_id):
+        return self.cache.get(self.key_template.format(user_id), 0)
+
+    def bump(self, user_id):
+        """
+        bumps now and again once the transaction commits, a process loading the user before the commit would
+        otherwise cache the old row under the new version
+        """
+        self.incr(user_id)
+        transaction.on_commit(lambda: self.incr(user_id))
+
+    def incr(self, user_id):
+        key = self.key_template.format(user_id)
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # evicted in between, a missing version never matches a cached entry either
+            pass
+
+
+class TokenCache(object):
+    """
+    process local LRU of token key -> (user, token) holding at most AUTH_TOKEN_CACHE_SIZE entries, each for
+    AUTH_TOKEN_CACHE_TTL seconds. Every hit checks the shared TokenVersions, so changes made by other processes
+    take effect on the next request.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.versions = TokenVersions()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[2] <= time.time():
+                self.stats['misses'] += 1
+                return None
+            # re-inserting moves the entry to the most recently used end
+            self.entries[key] = entry
+        if self.versions.get(entry[0].pk) != entry[3]:
+            self.invalidate(key)
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+        with self.lock:
+            self.stats['hits'] += 1
+        return entry[0], entry[1]
+
+    def set(self, key, user, token, version):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (user, token, time.time() + settings.AUTH_TOKEN_CACHE_TTL, version)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict((stat, self.stats[stat]) for stat in ('hits', 'misses', 'evictions', 'invalidations'))
+            stats['size'] = len(self.entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(float(stats['hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    token authentication that answers repeated tokens from the TokenCache instead of joining
+    authtoken_token and users_user on every request
+    """
+    token_cache = TokenCache()
+
+    def authenticate_credentials(self, key):
+        entry = self.token_cache.get(key)
+        if entry is None:
+            entry = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            self.token_cache.set(key, entry[0], entry[1], self.token_cache.versions.get(entry[0].pk))
+        # every request gets its own copies so that changes made while handling it stay local to it
+        return copy.copy(entry[0]), copy.copy(entry[1])
+
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class ResponseCache(object):
+    """
+    caches the rendered JSON of responses together with their ETag and counts hits, misses and invalidations.
+    Hits negotiated to JSON are served from the stored bytes without rendering them again.
+    The backend is the RESPONSE_CACHE_ALIAS entry of CACHES, local memory by default or any shared cache.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def make_key(self, *parts):
+        return ':'.join([self.prefix] + [str(part) for part in parts])
+
+    def count(self, stat, value=1):
+        with self.lock:
+            self.stats[stat] += value
+
+    def get_stats(self):
+        with self.lock:
+            return dict((stat, self.stats[stat]) for stat in ('hits', 'misses', 'invalidations'))
+
+    def is_not_modified(self, request, etag):
+        """
+        If-None-Match matches any of its tags with the weak comparison of RFC 7232, or every tag with *
+        """
+        tags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+    def response(self, request, key, build_response):
+        """
+        returns the cached response for the key, building and storing it on a miss,
+        or an empty 304 when the client already holds the current ETag
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            self.count('misses')
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = JSONRenderer().render(response.data)
+            etag = quote_etag(hashlib.md5(content).hexdigest())
+            self.cache.set(key, (etag, content), settings.RESPONSE_CACHE_TTL)
+            if self.is_not_modified(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            response['ETag'] = etag
+            return response
+        self.count('hits')
+        etag, content = entry
+        if self.is_not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        if isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer):
+            response = HttpResponse(content, content_type='application/json')
+            response['ETag'] = etag
+            return response
+        return Response(json.loads(content.decode('utf-8')), headers={'ETag': etag})
+
+    def invalidate(self, keys):
+        self.count('invalidations', len(keys))
+        self.cache.delete_many(keys)
+
+    def get_version(self, name):
+        return self.cache.get(self.make_key('version', name), 0)
+
+    def invalidate_version(self, name):
+        """
+        moves every key built with the named version to a new namespace
+        """
+        self.count('invalidations')
+        key = self.make_key('version', name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
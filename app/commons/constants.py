@@ -3,7 +3,8 @@ MAX_LENGTH_DICT = {
     "NAME": 64,
     "LANGUAGE": 100,
     "EMAIL": 128,
-    "LONG": 2048
+    "LONG": 2048,
+    "GEOHASH": 12
 }
 ERROR_MESSAGES = {
     "INVALID_OPEN_CLOSE_TIME": "opening time cannot be less than closing time",
@@ -17,10 +18,34 @@ ERROR_MESSAGES = {
     "SAME_PASSWORD_ERROR": "Old and New Password cannot be same",
     "INCORRECT_PASSWORD": "Old Password is incorrect",
     "INADEQUATE_SEATS_REQUESTED": "Requested number of seats are not allowed",
+    "SOLD_OUT": "The requested number of seats are no longer available for this slot",
+    "INVALID_SEATS": "Requested seat numbers are not valid for this auditorium",
+    "SEATS_UNAVAILABLE": "Some of the requested seats are already held or booked",
+    "HOLD_EXPIRED": "The seat hold has expired or is already confirmed",
+    "INVALID_IDEMPOTENCY_KEY": "Idempotency-Key must be at most 64 characters",
+    "IDEMPOTENCY_KEY_REUSED": "Idempotency-Key was already used for a different request",
+    "LOCATION_REQUIRED": "city, zipcode or latitude and longitude are required",
+    "INCOMPLETE_LOCATION": "latitude and longitude must be given together",
+    "PAST_DATE": "date cannot be in the past",
     "KEY_ERROR": "the given key is not present",
     "ALREADY_EXISTS": "Duplicate exists",
     "NOT_FOUND": "detail not found"
 }
 STATUS = {
-    "CANCELLED": "Cancelled"
+    "CANCELLED": "Cancelled",
+    "CONFIRMED": "Confirmed",
+    "HELD": "Held",
+    "EXPIRED": "Expired",
+    "PENDING": "Pending",
+    "REJECTED": "Rejected"
+}
+CITY_ALIASES = {
+    "bombay": "mumbai",
+    "bangalore": "bengaluru",
+    "madras": "chennai",
+    "calcutta": "kolkata",
+    "gurgaon": "gurugram",
+    "mysore": "mysuru",
+    "poona": "pune",
+    "new-delhi": "delhi",
 }
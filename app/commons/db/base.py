@@ -0,0 +1,54 @@
+"""
+postgresql backend with health checked persistent connections and an optional per process connection pool,
+enabled with 'ENGINE': 'app.commons.db' and 'POOL': True in DATABASES
+"""
+import time
+
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+from app.commons.db.pool import connection_pools
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.last_used = time.time()
+
+    @property
+    def pooled(self):
+        return self.settings_dict.get('POOL', False)
+
+    def get_pool(self):
+        params = self.get_connection_params()
+        return connection_pools.get('{}:{}@{}:{}/{}'.format(
+            self.alias, params.get('user', ''), params.get('host', ''), params.get('port', ''), params['database']))
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled:
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+        connection = self.get_pool().checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if not self.pooled or self.connection is None:
+            return super(DatabaseWrapper, self)._close()
+        if self.in_atomic_block:
+            # the wrapper keeps the connection object after a close inside atomic, so it cannot be shared
+            return self.get_pool().discard(self.connection)
+        self.get_pool().checkin(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        """
+        also checks a persistent connection with SELECT 1 when it sat idle for DB_HEALTH_CHECK_IDLE seconds,
+        the server or a pgbouncer in front of it may have dropped it meanwhile. Django calls this when a
+        request starts and ends and celery around every task.
+        """
+        super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+        if self.connection is not None and time.time() - self.last_used >= settings.DB_HEALTH_CHECK_IDLE:
+            if not self.is_usable():
+                self.close()
+        self.last_used = time.time()
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2 import extensions
+
+from django.conf import settings
+
+from app.commons import green
+
+
+class ConnectionPool(object):
+    """
+    process local pool of open psycopg2 connections to one database. At most size connections are checked
+    out at a time, callers beyond that wait in turn up to DB_POOL_TIMEOUT seconds for one to be returned, or
+    DB_POOL_GREEN_TIMEOUT seconds in a gevent process where a waiting greenlet holds no thread. Idle connections
+    are checked with SELECT 1 before reuse once they sat for DB_HEALTH_CHECK_IDLE seconds.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.idle = []
+        self.in_use = 0
+        self.waiting = 0
+        self.pid = os.getpid()
+        self.stats = Counter()
+        self.condition = threading.Condition()
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict((stat, self.stats[stat]) for stat in ('opened', 'reused', 'discarded', 'waited'))
+            stats.update(size=self.size, in_use=self.in_use, idle=len(self.idle))
+        return stats
+
+    @staticmethod
+    def is_usable(connection):
+        try:
+            connection.cursor().execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def checkout(self, connect):
+        """
+        returns an idle connection or one made by connect(), blocking while the pool is exhausted
+        """
+        timeout = settings.DB_POOL_GREEN_TIMEOUT if green.is_active() else settings.DB_POOL_TIMEOUT
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            # a caller arriving while others wait queues behind them instead of taking the connection they were
+            # woken for, with many greenlets the first ones would otherwise wait until they time out
+            if self.waiting or (not self.idle and self.in_use >= self.size):
+                self.stats['waited'] += 1
+                self.waiting += 1
+                try:
+                    self.wait(deadline)
+                finally:
+                    self.waiting -= 1
+            self.in_use += 1
+            connection, last_used = self.idle.pop() if self.idle else (None, None)
+        try:
+            while connection is not None:
+                usable = time.time() - last_used < settings.DB_HEALTH_CHECK_IDLE or self.is_usable(connection)
+                with self.condition:
+                    self.stats['reused' if usable else 'discarded'] += 1
+                    if usable:
+                        return connection
+                    connection.close()
+                    connection, last_used = self.idle.pop() if self.idle else (None, None)
+            connection = connect()
+            with self.condition:
+                self.stats['opened'] += 1
+            return connection
+        except Exception:
+            self.release()
+            raise
+
+    def wait(self, deadline):
+        """
+        waits for a connection to be returned until the deadline, if any, the condition has to be held by the caller
+        """
+        while True:
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                if self.idle or self.in_use < self.size:
+                    # hand the connection this caller may have been woken for to the next one
+                    self.condition.notify()
+                raise psycopg2.OperationalError(
+                    'connection pool exhausted, all {} connections are in use'.format(self.size))
+            self.condition.wait(remaining)
+            if self.idle or self.in_use < self.size:
+                return
+
+    def checkin(self, connection):
+        """
+        takes a connection back, rolling back whatever transaction it was left in
+        """
+        status = connection.get_transaction_status() if not connection.closed else None
+        if status not in (extensions.TRANSACTION_STATUS_IDLE, extensions.TRANSACTION_STATUS_INTRANS,
+                          extensions.TRANSACTION_STATUS_INERROR):
+            return self.discard(connection)
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                return self.discard(connection)
+        with self.condition:
+            self.idle.append((connection, time.time()))
+            self.in_use -= 1
+            self.condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self.condition:
+            self.stats['discarded'] += 1
+        self.release()
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, last_used in idle:
+            connection.close()
+
+
+class ConnectionPools(object):
+    """
+    the pools of this process by database, web processes get DB_POOL_SIZE connections per database and
+    celery worker processes DB_WORKER_POOL_SIZE
+    """
+    def __init__(self):
+        self.pools = {}
+        self.role = 'web'
+        self.lock = threading.Lock()
+
+    def get_size(self):
+        return settings.DB_WORKER_POOL_SIZE if self.role == 'worker' else settings.DB_POOL_SIZE
+
+    def get(self, key):
+        with self.lock:
+            pool = self.pools.get(key)
+            # a forked process must not hand out the connections of its parent
+            if pool is None or pool.pid != os.getpid():
+                pool = self.pools[key] = ConnectionPool(self.get_size())
+            return pool
+
+    def get_stats(self):
+        with self.lock:
+            return dict((key, pool.get_stats()) for key, pool in self.pools.items() if pool.pid == os.getpid())
+
+    def set_role(self, role):
+        """
+        switches the process to the pool size of its role, the pools made so far are dropped without
+        closing their connections since they may belong to the parent process
+        """
+        with self.lock:
+            self.role = role
+            self.pools = {}
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.values():
+            if pool.pid == os.getpid():
+                pool.close()
+
+
+connection_pools = ConnectionPools()
@@ -0,0 +1,73 @@
+import math
+import re
+import unicodedata
+
+from django.utils import six
+
+from app.commons.constants import CITY_ALIASES, MAX_LENGTH_DICT
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+# shorter side of a geohash cell in km by precision
+GEOHASH_CELL_KM = {1: 5000.0, 2: 625.0, 3: 156.0, 4: 19.5, 5: 4.89, 6: 0.61}
+
+
+def normalize_city(city):
+    """
+    lowercase ascii key of a city name with accents, punctuation and repeated spaces dropped and
+    well known alternative names mapped, e.g. ' Navi  Mumbai.' -> 'navi-mumbai', 'Bombay' -> 'mumbai'
+    """
+    city = unicodedata.normalize('NFKD', six.text_type(city or '')).encode('ascii', 'ignore').decode('ascii')
+    key = '-'.join(re.findall('[a-z0-9]+', city.lower()))
+    return CITY_ALIASES.get(key, key)[:MAX_LENGTH_DICT["NAME"]]
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    latitude = max(-90.0, min(90.0, latitude))
+    longitude = max(-180.0, min(180.0, longitude))
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    geohash = []
+    bits = 0
+    even = True
+    value = 0
+    while len(geohash) < precision:
+        interval, point = (bounds[1], longitude) if even else (bounds[0], latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if point >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(geohash)
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    """
+    great circle distance by the haversine formula
+    """
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude))
+    a = math.sin((other_latitude - latitude) / 2) ** 2 + math.cos(latitude) * math.cos(other_latitude) * math.sin(
+        (other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def covering_geohashes(latitude, longitude, radius_km):
+    """
+    returns the cell of the point and its neighbours at the finest precision whose cells are still larger
+    than the radius, together they cover every point within the radius
+    """
+    precision = max([1] + [precision for precision, size in GEOHASH_CELL_KM.items() if size >= radius_km])
+    size_km = GEOHASH_CELL_KM[precision]
+    latitude_step = size_km / 111.0
+    longitude_step = size_km / max(111.0 * math.cos(math.radians(latitude)), 0.01)
+    return sorted(set(
+        encode_geohash(latitude + latitude_step * row, longitude + longitude_step * column, precision)
+        for row in (-1, 0, 1) for column in (-1, 0, 1)
+    ))
@@ -0,0 +1,66 @@
+"""
+cooperative deployment with gevent, an optional dependency. Python 2 and Django 1.11 have no async views,
+instead gevent_wsgi runs every request in a greenlet and psycopg2 waits for the database through gevent, so a
+request waiting on a slow query gives its worker to the other requests instead of holding a thread.
+"""
+import select
+
+from psycopg2 import OperationalError, extensions
+
+
+def make_wait_callback(wait_read, wait_write):
+    """
+    returns a psycopg2 wait callback that polls the connection and waits for its socket with the given functions
+    """
+    def wait_callback(connection, timeout=None):
+        while True:
+            state = connection.poll()
+            if state == extensions.POLL_OK:
+                return
+            elif state == extensions.POLL_READ:
+                wait_read(connection.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(connection.fileno(), timeout=timeout)
+            else:
+                raise OperationalError('bad state from poll: {}'.format(state))
+    return wait_callback
+
+
+def select_wait_read(fileno, timeout=None):
+    select.select([fileno], [], [], timeout)
+
+
+def select_wait_write(fileno, timeout=None):
+    select.select([], [fileno], [], timeout)
+
+
+def patch_psycopg():
+    """
+    makes psycopg2 wait through the gevent hub, connections opened afterwards no longer block other greenlets.
+    COPY is not available to connections with a wait callback.
+    """
+    from gevent.socket import wait_read, wait_write
+    extensions.set_wait_callback(make_wait_callback(wait_read, wait_write))
+
+
+def is_active():
+    """
+    whether this process was monkey patched by gevent
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def offload(function, args=(), callback=None):
+    """
+    starts a blocking call in a real thread of gevent's pool while the other greenlets keep running, like
+    Pool.apply_async the result has wait(), ready() and get() and callback is called with the return value
+    """
+    from gevent import get_hub
+    result = get_hub().threadpool.spawn(function, *args)
+    if callback is not None:
+        result.rawlink(lambda result: callback(result.value))
+    return result
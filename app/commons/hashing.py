@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.password_validation import get_default_password_validators
+
+from rest_framework.exceptions import Throttled
+
+from app.commons import green
+
+
+class ConfigurablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher whose work factor comes from PASSWORD_HASH_ITERATIONS. It keeps the pbkdf2_sha256 name so
+    existing hashes still verify, and hashes made with another iteration count are upgraded on login.
+    """
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+def _call(function, *args):
+    """
+    runs function in the pool and returns whether it succeeded with its result or error, the pool of Python 2
+    only calls back on success
+    """
+    try:
+        return True, function(*args)
+    except Exception as error:
+        return False, error
+
+
+class PasswordHashingPool(object):
+    """
+    runs password hashing in a pool of PASSWORD_HASHING_PROCESSES processes so that bursts of signups and logins
+    use a bounded amount of CPU instead of every request thread. At most PASSWORD_HASHING_QUEUE hashes of this
+    process wait for the pool, requests beyond that or waiting longer than PASSWORD_HASHING_TIMEOUT seconds are
+    throttled. A hash keeps its place until the pool is done with it, also when its request timed out.
+    With PASSWORD_HASHING_PROCESSES = 0 the hashes are computed inline. Under gevent the hashes run in
+    its pool of real threads instead, multiprocessing would block every greenlet of the process.
+    """
+    def __init__(self):
+        self.pool = None
+        self.pid = None
+        self.slots = None
+        self.slots_pid = None
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        with self.lock:
+            # a forked web worker must not share the pool of its parent
+            if self.pool is None or self.pid != os.getpid():
+                self.pool = multiprocessing.Pool(settings.PASSWORD_HASHING_PROCESSES)
+                self.pid = os.getpid()
+            return self.pool
+
+    def get_slots(self):
+        with self.lock:
+            if self.slots is None or self.slots_pid != os.getpid():
+                self.slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_QUEUE)
+                self.slots_pid = os.getpid()
+            return self.slots
+
+    def run(self, function, *args):
+        if not settings.PASSWORD_HASHING_PROCESSES:
+            return function(*args)
+        # both ways of running the hash hold a place in the same queue until the hash is done
+        start = green.offload if green.is_active() else self.get_pool().apply_async
+        slots = self.get_slots()
+        if not slots.acquire(False):
+            raise Throttled()
+        try:
+            result = start(_call, (function, ) + args, callback=lambda outcome: slots.release())
+        except Exception:
+            slots.release()
+            raise
+        result.wait(settings.PASSWORD_HASHING_TIMEOUT)
+        if not result.ready():
+            raise Throttled()
+        succeeded, value = result.get()
+        if not succeeded:
+            raise value
+        return value
+
+    def make_password(self, password):
+        return self.run(_make_password, password)
+
+    def check_password(self, password, encoded):
+        if not encoded or not hashers.is_password_usable(encoded):
+            return False
+        return self.run(_check_password, password, encoded)
+
+    def must_update(self, encoded):
+        preferred = hashers.get_hasher()
+        return hashers.identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None and self.pid == os.getpid():
+                self.pool.terminate()
+            self.pool = None
+            self.slots = None
+
+
+password_pool = PasswordHashingPool()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    authenticates with the password checked in the hashing pool and transparently rehashes passwords made with
+    an outdated hasher or work factor
+    """
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway so unknown emails take as long as wrong passwords
+            password_pool.make_password(password)
+            return None
+        if not password_pool.check_password(password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if password_pool.must_update(user.password):
+            user.password = password_pool.make_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+
+def warm_password_validators():
+    """
+    builds the password validators once, the CommonPasswordValidator reads its compressed list on creation
+    """
+    return get_default_password_validators()
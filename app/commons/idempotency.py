@@ -0,0 +1,50 @@
+import hashlib
+import json
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from app.commons.constants import ERROR_MESSAGES, MAX_LENGTH_DICT
+from app.users.models import IdempotencyKey
+
+
+class IdempotencyUtil(object):
+    """
+    remembers the responses of create requests sent with an Idempotency-Key header for IDEMPOTENCY_KEY_TTL seconds
+    """
+    header = 'HTTP_IDEMPOTENCY_KEY'
+
+    def get_key(self, request):
+        key = request.META.get(self.header)
+        if key is not None and not 0 < len(key) <= MAX_LENGTH_DICT["NAME"]:
+            raise ValidationError(ERROR_MESSAGES["INVALID_IDEMPOTENCY_KEY"])
+        return key
+
+    def fingerprint(self, request):
+        """
+        the same key sent to another endpoint with the same body is a different request
+        """
+        return hashlib.md5(json.dumps(
+            [request.method, request.path, request.data], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def find(self, user, key):
+        return IdempotencyKey.objects.live().filter(user=user, key=key).first()
+
+    def claim(self, user, key, fingerprint):
+        """
+        inserts the key inside the caller's transaction. A concurrent request with the same key waits on
+        the unique index until this transaction ends and then fails with an IntegrityError
+        """
+        IdempotencyKey.objects.expired().filter(user=user, key=key).delete()
+        return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint)
+
+    def record(self, entry, response):
+        entry.status_code = response.status_code
+        entry.response = JSONRenderer().render(response.data).decode('utf-8')
+        entry.save(update_fields=['status_code', 'response'])
+
+    def replay(self, entry, fingerprint):
+        if entry.fingerprint != fingerprint:
+            raise ValidationError(ERROR_MESSAGES["IDEMPOTENCY_KEY_REUSED"])
+        return Response(json.loads(entry.response), status=entry.status_code, headers={'Idempotent-Replayed': 'true'})
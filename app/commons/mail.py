@@ -0,0 +1,185 @@
+import smtplib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+
+class MailTemplates(object):
+    """
+    keeps the compiled mail templates of the process so a mail only pays for rendering its context
+    """
+    def __init__(self):
+        self.templates = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        template = self.templates.get(name)
+        if template is None:
+            with self.lock:
+                template = self.templates.setdefault(name, get_template(name))
+        return template
+
+    def warm(self, *names):
+        for name in names:
+            self.get(name)
+
+    def render(self, name, context):
+        return self.get(name).render(context)
+
+    def message(self, subject, template, context, to):
+        """
+        builds a mail with the text and html versions of the template, e.g. ticketConfirmation.txt/.html
+        """
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=self.render(template + '.txt', context),
+            from_email=settings.EMAIL_HOST_USER,
+            to=to,
+        )
+        message.attach_alternative(self.render(template + '.html', context), 'text/html')
+        return message
+
+
+class MailConnectionPool(object):
+    """
+    keeps up to EMAIL_POOL_SIZE open connections of the EMAIL_BACKEND per process, dropping the ones
+    idle for longer than EMAIL_POOL_MAX_IDLE seconds since the server may have closed them already
+    """
+    def __init__(self, size=None, max_idle=None):
+        self.size = size or settings.EMAIL_POOL_SIZE
+        self.max_idle = settings.EMAIL_POOL_MAX_IDLE if max_idle is None else max_idle
+        self.idle = []
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, stat, value=1):
+        with self.lock:
+            self.stats[stat] += value
+
+    def get_stats(self):
+        with self.lock:
+            return dict((stat, self.stats[stat]) for stat in ('opened', 'reused', 'mails'))
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                connection, last_used = self.idle.pop() if self.idle else (None, None)
+            if connection is None:
+                connection = get_connection(fail_silently=False)
+                connection.open()
+                self.count('opened')
+                return connection
+            if time.time() - last_used <= self.max_idle:
+                self.count('reused')
+                return connection
+            connection.close()
+
+    def _checkin(self, connection):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((connection, time.time()))
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        connection = self._checkout()
+        try:
+            yield connection
+        except Exception:
+            connection.close()
+            raise
+        self._checkin(connection)
+
+    def send_messages(self, messages):
+        """
+        sends the messages one at a time over a pooled connection and returns the error of every message, None
+        for the ones sent. If the server hung up, the messages not sent yet are retried once on a fresh
+        connection, the ones that went out are never sent again.
+        """
+        errors = [None] * len(messages)
+        pending = list(range(len(messages)))
+        for attempt in range(2):
+            try:
+                with self.connection() as connection:
+                    while pending:
+                        try:
+                            connection.send_messages([messages[pending[0]]])
+                        except smtplib.SMTPServerDisconnected:
+                            raise
+                        except Exception as error:
+                            # refused by the server, the connection stays usable for the others
+                            errors[pending[0]] = error
+                        else:
+                            self.count('mails')
+                        pending.pop(0)
+                return errors
+            except Exception as error:
+                if attempt or not isinstance(error, smtplib.SMTPServerDisconnected):
+                    for index in pending:
+                        errors[index] = error
+                    return errors
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, last_used in idle:
+            connection.close()
+
+
+class MailBatcher(object):
+    """
+    sends the mails handed in by concurrent callers in batches of up to EMAIL_BATCH_SIZE. The first caller
+    sends right away and the mails handed in meanwhile go out together after it. Once batches have had
+    company the first caller also waits EMAIL_BATCH_WINDOW seconds for it, a lone caller such as a prefork
+    celery process never waits. Every caller blocks until its own mail went out so a failure still fails the
+    calling task.
+    """
+    def __init__(self, pool, window=None, size=None):
+        self.pool = pool
+        self.window = settings.EMAIL_BATCH_WINDOW if window is None else window
+        self.size = size or settings.EMAIL_BATCH_SIZE
+        self.pending = []
+        self.sending = False
+        # whether the last flush sent a batch of more than one mail
+        self.concurrent = False
+        self.condition = threading.Condition()
+
+    def send(self, message):
+        entry = {'message': message, 'sent': threading.Event(), 'error': None}
+        with self.condition:
+            self.pending.append(entry)
+            leader = not self.sending
+            self.sending = True
+            if len(self.pending) >= self.size:
+                self.condition.notify()
+        if leader:
+            self.flush()
+        entry['sent'].wait()
+        if entry['error'] is not None:
+            raise entry['error']
+
+    def flush(self):
+        with self.condition:
+            if self.concurrent:
+                deadline = time.time() + self.window
+                while len(self.pending) < self.size and time.time() < deadline:
+                    self.condition.wait(deadline - time.time())
+        concurrent = False
+        while True:
+            with self.condition:
+                batch, self.pending = self.pending[:self.size], self.pending[self.size:]
+                if not batch:
+                    self.concurrent = concurrent
+                    self.sending = False
+                    return
+            concurrent = concurrent or len(batch) > 1
+            errors = self.pool.send_messages([entry['message'] for entry in batch])
+            for entry, error in zip(batch, errors):
+                entry['error'] = error
+                entry['sent'].set()
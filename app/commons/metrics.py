@@ -0,0 +1,221 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework.serializers import BaseSerializer
+
+slow_query_logger = logging.getLogger('app.metrics.slow_queries')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram(object):
+    """
+    cumulative histogram in the shape prometheus expects, buckets are upper bounds
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf', ), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    in-process per view histograms of latency, database time, serializer time and query counts
+    """
+    histograms = (
+        ('api_request_duration_seconds', 'total time spent on the request', LATENCY_BUCKETS),
+        ('api_db_duration_seconds', 'time spent executing sql', LATENCY_BUCKETS),
+        ('api_serializer_duration_seconds', 'time spent in serializer.data outside of sql', LATENCY_BUCKETS),
+        ('api_db_queries', 'sql queries issued by the request', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = defaultdict(lambda: dict(
+                (name, Histogram(buckets)) for name, _, buckets in self.histograms))
+            self.responses = defaultdict(int)
+
+    def observe(self, view, status_code, values):
+        with self.lock:
+            histograms = self.views[view]
+            for name, value in values.items():
+                histograms[name].observe(value)
+            self.responses[(view, status_code)] += 1
+
+    def render(self):
+        """
+        returns the metrics in the prometheus text exposition format
+        """
+        with self.lock:
+            lines = []
+            for name, description, _ in self.histograms:
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for view in sorted(self.views):
+                    lines.extend(self.views[view][name].render(name, 'view="{}"'.format(view)))
+            lines.append('# HELP api_responses_total responses by view and status code')
+            lines.append('# TYPE api_responses_total counter')
+            for (view, status_code), count in sorted(self.responses.items()):
+                lines.append('api_responses_total{{view="{}",code="{}"}} {}'.format(view, status_code, count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics(object):
+    """
+    collects the sql and serializer timings of the request handled by the current thread
+    """
+    local = threading.local()
+
+    def __init__(self, view=''):
+        self.view = view
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    @classmethod
+    def current(cls):
+        return getattr(cls.local, 'metrics', None)
+
+    def record_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        threshold = settings.METRICS_SLOW_QUERY_SECONDS
+        if threshold is not None and seconds >= threshold and random.random() < settings.METRICS_SLOW_QUERY_SAMPLE_RATE:
+            slow_query_logger.warning('slow query %.3fs in %s: %s', seconds, self.view or 'unknown view', sql)
+
+
+class InstrumentedCursor(object):
+    """
+    cursor wrapper reporting the duration of every statement to the request being handled
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def timed(self, method, sql, *args):
+        start = time.time()
+        try:
+            return method(sql, *args)
+        finally:
+            metrics = RequestMetrics.current()
+            if metrics is not None:
+                metrics.record_query(sql, time.time() - start)
+
+    def execute(self, sql, params=None):
+        return self.timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(self.cursor.executemany, sql, param_list)
+
+
+def instrument_connection(connection):
+    if getattr(connection, 'instrumented', False):
+        return
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: InstrumentedCursor(make_cursor(cursor))
+    connection.make_debug_cursor = lambda cursor: InstrumentedCursor(make_debug_cursor(cursor))
+    connection.instrumented = True
+
+
+def instrument_serializers():
+    """
+    times serializer.data, the outermost call of a request only, minus the sql it triggered
+    """
+    if getattr(BaseSerializer, 'instrumented', False):
+        return
+    data = BaseSerializer.data.fget
+
+    def timed_data(serializer):
+        metrics = RequestMetrics.current()
+        if metrics is None or metrics.serializer_depth:
+            return data(serializer)
+        metrics.serializer_depth += 1
+        start, db_seconds = time.time(), metrics.db_seconds
+        try:
+            return data(serializer)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_seconds += (time.time() - start) - (metrics.db_seconds - db_seconds)
+
+    BaseSerializer.data = property(timed_data)
+    BaseSerializer.instrumented = True
+
+
+class InstrumentationMiddleware(object):
+    """
+    records query count, database time, serializer time and latency of every request under
+    METRICS_PATH_PREFIX per resolved view into the process registry
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        if not request.path.startswith(settings.METRICS_PATH_PREFIX):
+            return self.get_response(request)
+        for connection in connections.all():
+            instrument_connection(connection)
+        metrics = RequestMetrics(request.path)
+        RequestMetrics.local.metrics = metrics
+        start = time.time()
+        try:
+            response = self.get_response(request)
+        finally:
+            RequestMetrics.local.metrics = None
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match else 'unresolved'
+        registry.observe(view, response.status_code, {
+            'api_request_duration_seconds': time.time() - start,
+            'api_db_duration_seconds': metrics.db_seconds,
+            'api_serializer_duration_seconds': metrics.serializer_seconds,
+            'api_db_queries': metrics.queries,
+        })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = RequestMetrics.current()
+        if metrics is not None and request.resolver_match:
+            metrics.view = request.resolver_match.view_name
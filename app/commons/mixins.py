@@ -0,0 +1,85 @@
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.renderers import JSONRenderer
+
+from app.commons.idempotency import IdempotencyUtil
+from app.commons.transactions import atomic
+
+
+class StreamingExportMixin(object):
+    """
+    lets admins read a whole listing as one streamed JSON array with ?export=true. Rows are read through
+    a server side cursor with iterator() and serialized one chunk at a time, so memory stays flat
+    """
+    export_chunk_size = 2000
+
+    def is_export(self, request):
+        return request.query_params.get('export') == 'true'
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    def get_export_serializer_class(self):
+        return self.get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if self.is_export(request):
+            return self.export(request)
+        return super(StreamingExportMixin, self).list(request, *args, **kwargs)
+
+    def export(self, request):
+        if not request.user.is_admin:
+            raise PermissionDenied()
+        return StreamingHttpResponse(
+            self.stream(self.filter_queryset(self.get_export_queryset())), content_type='application/json')
+
+    def stream(self, queryset):
+        yield b'['
+        chunk = []
+        separator = b''
+        for obj in queryset.iterator():
+            chunk.append(obj)
+            if len(chunk) == self.export_chunk_size:
+                yield separator + self.render_chunk(chunk)
+                separator = b','
+                chunk = []
+        if chunk:
+            yield separator + self.render_chunk(chunk)
+        yield b']'
+
+    def render_chunk(self, chunk):
+        """
+        renders the objects as the comma separated items of a JSON array
+        """
+        data = self.get_export_serializer_class()(chunk, many=True, context=self.get_serializer_context()).data
+        return JSONRenderer().render(data)[1:-1]
+
+
+class IdempotentCreateMixin(object):
+    """
+    makes create safe to retry: a request carrying an Idempotency-Key header that was already answered
+    gets the stored response back without touching the resource again. Only successful responses are
+    stored, a failed request leaves the key free for the next attempt
+    """
+    def create(self, request, *args, **kwargs):
+        util = IdempotencyUtil()
+        key = util.get_key(request)
+        if key is None:
+            return super(IdempotentCreateMixin, self).create(request, *args, **kwargs)
+        fingerprint = util.fingerprint(request)
+        entry = util.find(request.user, key)
+        if entry is not None:
+            return util.replay(entry, fingerprint)
+        try:
+            with atomic():
+                entry = util.claim(request.user, key, fingerprint)
+                response = super(IdempotentCreateMixin, self).create(request, *args, **kwargs)
+                util.record(entry, response)
+        except IntegrityError:
+            entry = util.find(request.user, key)
+            if entry is None:
+                raise
+            return util.replay(entry, fingerprint)
+        return response
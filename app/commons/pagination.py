@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    keyset pagination over the primary key, newest first
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+
+class NameCursorPagination(IdCursorPagination):
+    """
+    keyset pagination for listings ordered by name
+    """
+    ordering = ('name', 'id')
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    numbered pages for ranked search results, a rank is no stable key to keep a cursor on
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBroker(object):
+    """
+    publish/subscribe between the threads of this process, callbacks are called with the channel and
+    the message in the publishing thread
+    """
+    def __init__(self, **options):
+        self.callbacks = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        with self.lock:
+            self.callbacks[channel].append(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self.lock:
+            if callback in self.callbacks.get(channel, ()):
+                self.callbacks[channel].remove(callback)
+            if not self.callbacks.get(channel):
+                self.callbacks.pop(channel, None)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            callbacks = list(self.callbacks.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(channel, message)
+            except Exception:
+                logger.exception('subscriber of %s failed', channel)
+
+
+class RedisBroker(LocalBroker):
+    """
+    publish/subscribe between processes through redis. Messages are sent as json and a listener thread
+    per process delivers them to the callbacks of this process, messages published while the listener is
+    reconnecting are lost.
+    """
+    def __init__(self, url='redis://127.0.0.1:6379/0', prefix='pubsub:', **options):
+        super(RedisBroker, self).__init__(**options)
+        # optional dependency, only needed with this broker
+        import redis
+        self.redis = redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.prefix = prefix
+        self.listener = None
+
+    def subscribe(self, channel, callback):
+        super(RedisBroker, self).subscribe(channel, callback)
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='pubsub-listener')
+                self.listener.daemon = True
+                self.listener.start()
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for item in pubsub.listen():
+                    self.deliver(item['channel'][len(self.prefix):], json.loads(item['data']))
+            except self.redis.RedisError:
+                logger.exception('lost the pubsub connection to redis')
+                time.sleep(1)
+
+
+class Brokers(object):
+    """
+    the PUBSUB_BROKER of this process, a forked process or a changed setting makes a new one
+    """
+    def __init__(self):
+        self.broker = None
+        self.pid = None
+        self.config = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            config = settings.PUBSUB_BROKER
+            if self.broker is None or self.pid != os.getpid() or self.config != config:
+                self.broker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+                self.pid = os.getpid()
+                self.config = config
+            return self.broker
+
+    def reset(self):
+        with self.lock:
+            self.broker = None
+
+
+brokers = Brokers()
@@ -0,0 +1,70 @@
+import asyncore
+import smtpd
+import threading
+
+
+class SMTPStub(smtpd.SMTPServer):
+    """
+    local SMTP server for tests and benchmarks that keeps the received mails and counts the connections
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        self.map = {}
+        self.messages = []
+        self.connections = 0
+        # mails to these recipients are refused
+        self.refused = set()
+        smtpd.SMTPServer.__init__(self, (host, port), None)
+        self.host, self.port = self.socket.getsockname()
+        self.thread = None
+        self.running = False
+
+    def create_socket(self, family, type):
+        # keep the stub off the global asyncore map so it can run next to other dispatchers
+        self._map = self.map
+        asyncore.dispatcher.create_socket(self, family, type)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            self.connections += 1
+            conn, addr = pair
+            channel = smtpd.SMTPChannel(self, conn, addr)
+            channel.del_channel()
+            channel._map = self.map
+            channel.set_socket(conn)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        if self.refused.intersection(rcpttos):
+            return '554 refused'
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def serve(self):
+        while self.running:
+            asyncore.loop(timeout=0.01, map=self.map, count=1)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        for channel in list(self.map.values()):
+            channel.close()
+
+    def settings(self):
+        """
+        the email settings pointing the smtp backend at the stub
+        """
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.port,
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'EMAIL_HOST_USER': 'noreply@example.com',
+            'EMAIL_HOST_PASSWORD': '',
+        }
@@ -0,0 +1,68 @@
+import logging
+import threading
+from functools import wraps
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _get_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def on_rollback(callback):
+    """
+    registers a callback undoing a change made outside the database, e.g. in a cache, that runs when the
+    enclosing atomic() rolls back. Outside of atomic() the callback is dropped.
+    """
+    stack = _get_stack()
+    if stack:
+        stack[-1].append(callback)
+
+
+class atomic(object):
+    """
+    transaction.atomic, usable as decorator or context manager, that also runs the on_rollback callbacks
+    registered inside it when it rolls back. A nested block that succeeds hands its callbacks to the
+    enclosing one, so they still run if the outer block rolls back later.
+    """
+    def __init__(self, using=None):
+        self.using = using
+        self.atomics = []
+
+    def __call__(self, function):
+        @wraps(function)
+        def inner(*args, **kwargs):
+            with atomic(self.using):
+                return function(*args, **kwargs)
+        return inner
+
+    def __enter__(self):
+        atomic_block = transaction.atomic(self.using)
+        atomic_block.__enter__()
+        self.atomics.append(atomic_block)
+        _get_stack().append([])
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        callbacks = _get_stack().pop()
+        try:
+            self.atomics.pop().__exit__(exc_type, exc_value, traceback)
+        except Exception:
+            self.run(callbacks)
+            raise
+        if exc_type is not None:
+            self.run(callbacks)
+        elif _get_stack():
+            _get_stack()[-1].extend(callbacks)
+
+    def run(self, callbacks):
+        for callback in reversed(callbacks):
+            try:
+                callback()
+            except Exception:
+                logger.exception('rollback callback failed')
@@ -2,7 +2,8 @@ from __future__ import unicode_literals
 
 from django.contrib import admin
 
-from app.movies.models import Movie, Theatre, Auditorium, Slot
+from app.movies.models import Movie, NowShowing, Showtime, Theatre, Auditorium, Slot
+from app.movies.utils import MovieCacheUtil
 
 
 class MovieAdmin(admin.ModelAdmin):
@@ -28,7 +29,30 @@ class SlotAdmin(admin.ModelAdmin):
     list_display = ('audi', 'movie', 'seats_available', 'date', 'slot', 'movie_type', 'movie_language', )
     list_filter = ('movie_type', 'movie_language', )
 
+    def get_actions(self, request):
+        # the bulk delete skips delete_model and would leave the now showing catalogue stale
+        actions = super(SlotAdmin, self).get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def save_model(self, request, obj, form, change):
+        """
+        copies the slot into the read models the way the scheduling API does, a changed slot is copied again
+        """
+        super(SlotAdmin, self).save_model(request, obj, form, change)
+        movie_ids = [obj.movie_id] + ([form.initial['movie']] if change else [])
+        Showtime.objects.filter(slot=obj).delete()
+        Showtime.objects.refresh([obj.movie_id])
+        NowShowing.objects.refresh(movie_ids)
+        MovieCacheUtil().invalidate(movie_ids)
+
+    def delete_model(self, request, obj):
+        super(SlotAdmin, self).delete_model(request, obj)
+        NowShowing.objects.refresh([obj.movie_id])
+        MovieCacheUtil().invalidate([obj.movie_id])
+
 admin.site.register(Movie, MovieAdmin)
 admin.site.register(Theatre, TheatreAdmin)
 admin.site.register(Auditorium, AuditoriumAdmin)
 admin.site.register(Slot, SlotAdmin)
+admin.site.register(NowShowing)
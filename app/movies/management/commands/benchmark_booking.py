@@ -0,0 +1,120 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import multiprocessing
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+from django.utils.six.moves.urllib.error import HTTPError
+from django.utils.six.moves.urllib.parse import urlencode
+from django.utils.six.moves.urllib.request import Request, urlopen
+
+from rest_framework.authtoken.models import Token
+
+from app.movies.models import Auditorium, Movie, Slot, Theatre
+from app.users.models import Booking, User
+from app.users.tasks import user_ticket_task
+
+
+def _book(args):
+    """
+    worker process that fires the booking requests of one user and returns the status codes
+    """
+    base_url, path, token, slot_id, seats, requests = args
+    connections.close_all()
+    statuses = []
+    data = {'slot': slot_id, 'seats_booked': seats}
+    if base_url:
+        for _ in range(requests):
+            request = Request(base_url.rstrip('/') + path, data=urlencode(data).encode('utf-8'))
+            request.add_header('Authorization', 'Token {}'.format(token))
+            try:
+                statuses.append(urlopen(request).getcode())
+            except HTTPError as error:
+                statuses.append(error.code)
+        return statuses
+    # in-process mode goes through the full WSGI stack, mails are rendered but kept in memory
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    user_ticket_task.app.conf.task_always_eager = True
+    client = Client()
+    for _ in range(requests):
+        statuses.append(client.post(path, data, HTTP_AUTHORIZATION='Token {}'.format(token)).status_code)
+    connections.close_all()
+    return statuses
+
+
+class Command(BaseCommand):
+    """
+    hammers the booking API of a single slot from several processes and reports throughput and oversell
+    """
+    help = 'Multi-process contention benchmark for /api/movies/book/<id>/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=200, help='seats in the benchmarked slot')
+        parser.add_argument('--workers', type=int, default=8, help='number of concurrent booking processes')
+        parser.add_argument('--requests', type=int, default=50, help='booking requests per worker')
+        parser.add_argument('--seats-per-booking', type=int, default=1)
+        parser.add_argument('--url', default='', help='base url of a running server, in-process client if omitted')
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        theatre = Theatre.objects.create(name='bench-{}'.format(run_id), city='bench', state='bench')
+        audi = Auditorium.objects.create(name='A1', seats=options['seats'], theatre=theatre)
+        movie = Movie.objects.create(name='bench-{}'.format(run_id), duration='2.00', language=['E'], movie_type=['2D'])
+        slot = Slot.objects.create(
+            audi=audi, movie=movie, seats_available=options['seats'],
+            date=datetime.date.today() + datetime.timedelta(days=1), slot=audi.opening_time,
+            movie_type='2D', movie_language='E')
+        users = [
+            User.objects.create_user(
+                name='bench', email='bench-{}-{}@example.com'.format(run_id, worker), password=run_id)
+            for worker in range(options['workers'])
+        ]
+        tokens = [Token.objects.create(user=user).key for user in users]
+        path = reverse('movie:booking', kwargs={'movieId': movie.id})
+        jobs = [
+            (options['url'], path, token, slot.id, options['seats_per_booking'], options['requests'])
+            for token in tokens
+        ]
+        connections.close_all()
+        pool = multiprocessing.Pool(options['workers'])
+        try:
+            start = time.time()
+            statuses = sum(pool.map(_book, jobs), [])
+            elapsed = time.time() - start
+        finally:
+            pool.close()
+            pool.join()
+
+        slot.refresh_from_db()
+        booked = Booking.objects.filter(slot=slot).aggregate(total=Sum('seats_booked'))['total'] or 0
+        created = statuses.count(201)
+        results = {
+            'requests': len(statuses),
+            'bookings': created,
+            'rejected': statuses.count(400),
+            'errors': len(statuses) - created - statuses.count(400),
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(len(statuses) / elapsed, 2),
+            'bookings_per_second': round(created / elapsed, 2),
+            'seats_booked': booked,
+            'oversell': max(0, booked - options['seats']),
+            'lost_updates': options['seats'] - slot.seats_available - booked,
+        }
+        theatre.delete()
+        movie.delete()
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for key in sorted(results):
+            self.stdout.write('{:<22}{}'.format(key, results[key]))
@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+
+import json
+import multiprocessing
+import resource
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from app.movies.models import Auditorium, Movie, Theatre
+from app.movies.serializers import BookingsSerializer
+from app.users.models import Booking, User
+
+
+def _measure(args):
+    """
+    runs one listing mode in a fresh process and returns its duration and peak memory growth
+    """
+    mode, user_id, admin_token, user_token, options = args
+    connections.close_all()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    client = Client()
+    size = 0
+    if mode == 'unpaginated':
+        queryset = Booking.objects.filter(user_id=user_id).select_related('slot__audi', 'slot__movie')
+        size = len(JSONRenderer().render(BookingsSerializer(queryset, many=True).data))
+    elif mode == 'cursor':
+        url = '{}?page_size={}'.format(reverse('movie:bookings'), options['page_size'])
+        for _ in range(options['pages']):
+            response = client.get(url, HTTP_AUTHORIZATION='Token {}'.format(user_token))
+            size += len(response.content)
+            url = json.loads(response.content.decode('utf-8'))['next']
+            if not url:
+                break
+    else:
+        response = client.get(
+            reverse('movie:bookings'), {'export': 'true'}, HTTP_AUTHORIZATION='Token {}'.format(admin_token))
+        for chunk in response.streaming_content:
+            size += len(chunk)
+    elapsed = time.time() - start
+    connections.close_all()
+    return {
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'bytes': size,
+        'peak_rss_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024.0, 1),
+    }
+
+
+class Command(BaseCommand):
+    """
+    compares the memory and time of listing a heavy user's bookings unpaginated, page by page and as a streamed export
+    """
+    help = 'Benchmark of booking listing modes on a large bookings table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--pages', type=int, default=20, help='pages walked in cursor mode')
+        parser.add_argument('--modes', nargs='+', default=['unpaginated', 'cursor', 'stream'])
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        theatre = Theatre.objects.create(name='bench-{}'.format(run_id), city='bench', state='bench')
+        audi = Auditorium.objects.create(name='A1', seats=1000, theatre=theatre)
+        movie = Movie.objects.create(name='bench-{}'.format(run_id), duration='2.00', language=['E'], movie_type=['2D'])
+        user = User.objects.create_user(name='bench', email='bench-{}@example.com'.format(run_id), password=run_id)
+        admin = User.objects.create_user(name='bench', email='bench-admin-{}@example.com'.format(run_id), password=run_id)
+        User.objects.filter(id=admin.id).update(is_admin=True)
+        slots = options['bookings'] // 1000 + 1
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO movies_slot (audi_id, movie_id, seats_available, date, slot, movie_type, movie_language)
+                SELECT %s, %s, 0, current_date - day / 4, 9 + (day %% 4) * 3, '2D', 'E'
+                FROM generate_series(0, %s) day
+            """, [audi.id, movie.id, slots - 1])
+            cursor.execute("""
+                INSERT INTO users_booking (user_id, slot_id, seats_booked, booking_status, seat_numbers)
+                SELECT %s, slot.id, 1, 'Confirmed', '{}'
+                FROM movies_slot slot, generate_series(1, 1000) seat
+                WHERE slot.audi_id = %s
+                LIMIT %s
+            """, [user.id, audi.id, options['bookings']])
+        admin_token = Token.objects.create(user=admin).key
+        user_token = Token.objects.create(user=user).key
+        jobs = [(mode, user.id, admin_token, user_token, options) for mode in options['modes']]
+        connections.close_all()
+        results = []
+        try:
+            for job in jobs:
+                pool = multiprocessing.Pool(1)
+                results.append(pool.apply(_measure, (job, )))
+                pool.close()
+                pool.join()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM users_booking WHERE user_id = %s', [user.id])
+                cursor.execute('DELETE FROM movies_slot WHERE audi_id = %s', [audi.id])
+            theatre.delete()
+            movie.delete()
+            User.objects.filter(id__in=[user.id, admin.id]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(
+                '{mode:<12} {seconds:>9.3f}s {bytes:>12} bytes  peak rss +{peak_rss_growth_mb} MB'.format(**result))
@@ -0,0 +1,177 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import multiprocessing
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from app.movies.management.commands.benchmark_suite import _percentile
+from app.movies.models import Auditorium, Movie, Slot, Theatre
+from app.movies.tasks import process_booking_queue_task
+from app.users.models import Booking, BookingRequest, User
+from app.users.tasks import user_ticket_task
+
+
+def _setup_process():
+    connections.close_all()
+    # mails are rendered but kept in memory, queued jobs are published to an in-memory broker since the
+    # drain processes below play the celery workers
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    user_ticket_task.app.conf.task_always_eager = False
+    user_ticket_task.app.conf.broker_url = 'memory://'
+
+
+def _book(args):
+    """
+    client process that fires the booking requests of one user and returns (status, seconds, result seconds)
+    """
+    mode, movie_id, token, slot_id, seats, requests = args
+    _setup_process()
+    user_ticket_task.app.conf.task_always_eager = mode == 'sync'
+    client = Client()
+    auth = 'Token {}'.format(token)
+    data = {'slot': slot_id, 'seats_booked': seats}
+    url = reverse('movie:booking_queue' if mode == 'queued' else 'movie:booking', kwargs={'movieId': movie_id})
+    # warm up the url resolver, serializers and the connection before timing
+    client.get(reverse('movie:bookings'), HTTP_AUTHORIZATION=auth)
+    results = []
+    for _ in range(requests):
+        start = time.time()
+        response = client.post(url, data, HTTP_AUTHORIZATION=auth)
+        answered = time.time() - start
+        status_code = response.status_code
+        if mode == 'queued' and status_code == 201:
+            poll_url = json.loads(response.content.decode('utf-8'))['url']
+            while True:
+                poll = client.get(poll_url, HTTP_AUTHORIZATION=auth)
+                if poll.data['status'] != 'Pending':
+                    break
+                time.sleep(float(poll['Retry-After']))
+            poll = poll.data
+            status_code = 201 if poll['status'] == 'Confirmed' else 400
+        results.append((status_code, answered, time.time() - start))
+    connections.close_all()
+    return results
+
+
+def _drain(args):
+    """
+    worker process running the queue job of the slot until the clients are done and the queue is empty
+    """
+    slot_id, done = args
+    _setup_process()
+    user_ticket_task.app.conf.task_always_eager = True
+    while True:
+        finished = done.is_set()
+        if not process_booking_queue_task(slot_id):
+            if finished and not BookingRequest.objects.filter(slot_id=slot_id, status='Pending').exists():
+                break
+            time.sleep(0.005)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    compares the latency of the synchronous and the queued booking APIs on one slot under concurrent load
+    """
+    help = 'p50/p99 latency benchmark of sync and queued booking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=300, help='seats in the benchmarked slot')
+        parser.add_argument('--workers', type=int, default=16, help='number of concurrent client processes')
+        parser.add_argument('--drains', type=int, default=2, help='queue worker processes in queued mode')
+        parser.add_argument('--requests', type=int, default=25, help='booking requests per client')
+        parser.add_argument('--seats-per-booking', type=int, default=1)
+        parser.add_argument('--modes', nargs='+', default=['sync', 'queued'])
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def run(self, mode, options, run_id, tokens):
+        theatre = Theatre.objects.create(name='bench-{}-{}'.format(run_id, mode), city='bench', state='bench')
+        audi = Auditorium.objects.create(name='A1', seats=options['seats'], theatre=theatre)
+        movie = Movie.objects.create(
+            name='bench-{}-{}'.format(run_id, mode), duration='2.00', language=['E'], movie_type=['2D'])
+        slot = Slot.objects.create(
+            audi=audi, movie=movie, seats_available=options['seats'],
+            date=datetime.date.today() + datetime.timedelta(days=1), slot=audi.opening_time,
+            movie_type='2D', movie_language='E')
+        jobs = [
+            (mode, movie.id, token, slot.id, options['seats_per_booking'], options['requests'])
+            for token in tokens
+        ]
+        connections.close_all()
+        manager = multiprocessing.Manager()
+        done = manager.Event()
+        drains = multiprocessing.Pool(options['drains']) if mode == 'queued' else None
+        if drains:
+            drained = drains.map_async(_drain, [(slot.id, done)] * options['drains'])
+        pool = multiprocessing.Pool(options['workers'])
+        try:
+            start = time.time()
+            results = sum(pool.map(_book, jobs), [])
+            done.set()
+            if drains:
+                drained.get()
+            elapsed = time.time() - start
+        finally:
+            pool.close()
+            pool.join()
+            if drains:
+                drains.close()
+                drains.join()
+            manager.shutdown()
+
+        slot.refresh_from_db()
+        booked = Booking.objects.filter(slot=slot).aggregate(total=Sum('seats_booked'))['total'] or 0
+        statuses = [result[0] for result in results]
+        created = statuses.count(201)
+        summary = {
+            'mode': mode,
+            'requests': len(results),
+            'bookings': created,
+            'rejected': statuses.count(400),
+            'errors': len(results) - created - statuses.count(400),
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(len(results) / elapsed, 2),
+            'p50_ms': _percentile([result[1] for result in results], 50),
+            'p99_ms': _percentile([result[1] for result in results], 99),
+            'result_p50_ms': _percentile([result[2] for result in results], 50),
+            'result_p99_ms': _percentile([result[2] for result in results], 99),
+            'oversell': max(0, booked - options['seats']),
+            'lost_updates': options['seats'] - slot.seats_available - booked,
+        }
+        BookingRequest.objects.filter(slot=slot).delete()
+        theatre.delete()
+        movie.delete()
+        return summary
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(
+                name='bench', email='bench-{}-{}@example.com'.format(run_id, worker), password=run_id)
+            for worker in range(options['workers'])
+        ]
+        tokens = [Token.objects.create(user=user).key for user in users]
+        try:
+            results = [self.run(mode, options, run_id, tokens) for mode in options['modes']]
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(result['mode'])
+            for key in sorted(result):
+                if key != 'mode':
+                    self.stdout.write('  {:<22}{}'.format(key, result[key]))
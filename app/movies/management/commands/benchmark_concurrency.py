@@ -0,0 +1,238 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.six.moves import http_client, queue
+
+from rest_framework.authtoken.models import Token
+
+from app.movies.management.commands.benchmark_suite import _percentile
+from app.movies.management.commands.generate_benchmark_data import ADMIN_EMAIL, PREFIX
+from app.movies.models import Movie
+from app.users.models import Booking, User
+
+PROJECT_DIR = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, os.pardir))
+# the module of the entry point each mode serves
+MODES = {
+    'threaded': 'wsgi',
+    'gevent': 'gevent_wsgi',
+}
+# share of the requests per endpoint, the free slots admin page is rare and costs seconds on a chain sized dataset
+ENDPOINT_WEIGHTS = {
+    'list': 33,
+    'detail': 33,
+    'bookings': 33,
+    'free_slots': 1,
+}
+SERVER = (
+    'import sys; import {entry}; '
+    'from app.movies.management.commands.benchmark_concurrency import serve; '
+    'serve({entry}.application, *sys.argv[1:])'
+)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """
+    wsgiref server handing the accepted connections to a fixed number of worker threads, the way a gthread
+    worker does, a request waiting on the database holds its thread
+    """
+    request_queue_size = 1024
+
+    def start_workers(self, workers):
+        self.requests = queue.Queue()
+        for _ in range(workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def handle_error(self, request, client_address):
+        # clients giving up are counted by the load, the application reports its own errors
+        pass
+
+    def work(self):
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+def serve(application, mode, port, workers, pool_size):
+    """
+    serves the application until the process is killed, both modes share pool_size pooled database connections
+    """
+    connections.databases['default'].update(ENGINE='app.commons.db', CONN_MAX_AGE=0, POOL=True)
+    settings.DB_POOL_SIZE = int(pool_size)
+    if mode == 'gevent':
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer as GeventWSGIServer
+        GeventWSGIServer(('127.0.0.1', int(port)), application, spawn=Pool(int(workers)), log=None).serve_forever()
+    else:
+        server = make_server(
+            '127.0.0.1', int(port), application, server_class=ThreadPoolWSGIServer,
+            handler_class=QuietRequestHandler)
+        server.start_workers(int(workers))
+        server.serve_forever()
+
+
+class Command(BaseCommand):
+    """
+    compares the threaded WSGI entry point with the cooperative gevent one on the read endpoints, movie list and
+    detail, free slots and booking history, with every client connection making requests back to back. Needs
+    the generate_benchmark_data dataset, and gevent for the gevent mode.
+    """
+    help = 'Benchmark of the WSGI and gevent entry points under many concurrent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help='concurrent client connections')
+        parser.add_argument('--requests', type=int, default=5, help='requests per connection')
+        parser.add_argument('--threads', type=int, default=32, help='worker threads of the threaded server')
+        parser.add_argument('--pool-size', type=int, default=settings.DB_POOL_SIZE,
+                            help='pooled database connections of the server')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--timeout', type=float, default=60, help='seconds a request may take')
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['threaded', 'gevent'])
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        if 'gevent' in options['modes']:
+            try:
+                import gevent  # noqa
+            except ImportError:
+                raise CommandError('the gevent mode needs gevent installed, or pass --modes threaded')
+        admin = User.objects.filter(email=ADMIN_EMAIL).first()
+        if admin is None:
+            raise CommandError('run generate_benchmark_data first')
+        user = User.objects.get(id=Booking.objects.filter(
+            user__email__startswith=PREFIX + 'user-').order_by('id').values_list('user_id', flat=True)[0])
+        self.admin_auth = 'Token {}'.format(Token.objects.get_or_create(user=admin)[0].key)
+        self.user_auth = 'Token {}'.format(Token.objects.get_or_create(user=user)[0].key)
+        self.movie_ids = list(Movie.objects.filter(name__startswith=PREFIX).values_list('id', flat=True))
+        connections.close_all()
+
+        results = []
+        for mode in options['modes']:
+            workers = options['threads'] if mode == 'threaded' else options['connections']
+            server = subprocess.Popen(
+                [sys.executable, '-c', SERVER.format(entry=MODES[mode]), mode, str(options['port']), str(workers),
+                 str(options['pool_size'])],
+                cwd=PROJECT_DIR)
+            try:
+                self.wait_for_server(server, options['port'])
+                results.append(dict(self.load(options), mode=mode))
+            finally:
+                server.kill()
+                server.wait()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True, separators=(',', ': ')))
+            return
+        for result in results:
+            self.stdout.write(
+                '{mode:<9} {connections} connections {requests} requests in {seconds:>7.3f}s  '
+                '{requests_per_second:>8} /s  p50 {p50_ms:>8}ms  p99 {p99_ms:>8}ms  {errors} errors'.format(**result))
+
+    def wait_for_server(self, server, port):
+        for _ in range(300):
+            if server.poll() is not None:
+                raise CommandError('the server exited with {}'.format(server.returncode))
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except socket.error:
+                time.sleep(0.1)
+        raise CommandError('the server did not start')
+
+    def get_paths(self, rng, count):
+        """
+        a mix of the read endpoints by ENDPOINT_WEIGHTS
+        """
+        date = datetime.date.today() + datetime.timedelta(days=1)
+        paths = {
+            'list': (reverse('movie:movie-list'), self.user_auth),
+            'bookings': (reverse('movie:bookings'), self.user_auth),
+            'free_slots': ('{}?{}'.format(reverse('movie:free-slots'), urlencode(
+                {'start_date': date, 'end_date': date})), self.admin_auth),
+        }
+        endpoints = [endpoint for endpoint, weight in sorted(ENDPOINT_WEIGHTS.items()) for _ in range(weight)]
+        chosen = []
+        for endpoint in [rng.choice(endpoints) for _ in range(count)]:
+            if endpoint == 'detail':
+                chosen.append((
+                    reverse('movie:movie-detail', kwargs={'pk': rng.choice(self.movie_ids)}), self.user_auth))
+            else:
+                chosen.append(paths[endpoint])
+        return chosen
+
+    def load(self, options):
+        rng = random.Random(options['seed'])
+        latencies = []
+        statuses = []
+        start_event = threading.Event()
+
+        def connect(paths):
+            start_event.wait()
+            for path, auth in paths:
+                start = time.time()
+                try:
+                    client = http_client.HTTPConnection('127.0.0.1', options['port'], timeout=options['timeout'])
+                    client.request('GET', path, headers={'Authorization': auth, 'Connection': 'close'})
+                    response = client.getresponse()
+                    response.read()
+                    client.close()
+                    statuses.append(response.status)
+                except (socket.error, http_client.HTTPException):
+                    statuses.append(0)
+                latencies.append(time.time() - start)
+
+        # a thousand client threads fit in memory with small stacks
+        threading.stack_size(256 * 1024)
+        threads = [
+            threading.Thread(target=connect, args=(self.get_paths(rng, options['requests']), ))
+            for _ in range(options['connections'])
+        ]
+        for thread in threads:
+            thread.start()
+        start = time.time()
+        start_event.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        threading.stack_size(0)
+        return {
+            'connections': options['connections'],
+            'requests': len(statuses),
+            'errors': len(statuses) - statuses.count(200),
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(len(statuses) / elapsed, 2),
+            'p50_ms': _percentile(latencies, 50),
+            'p99_ms': _percentile(latencies, 99),
+        }
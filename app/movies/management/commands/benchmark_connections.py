@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from app.commons.db.pool import connection_pools
+from app.movies.management.commands.benchmark_suite import _percentile
+from app.movies.models import Auditorium, Movie, Slot, Theatre
+from app.users.models import Booking, User
+from app.users.tasks import user_ticket_task
+
+MODES = {
+    'reconnect': {'CONN_MAX_AGE': 0, 'POOL': False},
+    'persistent': {'CONN_MAX_AGE': 600, 'POOL': False},
+    'pooled': {'CONN_MAX_AGE': 0, 'POOL': True},
+}
+
+
+def _load(args):
+    """
+    runs the booking load of one connection mode in a fresh process, request threads play a threaded WSGI server
+    """
+    mode, movie_id, slot_id, tokens, requests = args
+    connections.close_all()
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    user_ticket_task.app.conf.task_always_eager = True
+    # the request threads create their connection wrappers from the patched settings
+    connections.databases['default'].update(ENGINE='app.commons.db', **MODES[mode])
+    created = []
+    connection_created.connect(lambda **kwargs: created.append(1), weak=False)
+    url = reverse('movie:booking', kwargs={'movieId': movie_id})
+    latencies = []
+    statuses = []
+
+    def book(token):
+        client = Client()
+        for _ in range(requests):
+            start = time.time()
+            # the test client skips the connection handling a WSGI server triggers at request start and end
+            close_old_connections()
+            statuses.append(client.post(
+                url, {'slot': slot_id, 'seats_booked': 1}, HTTP_AUTHORIZATION='Token {}'.format(token)).status_code)
+            close_old_connections()
+            latencies.append(time.time() - start)
+        connections.close_all()
+
+    start = time.time()
+    threads = [threading.Thread(target=book, args=(token, )) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    pool_stats = list(connection_pools.get_stats().values())
+    connection_pools.close()
+    return {
+        'mode': mode,
+        'requests': len(statuses),
+        'errors': len(statuses) - statuses.count(201),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(statuses) / elapsed, 2),
+        'p50_ms': _percentile(latencies, 50),
+        'p99_ms': _percentile(latencies, 99),
+        # a pooled checkout also reports connection_created, only the pool knows what was really opened
+        'connections_opened': pool_stats[0]['opened'] if pool_stats else len(created),
+    }
+
+
+class Command(BaseCommand):
+    """
+    compares a new connection per request with persistent and pooled connections under a sustained booking load
+    """
+    help = 'Benchmark of the database connection modes under booking load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='concurrent request threads')
+        parser.add_argument('--requests', type=int, default=100, help='booking requests per thread')
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['reconnect', 'persistent', 'pooled'])
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        seats = options['threads'] * options['requests'] * len(options['modes'])
+        theatre = Theatre.objects.create(name='bench-{}'.format(run_id), city='bench', state='bench')
+        audi = Auditorium.objects.create(name='A1', seats=seats, theatre=theatre)
+        movie = Movie.objects.create(name='bench-{}'.format(run_id), duration='2.00', language=['E'], movie_type=['2D'])
+        slot = Slot.objects.create(
+            audi=audi, movie=movie, seats_available=seats, date=datetime.date.today() + datetime.timedelta(days=1),
+            slot=audi.opening_time, movie_type='2D', movie_language='E')
+        users = [
+            User.objects.create_user(name='bench', email='bench-{}-{}@example.com'.format(run_id, index), password=run_id)
+            for index in range(options['threads'])
+        ]
+        tokens = [Token.objects.create(user=user).key for user in users]
+        connections.close_all()
+        results = []
+        try:
+            for mode in options['modes']:
+                pool = multiprocessing.Pool(1)
+                results.append(pool.apply(_load, ((mode, movie.id, slot.id, tokens, options['requests']), )))
+                pool.close()
+                pool.join()
+        finally:
+            Booking.objects.filter(slot=slot).delete()
+            theatre.delete()
+            movie.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True, separators=(',', ': ')))
+            return
+        for result in results:
+            self.stdout.write(
+                '{mode:<11} {requests} requests in {seconds:>7.3f}s  {requests_per_second:>8} /s  '
+                'p50 {p50_ms:>7}ms  p99 {p99_ms:>7}ms  {connections_opened:>5} connections opened, '
+                '{errors} errors'.format(**result))
@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from app.movies.models import Auditorium, Movie, Slot, Theatre
+from app.movies.utils import FreeSlotUtil
+
+
+class Command(BaseCommand):
+    """
+    compares the per auditorium free slot lookup with the batched one, all data is rolled back afterwards
+    """
+    help = 'Benchmark of the free slot computation at growing auditorium counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--audis', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--audis-per-theatre', type=int, default=10)
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        results = [self.run(audis, options) for audis in options['audis']]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(
+                '{audis:>7} audis  per-audi: {per_audi_seconds:.3f}s {per_audi_queries} queries  '
+                'batched: {batched_seconds:.3f}s {batched_queries} queries'.format(**result))
+
+    def seed(self, audis, options):
+        start_date = datetime.date.today() + datetime.timedelta(days=1)
+        theatres = Theatre.objects.bulk_create([
+            Theatre(name='bench-{}'.format(index), city='bench', state='bench')
+            for index in range(audis // options['audis_per_theatre'] + 1)
+        ])
+        Auditorium.objects.bulk_create([
+            Auditorium(name='A{}'.format(index), seats=100, theatre_id=theatres[index % len(theatres)].id)
+            for index in range(audis)
+        ])
+        movie = Movie.objects.create(name='bench', duration='2.00', language=['E'], movie_type=['2D'])
+        # every other auditorium runs the movie in its first two slots on every other day
+        slots = []
+        for audi in Auditorium.objects.filter(theatre__in=theatres).values('id', 'opening_time')[::2]:
+            for day in range(0, options['days'], 2):
+                for slot in (audi['opening_time'], audi['opening_time'] + 3):
+                    slots.append(Slot(
+                        audi_id=audi['id'], movie=movie, seats_available=100, slot=slot,
+                        date=start_date + datetime.timedelta(days=day), movie_type='2D', movie_language='E'))
+        Slot.objects.bulk_create(slots, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return theatres, start_date, start_date + datetime.timedelta(days=options['days'] - 1)
+
+    def run(self, audis, options):
+        with transaction.atomic():
+            theatres, start_date, end_date = self.seed(audis, options)
+            audi_queryset = Auditorium.objects.select_related('theatre').filter(theatre__in=theatres)
+
+            with CaptureQueriesContext(connection) as audi_queries:
+                start = time.time()
+                audi_list = list(audi_queryset)
+                per_audi_queries = len(audi_queries)
+                for audi in audi_list:
+                    # the query log is capped, so the queries are counted and dropped per auditorium
+                    connection.queries_log.clear()
+                    FreeSlotUtil().get_free_slots(audi, start_date, end_date)
+                    per_audi_queries += len(connection.queries_log)
+                per_audi_seconds = time.time() - start
+
+            with CaptureQueriesContext(connection) as batched_queries:
+                start = time.time()
+                FreeSlotUtil().get_free_slots_by_date(audi_queryset.all(), start_date, end_date)
+                batched_seconds = time.time() - start
+
+            transaction.set_rollback(True)
+        return {
+            'audis': audis,
+            'days': options['days'],
+            'per_audi_seconds': per_audi_seconds,
+            'per_audi_queries': per_audi_queries,
+            'batched_seconds': batched_seconds,
+            'batched_queries': len(batched_queries),
+        }
@@ -0,0 +1,99 @@
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from app.commons.mail import MailBatcher, MailConnectionPool, MailTemplates
+from app.commons.smtpstub import SMTPStub
+
+
+class Command(BaseCommand):
+    """
+    compares the mails/sec of one send_mail per ticket with the pooled, batched delivery,
+    against a local smtp stub unless --use-settings points it at the configured server
+    """
+    help = 'Benchmark of ticket mail delivery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mails', type=int, default=500)
+        parser.add_argument('--senders', type=int, default=8, help='concurrent senders, like worker threads')
+        parser.add_argument('--use-settings', action='store_true', help='send through the configured EMAIL_BACKEND')
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def context(self, index):
+        return {'movie': 'M1', 'date': '2026-10-19', 'time': 9, 'seats': index % 4 + 1, 'audi': 'A1'}
+
+    def send_mail(self, index):
+        context = self.context(index)
+        send_mail(
+            subject='Ticket Confirmation',
+            message=render_to_string('ticketConfirmation.txt', context),
+            from_email=settings.EMAIL_HOST_USER,
+            recipient_list=['user{}@example.com'.format(index)],
+            html_message=render_to_string('ticketConfirmation.html', context),
+            fail_silently=False,
+        )
+
+    def run(self, mode, options, stub):
+        pool = MailConnectionPool()
+        batcher = MailBatcher(pool)
+        templates = MailTemplates()
+        templates.warm('ticketConfirmation.txt', 'ticketConfirmation.html')
+
+        def pooled(index):
+            batcher.send(templates.message(
+                'Ticket Confirmation', 'ticketConfirmation', self.context(index), ['user{}@example.com'.format(index)]))
+
+        send = self.send_mail if mode == 'send_mail' else pooled
+        indexes = list(range(options['mails']))
+        connections_before = stub.connections if stub else 0
+
+        def sender():
+            while True:
+                try:
+                    index = indexes.pop()
+                except IndexError:
+                    return
+                send(index)
+
+        start = time.time()
+        threads = [threading.Thread(target=sender) for _ in range(options['senders'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        pool.close()
+        return {
+            'mode': mode,
+            'mails': options['mails'],
+            'seconds': round(elapsed, 3),
+            'mails_per_second': round(options['mails'] / elapsed, 1),
+            'connections': stub.connections - connections_before if stub else None,
+        }
+
+    def handle(self, *args, **options):
+        stub = None if options['use_settings'] else SMTPStub().start()
+        results = []
+        try:
+            with override_settings(**(stub.settings() if stub else {})):
+                for mode in ('send_mail', 'pooled'):
+                    results.append(self.run(mode, options, stub))
+        finally:
+            if stub:
+                stub.stop()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(
+                '{mode:<10} {mails} mails in {seconds:>7.3f}s  {mails_per_second:>8} mails/sec  '
+                'connections {connections}'.format(**result))
@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from app.movies.models import Auditorium, Movie, Slot, Theatre
+from app.movies.serializers import SlotBookingSerializer
+from app.movies.utils import FreeSlotUtil
+
+
+class Command(BaseCommand):
+    """
+    schedules a movie in every slot of a chain of auditoriums and reports slots/sec, all data is rolled back afterwards
+    """
+    help = 'Benchmark of bulk slot scheduling through SlotBookingSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--audis', type=int, nargs='+', default=[50, 500])
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def handle(self, *args, **options):
+        results = [self.run(audis, options['days']) for audis in options['audis']]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(
+                '{audis:>6} audis x {days} days  {slots} slots in {seconds:.3f}s '
+                '({slots_per_second:.0f} slots/sec, validate {validate_seconds:.3f}s, {queries} queries)'.format(**result))
+
+    def run(self, audis, days):
+        with transaction.atomic():
+            theatre = Theatre.objects.create(name='bench', city='bench', state='bench')
+            Auditorium.objects.bulk_create([
+                Auditorium(name='A{}'.format(index), seats=100, theatre=theatre) for index in range(audis)])
+            movie = Movie.objects.create(name='bench', duration='2.00', language=['E'], movie_type=['2D'])
+            opening_date = datetime.date.today() + datetime.timedelta(days=1)
+            data = {
+                'opening_date': opening_date,
+                'closing_date': opening_date + datetime.timedelta(days=days - 1),
+                'movie_type': '2D',
+                'movie_language': 'E',
+                'movie': movie.id,
+                'audiSlots': dict(
+                    (str(audi.id), FreeSlotUtil.get_audi_slots(audi)) for audi in theatre.auditoriums.all()),
+            }
+
+            with CaptureQueriesContext(connection) as queries:
+                start = time.time()
+                serializer = SlotBookingSerializer(data=data)
+                serializer.is_valid(raise_exception=True)
+                validate_seconds = time.time() - start
+                serializer.save()
+                seconds = time.time() - start
+            slots = Slot.objects.filter(movie=movie).count()
+            transaction.set_rollback(True)
+        return {
+            'audis': audis,
+            'days': days,
+            'slots': slots,
+            'seconds': seconds,
+            'validate_seconds': validate_seconds,
+            'slots_per_second': slots / seconds,
+            'queries': len(queries),
+        }
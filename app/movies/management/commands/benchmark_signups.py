@@ -0,0 +1,87 @@
+from __future__ import unicode_literals
+
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from app.commons.hashing import password_pool
+from app.users.models import User
+
+
+class Command(BaseCommand):
+    """
+    measures signups/sec per core through the signup API with the password hashed inline and in the hashing pool
+    """
+    help = 'Benchmark of signup throughput for the password hashing modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help='concurrent request threads, like a WSGI worker')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='hashing processes of the pooled mode')
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def run(self, mode, processes, options, run_id):
+        emails = ['bench-{}-{}-{}@example.com'.format(run_id, mode, index) for index in range(options['signups'])]
+        statuses = []
+
+        def signup():
+            client = Client()
+            while True:
+                try:
+                    email = emails.pop()
+                except IndexError:
+                    break
+                statuses.append(client.post(
+                    reverse('user:users'), {'name': 'bench', 'email': email, 'password': 'Tr0ub4dor&3horse'}
+                ).status_code)
+            connections.close_all()
+
+        with override_settings(PASSWORD_HASHING_PROCESSES=processes):
+            if processes:
+                # fork the pool up front so the first signups do not pay for it
+                password_pool.get_pool()
+            start = time.time()
+            threads = [threading.Thread(target=signup) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+            password_pool.close()
+        cores = max(processes, 1)
+        return {
+            'mode': mode,
+            'signups': statuses.count(201),
+            'errors': len(statuses) - statuses.count(201),
+            'seconds': round(elapsed, 3),
+            'signups_per_second': round(statuses.count(201) / elapsed, 2),
+            'hashing_cores': cores,
+            'signups_per_second_per_core': round(statuses.count(201) / elapsed / cores, 2),
+        }
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        try:
+            results = [
+                self.run('inline', 0, options, run_id),
+                self.run('pooled', options['processes'], options, run_id),
+            ]
+        finally:
+            User.objects.filter(email__startswith='bench-{}-'.format(run_id)).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for result in results:
+            self.stdout.write(
+                '{mode:<7} {signups} signups in {seconds:>7.3f}s  {signups_per_second:>7} /s  '
+                '{signups_per_second_per_core:>7} /s per core ({hashing_cores} cores), {errors} errors'.format(**result))
@@ -0,0 +1,312 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from app.movies.management.commands.generate_benchmark_data import (
+    ADMIN_EMAIL, CITIES, LANGUAGES, PREFIX, RARE_WORDS, WORDS, BenchmarkDataset)
+from app.movies.models import Auditorium, Movie, Slot
+from app.users.models import Booking, User
+from app.users.tasks import user_ticket_task
+
+DEFAULT_BASELINE = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, os.pardir, 'benchmarks',
+    'baseline.json'))
+
+
+def _setup_process():
+    connections.close_all()
+    # mails are rendered but kept in memory and celery tasks run inline
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    user_ticket_task.app.conf.task_always_eager = True
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * percent / 100.0))] * 1000, 2)
+
+
+def _book(args):
+    """
+    contention client process, returns (status, seconds) of every booking request it made
+    """
+    movie_id, slot_id, token, requests = args
+    _setup_process()
+    client = Client()
+    url = reverse('movie:booking', kwargs={'movieId': movie_id})
+    results = []
+    for _ in range(requests):
+        start = time.time()
+        status_code = client.post(
+            url, {'slot': slot_id, 'seats_booked': 1}, HTTP_AUTHORIZATION='Token {}'.format(token)).status_code
+        results.append((status_code, time.time() - start))
+    connections.close_all()
+    return results
+
+
+class Scenarios(object):
+    """
+    the timed scenarios of the suite, every scenario returns a list of (seconds, queries, ok) samples
+    """
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.client = Client()
+        self.admin = User.objects.get(email=ADMIN_EMAIL)
+        self.user = User.objects.filter(email__startswith=PREFIX + 'user-').order_by('id').first()
+        self.admin_auth = 'Token {}'.format(Token.objects.get_or_create(user=self.admin)[0].key)
+        self.user_auth = 'Token {}'.format(Token.objects.get_or_create(user=self.user)[0].key)
+        self.movie_ids = list(Movie.objects.filter(name__startswith=PREFIX).order_by('id').values_list('id', flat=True))
+        self.audi_ids = list(Auditorium.objects.filter(
+            theatre__name__startswith=PREFIX).order_by('id').values_list('id', flat=True))
+        self.last_date = Slot.objects.filter(audi_id__in=self.audi_ids[:1]).order_by('-date').values_list(
+            'date', flat=True).first()
+
+    def timed(self, request, ok_status):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            response = request()
+            seconds = time.time() - start
+        return seconds, len(queries), response.status_code == ok_status
+
+    def movie_list(self):
+        # the response cache is dropped before every request to time the database path
+        samples = []
+        for _ in range(self.options['repeat']):
+            caches[settings.RESPONSE_CACHE_ALIAS].clear()
+            samples.append(self.timed(
+                lambda: self.client.get(reverse('movie:movie-list'), HTTP_AUTHORIZATION=self.user_auth), 200))
+        return samples
+
+    def movie_detail(self):
+        samples = []
+        for _ in range(self.options['repeat']):
+            caches[settings.RESPONSE_CACHE_ALIAS].clear()
+            url = reverse('movie:movie-detail', kwargs={'pk': self.rng.choice(self.movie_ids)})
+            samples.append(self.timed(lambda: self.client.get(url, HTTP_AUTHORIZATION=self.user_auth), 200))
+        return samples
+
+    def movie_search(self):
+        """
+        text searches over the whole catalogue as an admin, half of them filtered to a language, uncached
+        """
+        samples = []
+        for _ in range(self.options['repeat']):
+            caches[settings.RESPONSE_CACHE_ALIAS].clear()
+            params = {'q': self.rng.choice(WORDS + RARE_WORDS)}
+            if self.rng.random() < 0.5:
+                params['language'] = self.rng.choice(LANGUAGES)
+            samples.append(self.timed(lambda: self.client.get(
+                reverse('movie:movie-search'), params, HTTP_AUTHORIZATION=self.admin_auth), 200))
+        return samples
+
+    def free_slots(self):
+        start_date = datetime.date.today() + datetime.timedelta(days=1)
+        params = {'start_date': start_date, 'end_date': start_date + datetime.timedelta(days=6)}
+        return [
+            self.timed(lambda: self.client.get(reverse('movie:free-slots'), params,
+                                               HTTP_AUTHORIZATION=self.admin_auth), 200)
+            for _ in range(self.options['heavy_repeat'])
+        ]
+
+    def showtimes(self):
+        """
+        showtimes of a city for tomorrow with the response cache dropped
+        """
+        samples = []
+        cities = [city[0] for city in CITIES]
+        date = datetime.date.today() + datetime.timedelta(days=1)
+        for _ in range(self.options['repeat']):
+            caches[settings.RESPONSE_CACHE_ALIAS].clear()
+            params = {'city': self.rng.choice(cities), 'date': date}
+            samples.append(self.timed(
+                lambda: self.client.get(reverse('movie:showtimes'), params, HTTP_AUTHORIZATION=self.user_auth), 200))
+        return samples
+
+    def slot_scheduling(self):
+        """
+        schedules a movie for a week after the generated days into a sample of auditoriums, rolled back
+        """
+        samples = []
+        opening_date = self.last_date + datetime.timedelta(days=1)
+        for _ in range(self.options['heavy_repeat']):
+            audis = self.rng.sample(self.audi_ids, min(self.options['schedule_audis'], len(self.audi_ids)))
+            movie = Movie.objects.get(id=self.rng.choice(self.movie_ids))
+            data = {
+                'opening_date': opening_date, 'closing_date': opening_date + datetime.timedelta(days=6),
+                'movie': movie.id, 'movie_type': movie.movie_type[0], 'movie_language': movie.language[0],
+                'audiSlots': dict((str(audi), [9, 12]) for audi in audis),
+            }
+            with transaction.atomic():
+                samples.append(self.timed(lambda: self.client.post(
+                    reverse('movie:slot_booking'), json.dumps(data, default=str), content_type='application/json',
+                    HTTP_AUTHORIZATION=self.admin_auth), 201))
+                transaction.set_rollback(True)
+        return samples
+
+    def create_slot(self, days_ahead, seats):
+        audi = Auditorium.objects.get(id=self.rng.choice(self.audi_ids))
+        movie = Movie.objects.get(id=self.rng.choice(self.movie_ids))
+        return Slot.objects.create(
+            audi=audi, movie=movie, seats_available=seats, slot=audi.opening_time,
+            date=self.last_date + datetime.timedelta(days=days_ahead), movie_type=movie.movie_type[0],
+            movie_language=movie.language[0])
+
+    def booking_contention(self):
+        """
+        clients in separate processes book single seats of one slot that has fewer seats than requests
+        """
+        workers, requests = self.options['workers'], self.options['requests']
+        seats = workers * requests // 2
+        slot = self.create_slot(30, seats)
+        users = User.objects.filter(email__startswith=PREFIX + 'user-').order_by('id')[:workers]
+        jobs = [(slot.movie_id, slot.id, Token.objects.get_or_create(user=user)[0].key, requests) for user in users]
+        connections.close_all()
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = sum(pool.map(_book, jobs), [])
+        finally:
+            pool.close()
+            pool.join()
+        booked = Booking.objects.filter(slot=slot).count()
+        self.extra = {'oversell': max(0, booked - seats)}
+        Booking.objects.filter(slot=slot).delete()
+        slot.delete()
+        # the client processes run their own queries, only the outcome is sampled here
+        return [(seconds, 0, status_code in (201, 400)) for status_code, seconds in results]
+
+    def cancellations(self):
+        """
+        deletes a slot with bookings from many users, cancelling them and sending the cancellation mails
+        """
+        samples = []
+        users = list(User.objects.filter(email__startswith=PREFIX + 'user-').values_list('id', flat=True))
+        for run in range(self.options['heavy_repeat']):
+            slot = self.create_slot(40 + run, self.options['cancel_bookings'])
+            Booking.objects.bulk_create([
+                Booking(user_id=users[index % len(users)], slot=slot, seats_booked=1)
+                for index in range(self.options['cancel_bookings'])
+            ])
+            samples.append(self.timed(lambda: self.client.delete(
+                reverse('movie:slot_delete', kwargs={'pk': slot.id}), HTTP_AUTHORIZATION=self.admin_auth), 204))
+            Booking.objects.filter(slot=slot).delete()
+        return samples
+
+
+SCENARIOS = (
+    'movie_list', 'movie_detail', 'movie_search', 'showtimes', 'free_slots', 'slot_scheduling', 'booking_contention',
+    'cancellations',
+)
+
+
+class Command(BaseCommand):
+    """
+    runs the timed API scenarios against the benchmark_data dataset and compares them with a stored baseline
+    """
+    help = 'Benchmark suite of the main API paths with regression check against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=50, help='runs of the read scenarios')
+        parser.add_argument('--heavy-repeat', type=int, default=10, help='runs of the free slot and write scenarios')
+        parser.add_argument('--schedule-audis', type=int, default=100)
+        parser.add_argument('--cancel-bookings', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=4, help='client processes of the booking contention')
+        parser.add_argument('--requests', type=int, default=20, help='booking requests per client')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='json results to compare against')
+        parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed relative p50 slowdown before a scenario counts as a regression')
+        parser.add_argument('--output', help='also write the json results to this file')
+        parser.add_argument('--json', action='store_true', help='print the results as json')
+
+    def run(self, scenarios, name):
+        scenarios.extra = {}
+        samples = getattr(scenarios, name)()
+        seconds = [sample[0] for sample in samples]
+        result = {
+            'scenario': name,
+            'runs': len(samples),
+            'errors': len([sample for sample in samples if not sample[2]]),
+            'p50_ms': _percentile(seconds, 50),
+            'p95_ms': _percentile(seconds, 95),
+            'mean_ms': round(sum(seconds) / len(seconds) * 1000, 2),
+            'queries': sorted(sample[1] for sample in samples)[len(samples) // 2],
+        }
+        result.update(scenarios.extra)
+        return result
+
+    def compare(self, results, baseline, tolerance):
+        """
+        returns the regressions of the results: a slower p50 beyond the tolerance, more queries or new errors
+        """
+        previous = dict((result['scenario'], result) for result in baseline['scenarios'])
+        regressions = []
+        for result in results['scenarios']:
+            before = previous.get(result['scenario'])
+            if before is None:
+                continue
+            # sub millisecond differences are noise whatever the ratio
+            if result['p50_ms'] > before['p50_ms'] * (1 + tolerance) and result['p50_ms'] - before['p50_ms'] > 1:
+                regressions.append('{scenario}: p50 {p50_ms}ms'.format(**result) + ' > {p50_ms}ms'.format(**before))
+            if result['queries'] > before['queries']:
+                regressions.append('{scenario}: {queries} queries'.format(**result) + ' > {queries}'.format(**before))
+            if result['errors'] > before['errors'] or result.get('oversell'):
+                regressions.append('{scenario}: {errors} errors, oversell {}'.format(
+                    result.get('oversell', 0), **result))
+        return regressions
+
+    def handle(self, *args, **options):
+        dataset = BenchmarkDataset.counts()
+        if not dataset['theatres']:
+            raise CommandError('no benchmark data, run generate_benchmark_data first')
+        _setup_process()
+        scenarios = Scenarios(options)
+        results = {
+            'dataset': dataset,
+            'scenarios': [self.run(scenarios, name) for name in options['scenarios']],
+        }
+        content = json.dumps(results, indent=2, sort_keys=True, separators=(',', ': '))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        if options['json']:
+            self.stdout.write(content)
+        else:
+            for result in results['scenarios']:
+                self.stdout.write(
+                    '{scenario:<20} {runs:>4} runs  p50 {p50_ms:>9}ms  p95 {p95_ms:>9}ms  '
+                    '{queries:>4} queries  {errors} errors'.format(**result))
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as output:
+                output.write(content)
+            return
+        if not os.path.exists(options['baseline']):
+            return
+        with open(options['baseline']) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['dataset'] != dataset:
+            self.stderr.write('baseline was recorded on a different dataset, not compared')
+            return
+        regressions = self.compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('regressions against {}:\n  {}'.format(options['baseline'], '\n  '.join(regressions)))
+        self.stderr.write('no regressions against {}'.format(options['baseline']))
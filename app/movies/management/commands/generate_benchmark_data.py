@@ -0,0 +1,219 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from app.movies.models import Auditorium, Movie, NowShowing, Showtime, Slot, Theatre
+from app.users.models import User
+
+PREFIX = 'bench-data-'
+PASSWORD = 'Tr0ub4dor&3horse'
+ADMIN_EMAIL = PREFIX + 'admin@example.com'
+
+SCALES = {
+    'small': {'theatres': 50, 'audis_per_theatre': 4, 'movies': 30, 'days': 7, 'users': 200, 'bookings': 5000},
+    'medium': {'theatres': 500, 'audis_per_theatre': 10, 'movies': 100, 'days': 14, 'users': 2000, 'bookings': 200000},
+    'large': {
+        'theatres': 2000, 'audis_per_theatre': 10, 'movies': 300, 'days': 21, 'users': 20000, 'bookings': 2000000},
+}
+
+CITIES = (
+    ('Mumbai', 'Maharashtra', 19.076, 72.878), ('Pune', 'Maharashtra', 18.520, 73.857),
+    ('Nagpur', 'Maharashtra', 21.146, 79.088), ('Delhi', 'Delhi', 28.704, 77.102),
+    ('Bengaluru', 'Karnataka', 12.972, 77.595), ('Mysuru', 'Karnataka', 12.296, 76.639),
+    ('Chennai', 'Tamil Nadu', 13.083, 80.271), ('Coimbatore', 'Tamil Nadu', 11.017, 76.956),
+    ('Hyderabad', 'Telangana', 17.385, 78.487), ('Kolkata', 'West Bengal', 22.573, 88.364),
+    ('Ahmedabad', 'Gujarat', 23.023, 72.571), ('Surat', 'Gujarat', 21.170, 72.831),
+    ('Jaipur', 'Rajasthan', 26.912, 75.787), ('Lucknow', 'Uttar Pradesh', 26.847, 80.947),
+    ('Noida', 'Uttar Pradesh', 28.535, 77.391), ('Kochi', 'Kerala', 9.931, 76.267),
+    ('Chandigarh', 'Punjab', 30.733, 76.779), ('Indore', 'Madhya Pradesh', 22.720, 75.858),
+    ('Bhopal', 'Madhya Pradesh', 23.260, 77.413), ('Patna', 'Bihar', 25.594, 85.138),
+)
+LANGUAGES = ('E', 'H', 'T', 'K', 'M')
+MOVIE_TYPES = ('2D', '3D', 'IMAX')
+WORDS = (
+    'midnight', 'river', 'empire', 'shadow', 'return', 'storm', 'garden', 'last', 'city', 'silent', 'golden',
+    'journey', 'war', 'heart', 'broken', 'star', 'summer', 'king', 'game', 'secret', 'ocean', 'fire', 'road',
+)
+# made up words for the long tail of the about texts, so that a search term matches a realistic share of movies
+SYLLABLES = ('ka', 'ri', 'to', 'me', 'lu', 'sa', 'no', 'vi', 'de', 'ra', 'po', 'li')
+RARE_WORDS = tuple(first + second + third for first in SYLLABLES for second in SYLLABLES for third in SYLLABLES)
+
+BENCH_THEATRES = "SELECT id FROM movies_theatre WHERE name LIKE '{}%%'".format(PREFIX)
+BENCH_AUDIS = 'SELECT id FROM movies_auditorium WHERE theatre_id IN ({})'.format(BENCH_THEATRES)
+BENCH_SLOTS = 'SELECT id FROM movies_slot WHERE audi_id IN ({})'.format(BENCH_AUDIS)
+BENCH_MOVIES = "SELECT id FROM movies_movie WHERE name LIKE '{}%%'".format(PREFIX)
+BENCH_USERS = "SELECT id FROM users_user WHERE email LIKE '{}%%'".format(PREFIX)
+
+
+class BenchmarkDataset(object):
+    """
+    deterministic synthetic catalogue of theatres, auditoriums, movies, slots, users and bookings. The rows are
+    told apart from real data by the bench-data- prefix of their names and emails, the same seed and scale
+    always give the same dataset relative to the ids it starts from.
+    """
+    def __init__(self, seed=0, theatres=50, audis_per_theatre=4, movies=30, days=7, users=200, bookings=5000):
+        self.seed = seed
+        self.theatres = theatres
+        self.audis_per_theatre = audis_per_theatre
+        self.movies = movies
+        self.days = days
+        self.users = users
+        self.bookings = bookings
+        self.start_date = datetime.date.today() + datetime.timedelta(days=1)
+
+    @staticmethod
+    def counts():
+        with connection.cursor() as cursor:
+            counts = {}
+            for name, query in (('theatres', BENCH_THEATRES), ('audis', BENCH_AUDIS), ('movies', BENCH_MOVIES),
+                                ('slots', BENCH_SLOTS), ('users', BENCH_USERS)):
+                cursor.execute('SELECT count(*) FROM ({}) rows'.format(query), [])
+                counts[name] = cursor.fetchone()[0]
+            cursor.execute('SELECT count(*) FROM users_booking WHERE slot_id IN ({})'.format(BENCH_SLOTS), [])
+            counts['bookings'] = cursor.fetchone()[0]
+        return counts
+
+    @staticmethod
+    @transaction.atomic()
+    def flush():
+        """
+        deletes the generated rows with set based deletes, the ORM cascade would load millions of objects
+        """
+        with connection.cursor() as cursor:
+            for model, subquery in ((Slot, BENCH_SLOTS), (User, BENCH_USERS)):
+                for relation in model._meta.related_objects:
+                    if relation.one_to_many or relation.one_to_one:
+                        cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                            relation.related_model._meta.db_table, relation.field.column, subquery), [])
+            for table, subquery in (('movies_slot', BENCH_SLOTS), ('movies_nowshowing', BENCH_MOVIES)):
+                cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                    table, 'movie_id' if table == 'movies_nowshowing' else 'id', subquery), [])
+            for table, subquery in (('movies_auditorium', BENCH_AUDIS), ('movies_theatre', BENCH_THEATRES),
+                                    ('movies_movie', BENCH_MOVIES), ('users_user', BENCH_USERS)):
+                cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(table, subquery), [])
+
+    @transaction.atomic()
+    def generate(self):
+        rng = random.Random(self.seed)
+        theatres = []
+        for index in range(self.theatres):
+            city, state, latitude, longitude = rng.choice(CITIES)
+            # theatres are spread over roughly 20km around the city centre
+            theatre = Theatre(
+                name='{}theatre-{:05d}'.format(PREFIX, index), city=city, state=state,
+                zipcode=rng.randint(110001, 855999), latitude=latitude + rng.uniform(-0.1, 0.1),
+                longitude=longitude + rng.uniform(-0.1, 0.1))
+            # bulk_create skips save(), which derives the search keys
+            theatre.set_search_keys()
+            theatres.append(theatre)
+        theatres = Theatre.objects.bulk_create(theatres, batch_size=5000)
+        Auditorium.objects.bulk_create([
+            Auditorium(name='A{}'.format(number + 1), seats=rng.choice((80, 120, 150, 200, 250, 400)),
+                       theatre_id=theatre.id)
+            for theatre in theatres for number in range(self.audis_per_theatre)
+        ], batch_size=5000)
+        movies = Movie.objects.bulk_create([
+            Movie(
+                name='{}movie-{:04d} {} {}'.format(PREFIX, index, rng.choice(WORDS), rng.choice(WORDS)),
+                duration=Decimal(rng.choice(('1.30', '2.00', '2.30', '2.45'))),
+                about=' '.join(
+                    rng.choice(WORDS if rng.random() < 0.05 else RARE_WORDS) for _ in range(rng.randint(20, 120))),
+                language=sorted(set(['E'] + rng.sample(LANGUAGES, rng.randint(1, 3)))),
+                movie_type=sorted(set(['2D'] + rng.sample(MOVIE_TYPES, rng.randint(1, 2)))),
+            )
+            for index in range(self.movies)
+        ])
+        User.objects.create_user(name='bench admin', email=ADMIN_EMAIL, password=PASSWORD)
+        User.objects.filter(email=ADMIN_EMAIL).update(is_admin=True)
+
+        with connection.cursor() as cursor:
+            # every auditorium runs 3 of its 4 daily slots, the free one moves with the auditorium and the day
+            cursor.execute("""
+                INSERT INTO movies_slot (audi_id, movie_id, seats_available, date, slot, movie_type, movie_language)
+                SELECT audi.id, movie.id, audi.seats, %s + day, audi.opening_time + 3 * show,
+                       movie.movie_type[1], movie.language[1]
+                FROM (
+                    SELECT id, seats, opening_time, row_number() OVER (ORDER BY id) - 1 AS index
+                    FROM movies_auditorium WHERE id IN ({})
+                ) audi
+                CROSS JOIN generate_series(0, %s) day
+                CROSS JOIN generate_series(0, 3) show
+                JOIN movies_movie movie ON movie.id = (%s::int[])[1 + ((audi.index * 7 + day * 3) * 4 + show) %% %s]
+                WHERE show <> (audi.index + day) %% 4
+            """.format(BENCH_AUDIS), [self.start_date, self.days - 1, [movie.id for movie in movies], len(movies)])
+            cursor.execute("""
+                INSERT INTO users_user (password, is_superuser, name, email, is_staff, is_admin, gender)
+                SELECT %s, false, 'bench user ' || index, %s || 'user-' || index || '@example.com', false, false,
+                       CASE WHEN index %% 2 = 0 THEN 'M' ELSE 'F' END
+                FROM generate_series(0, %s) index
+            """, [make_password(PASSWORD), PREFIX, self.users - 1])
+            cursor.execute('SELECT count(*) FROM ({}) slots'.format(BENCH_SLOTS), [])
+            slots = cursor.fetchone()[0]
+            # bookings are spread over the slots with a prime stride so neighbouring bookings hit different slots
+            cursor.execute("""
+                INSERT INTO users_booking (user_id, slot_id, seats_booked, booking_status, seat_numbers)
+                SELECT bench_user.id, slot.id, 1 + booking %% 4, 'Confirmed', '{{}}'
+                FROM generate_series(0::bigint, %s) booking
+                JOIN (
+                    SELECT id, row_number() OVER (ORDER BY id) - 1 AS index FROM movies_slot WHERE id IN ({})
+                ) slot ON slot.index = booking * 7919 %% %s
+                JOIN (
+                    SELECT id, row_number() OVER (ORDER BY id) - 1 AS index FROM users_user
+                    WHERE email LIKE %s || 'user-%%'
+                ) bench_user ON bench_user.index = booking %% %s
+            """.format(BENCH_SLOTS), [self.bookings - 1, slots, PREFIX, self.users])
+            cursor.execute("""
+                UPDATE movies_slot slot SET seats_available = GREATEST(audi.seats - booked.seats, 0)
+                FROM movies_auditorium audi, (
+                    SELECT slot_id, sum(seats_booked) AS seats FROM users_booking
+                    WHERE slot_id IN ({}) GROUP BY slot_id
+                ) booked
+                WHERE slot.id = booked.slot_id AND audi.id = slot.audi_id
+            """.format(BENCH_SLOTS), [])
+        NowShowing.objects.refresh([movie.id for movie in movies])
+        Showtime.objects.refresh([movie.id for movie in movies])
+
+
+class Command(BaseCommand):
+    """
+    fills the database with a deterministic synthetic dataset for benchmark_suite
+    """
+    help = 'Generates the benchmark dataset, e.g. --scale large for millions of slots and bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=0)
+        for option in ('theatres', 'audis-per-theatre', 'movies', 'days', 'users', 'bookings'):
+            parser.add_argument('--' + option, type=int, help='overrides the value of the scale')
+        parser.add_argument('--flush', action='store_true', help='delete the existing benchmark data first')
+        parser.add_argument('--flush-only', action='store_true', help='only delete the existing benchmark data')
+        parser.add_argument('--json', action='store_true', help='print the dataset counts as json')
+
+    def handle(self, *args, **options):
+        if options['flush'] or options['flush_only']:
+            BenchmarkDataset.flush()
+        if not options['flush_only']:
+            if BenchmarkDataset.counts()['theatres']:
+                raise CommandError('benchmark data already exists, run with --flush to replace it')
+            scale = dict(SCALES[options['scale']])
+            scale.update((key, options[key]) for key in scale if options[key] is not None)
+            start = time.time()
+            BenchmarkDataset(seed=options['seed'], **scale).generate()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stderr.write('generated in {:.1f}s'.format(time.time() - start))
+
+        counts = BenchmarkDataset.counts()
+        if options['json']:
+            self.stdout.write(json.dumps(counts, indent=2, sort_keys=True))
+            return
+        for name in sorted(counts):
+            self.stdout.write('{:<10}{:>10}'.format(name, counts[name]))
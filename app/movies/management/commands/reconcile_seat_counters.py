@@ -0,0 +1,21 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from app.movies.models import Slot
+from app.movies.utils import SeatCounterUtil
+
+
+class Command(BaseCommand):
+    """
+    writes the seat journal back to the slots and rebuilds the seat counters of the upcoming slots,
+    meant for deploys and restarts of a shared counter cache while bookings are paused
+    """
+    help = 'Flush the seat journal and rebuild the seat counters from the database'
+
+    def handle(self, *args, **options):
+        counter = SeatCounterUtil()
+        flushed = counter.flush()
+        slot_ids = list(Slot.objects.upcoming().values_list('id', flat=True))
+        counter.reconcile(slot_ids)
+        self.stdout.write('flushed {} slots, rebuilt {} counters'.format(flushed, len(slot_ids)))
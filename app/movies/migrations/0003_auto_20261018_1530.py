@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_seatmap'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='slot',
+            unique_together=set([('date', 'slot', 'audi')]),
+        ),
+    ]
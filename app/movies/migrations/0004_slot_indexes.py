@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# index predicates have to be immutable, so the cut-off date is fixed when the index is built
+# and moved forward by a daily task, until 0010 dropped the index
+UPCOMING_INDEX_SQL = """
+DO $$ BEGIN
+    EXECUTE format(
+        'CREATE INDEX movies_slot_upcoming_idx ON movies_slot (date, slot, movie_id) WHERE date >= %L',
+        current_date);
+END $$;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_auto_20261018_1530'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='slot',
+            name='audi',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.Auditorium'),
+        ),
+        migrations.AlterField(
+            model_name='slot',
+            name='movie',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.Movie'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='slot',
+            unique_together=set([('audi', 'date', 'slot')]),
+        ),
+        migrations.AddIndex(
+            model_name='slot',
+            index=models.Index(fields=['movie', 'date', 'slot'], name='movies_slot_movie_date_idx'),
+        ),
+        migrations.RunSQL(
+            sql=UPCOMING_INDEX_SQL,
+            reverse_sql='DROP INDEX IF EXISTS movies_slot_upcoming_idx',
+        ),
+    ]
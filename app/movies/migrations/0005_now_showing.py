@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_slot_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NowShowing',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='now_showing', serialize=False, to='movies.Movie')),
+                ('last_date', models.DateField()),
+                ('last_slot', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='nowshowing',
+            index_together=set([('last_date', 'last_slot')]),
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO movies_nowshowing (movie_id, last_date, last_slot)
+                SELECT DISTINCT ON (movie_id) movie_id, date, slot
+                FROM movies_slot
+                WHERE date >= current_date
+                ORDER BY movie_id, date DESC, slot DESC
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_now_showing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatDelta',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_deltas', to='movies.Slot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:41
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+from app.commons.geo import normalize_city
+
+
+def set_city_keys(apps, schema_editor):
+    Theatre = apps.get_model('movies', 'Theatre')
+    for theatre in Theatre.objects.only('id', 'city').iterator():
+        Theatre.objects.filter(id=theatre.id).update(city_key=normalize_city(theatre.city))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_seat_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='theatre',
+            name='city_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='theatre',
+            name='geohash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='theatre',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='theatre',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AlterField(
+            model_name='theatre',
+            name='zipcode',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+        migrations.RunPython(set_city_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:54
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# a trigger rather than Model.save() keeps the vector right for bulk_create and queryset updates as well,
+# the name outweighs the about text in the ranking
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION movies_movie_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.about, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER movies_movie_search_vector BEFORE INSERT OR UPDATE OF name, about, search_vector ON movies_movie
+    FOR EACH ROW EXECUTE PROCEDURE movies_movie_search_vector();
+UPDATE movies_movie SET name = name;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_theatre_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql=SEARCH_VECTOR_SQL,
+            reverse_sql='DROP TRIGGER movies_movie_search_vector ON movies_movie; '
+                        'DROP FUNCTION movies_movie_search_vector();',
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='movies_movie_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['language'], name='movies_movie_language_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['movie_type'], name='movies_movie_type_idx'),
+        ),
+    ]
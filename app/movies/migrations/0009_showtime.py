@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 11:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+COPY_SLOTS_SQL = """
+INSERT INTO movies_showtime (
+    slot_id, movie_id, date, hour, movie_type, movie_language, seats_available,
+    theatre_id, theatre_name, audi_id, audi_name)
+SELECT slot.id, slot.movie_id, slot.date, slot.slot, slot.movie_type, slot.movie_language,
+       slot.seats_available, theatre.id, theatre.name, audi.id, audi.name
+FROM movies_slot slot
+JOIN movies_auditorium audi ON audi.id = slot.audi_id
+JOIN movies_theatre theatre ON theatre.id = audi.theatre_id
+WHERE slot.date >= current_date
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_movie_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Showtime',
+            fields=[
+                ('slot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='showtime', serialize=False, to='movies.Slot')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveIntegerField()),
+                ('movie_type', models.CharField(max_length=10)),
+                ('movie_language', models.CharField(max_length=100)),
+                ('seats_available', models.PositiveIntegerField()),
+                ('theatre_id', models.PositiveIntegerField()),
+                ('theatre_name', models.CharField(max_length=64)),
+                ('audi_id', models.PositiveIntegerField()),
+                ('audi_name', models.CharField(max_length=64)),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.Movie')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='showtime',
+            index=models.Index(fields=['movie', 'date', 'hour'], name='movies_showtime_movie_idx'),
+        ),
+        migrations.RunSQL(sql=COPY_SLOTS_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the movie list reads the now showing catalogue, no query scans the upcoming slots of all movies anymore
+UPCOMING_INDEX_SQL = """
+DO $$ BEGIN
+    EXECUTE format(
+        'CREATE INDEX movies_slot_upcoming_idx ON movies_slot (date, slot, movie_id) WHERE date >= %L',
+        current_date);
+END $$;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_showtime'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='DROP INDEX IF EXISTS movies_slot_upcoming_idx',
+            reverse_sql=UPCOMING_INDEX_SQL,
+        ),
+    ]
@@ -1,13 +1,25 @@
 from __future__ import unicode_literals
 
+import datetime
 from decimal import Decimal
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, Q
 
 from app.commons.constants import MAX_LENGTH_DICT
+from app.commons.geo import encode_geohash, normalize_city
+
+
+class MovieManager(models.Manager):
+
+    def get_queryset(self):
+        # the search vector is only read by the database, loading it would double the size of every movie
+        return super(MovieManager, self).get_queryset().defer('search_vector')
 
 
 class Movie(models.Model):
@@ -19,6 +31,17 @@ class Movie(models.Model):
     about = models.CharField(max_length=MAX_LENGTH_DICT["LONG"], blank=True)
     language = ArrayField(models.CharField(max_length=MAX_LENGTH_DICT["LANGUAGE"]))
     movie_type = ArrayField(models.CharField(max_length=MAX_LENGTH_DICT["SMALL"]))
+    # weighted name and about, written by the movies_movie_search_vector trigger on every insert and update
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MovieManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='movies_movie_search_idx'),
+            GinIndex(fields=['language'], name='movies_movie_language_idx'),
+            GinIndex(fields=['movie_type'], name='movies_movie_type_idx'),
+        ]
 
     def __unicode__(self):
         return '{}'.format(self.name)
@@ -31,8 +54,22 @@ class Theatre(models.Model):
     name = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
     city = models.CharField(max_length=MAX_LENGTH_DICT["LONG"])
     state = models.CharField(max_length=MAX_LENGTH_DICT["LONG"])
-    zipcode = models.PositiveIntegerField(null=True)
+    zipcode = models.PositiveIntegerField(null=True, db_index=True)
     functional_status = models.BooleanField(default=True)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # derived on save, the indexed lookup keys of the city and location searches
+    city_key = models.CharField(max_length=MAX_LENGTH_DICT["NAME"], db_index=True, editable=False, default='')
+    geohash = models.CharField(max_length=MAX_LENGTH_DICT["GEOHASH"], db_index=True, editable=False, default='')
+
+    def set_search_keys(self):
+        self.city_key = normalize_city(self.city)
+        located = self.latitude is not None and self.longitude is not None
+        self.geohash = encode_geohash(self.latitude, self.longitude) if located else ''
+
+    def save(self, *args, **kwargs):
+        self.set_search_keys()
+        super(Theatre, self).save(*args, **kwargs)
 
     def __unicode__(self):
         return '{}'.format(self.name)
@@ -59,16 +96,252 @@ class Auditorium(models.Model):
         return '{}.{}'.format(self.theatre, self.name)
 
 
+class SlotManager(models.Manager):
+    reserve_sql = """
+        UPDATE movies_slot SET seats_available = seats_available - %s
+        WHERE id = %s AND seats_available >= %s
+        RETURNING seats_available
+    """
+    release_sql = """
+        UPDATE movies_slot SET seats_available = seats_available + %s
+        WHERE id = %s
+        RETURNING seats_available
+    """
+
+    def update_seats(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def reserve_seats(self, slot_id, seats):
+        """
+        atomically decrements the available seats of a slot with a single conditional update and returns the
+        seats left, or None instead of overselling when the slot cannot accommodate the requested seats
+        """
+        remaining = self.update_seats(self.reserve_sql, [seats, slot_id, seats])
+        if remaining is not None:
+            Showtime.objects.add_seats(slot_id, -seats)
+        return remaining
+
+    def upcoming(self):
+        """
+        returns the slots whose show has not started yet
+        """
+        today_date = datetime.date.today()
+        current_hour = datetime.datetime.now().hour
+        return self.filter(Q(date__gt=today_date) | Q(date=today_date, slot__gt=current_hour))
+
+    def release_seats(self, slot_id, seats):
+        """
+        atomically gives the seats of a cancelled booking back to the slot and returns the seats available now,
+        None when the slot is gone
+        """
+        remaining = self.update_seats(self.release_sql, [seats, slot_id])
+        if remaining is not None:
+            Showtime.objects.add_seats(slot_id, seats)
+        return remaining
+
+
 class Slot(models.Model):
     """
     Model to store current movies screening in respective slots in selected auditoriums
     """
-    audi = models.ForeignKey(Auditorium)
-    movie = models.ForeignKey(Movie)
+    # the composite indexes in Meta lead with these columns, so the single column indexes are not needed
+    audi = models.ForeignKey(Auditorium, db_index=False)
+    movie = models.ForeignKey(Movie, db_index=False)
     seats_available = models.PositiveIntegerField()
     date = models.DateField()
     slot = models.PositiveIntegerField()
     movie_type = models.CharField(max_length=MAX_LENGTH_DICT["SMALL"])
     movie_language = models.CharField(max_length=MAX_LENGTH_DICT["LANGUAGE"])
 
-    unique_together = ('date', 'slot', 'audi')
+    objects = SlotManager()
+
+    class Meta:
+        # column order lets the unique index also serve the (audi, date) range scans of the free slot lookups
+        unique_together = ('audi', 'date', 'slot')
+        indexes = [
+            models.Index(fields=['movie', 'date', 'slot'], name='movies_slot_movie_date_idx'),
+        ]
+
+
+class SeatMap(models.Model):
+    """
+    Compact seat map of a slot, every seat is one bit in the booked and held bitmaps
+    """
+    slot = models.OneToOneField(Slot, related_name='seat_map')
+    booked = models.BinaryField()
+    held = models.BinaryField()
+
+    @staticmethod
+    def empty_bitmap(seats):
+        return bytes(bytearray((seats + 7) // 8))
+
+    def _bitmaps(self):
+        if not hasattr(self, '_booked_bits'):
+            self._booked_bits = bytearray(self.booked)
+            self._held_bits = bytearray(self.held)
+        return self._booked_bits, self._held_bits
+
+    def is_free(self, seats):
+        """
+        returns True if none of the given 1-based seat numbers is booked or held
+        """
+        booked, held = self._bitmaps()
+        for seat in seats:
+            index, mask = (seat - 1) >> 3, 1 << ((seat - 1) & 7)
+            if (booked[index] | held[index]) & mask:
+                return False
+        return True
+
+    def hold(self, seats):
+        booked, held = self._bitmaps()
+        for seat in seats:
+            held[(seat - 1) >> 3] |= 1 << ((seat - 1) & 7)
+        self.held = bytes(held)
+
+    def release(self, seats):
+        booked, held = self._bitmaps()
+        for seat in seats:
+            held[(seat - 1) >> 3] &= ~(1 << ((seat - 1) & 7)) & 0xff
+        self.held = bytes(held)
+
+    def book(self, seats):
+        """
+        converts held seats into booked seats
+        """
+        self.release(seats)
+        booked, held = self._bitmaps()
+        for seat in seats:
+            booked[(seat - 1) >> 3] |= 1 << ((seat - 1) & 7)
+        self.booked = bytes(booked)
+
+
+class SeatDelta(models.Model):
+    """
+    journal of the seat changes made through the in-memory seat counters that are not yet written back to the slot
+    """
+    slot = models.ForeignKey(Slot, related_name='seat_deltas')
+    delta = models.IntegerField()
+
+
+class NowShowingManager(models.Manager):
+    # one backward scan of the (movie, date, slot) index per movie, movies without slots left lose their entry
+    refresh_sql = """
+        WITH last_show AS (
+            SELECT movie.id AS movie_id, show.date, show.slot
+            FROM unnest(%s) AS movie(id)
+            CROSS JOIN LATERAL (
+                SELECT date, slot FROM movies_slot
+                WHERE movie_id = movie.id
+                ORDER BY date DESC, slot DESC
+                LIMIT 1
+            ) show
+        ), removed AS (
+            DELETE FROM movies_nowshowing
+            WHERE movie_id = ANY(%s) AND movie_id NOT IN (SELECT movie_id FROM last_show)
+        )
+        INSERT INTO movies_nowshowing (movie_id, last_date, last_slot)
+        SELECT movie_id, date, slot FROM last_show
+        ON CONFLICT (movie_id) DO UPDATE SET last_date = EXCLUDED.last_date, last_slot = EXCLUDED.last_slot
+    """
+
+    def showing(self):
+        """
+        returns the catalogue entries of movies whose last show has not started yet
+        """
+        today_date = datetime.date.today()
+        current_hour = datetime.datetime.now().hour
+        return self.filter(Q(last_date__gt=today_date) | Q(last_date=today_date, last_slot__gt=current_hour))
+
+    def expired(self):
+        today_date = datetime.date.today()
+        current_hour = datetime.datetime.now().hour
+        return self.filter(Q(last_date__lt=today_date) | Q(last_date=today_date, last_slot__lte=current_hour))
+
+    def refresh(self, movie_ids):
+        """
+        recomputes the last show of the given movies from the (movie, date, slot) index
+        after their slots have been created or deleted, in a single statement
+        """
+        movie_ids = sorted(set(movie_ids))
+        if movie_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(self.refresh_sql, [movie_ids, movie_ids])
+
+
+class NowShowing(models.Model):
+    """
+    Precomputed now showing catalogue, stores the last scheduled show of every movie with upcoming shows
+    """
+    movie = models.OneToOneField(Movie, primary_key=True, related_name='now_showing')
+    last_date = models.DateField()
+    last_slot = models.PositiveIntegerField()
+
+    objects = NowShowingManager()
+
+    class Meta:
+        index_together = ('last_date', 'last_slot')
+
+
+class ShowtimeManager(models.Manager):
+    copy_sql = """
+        INSERT INTO movies_showtime (
+            slot_id, movie_id, date, hour, movie_type, movie_language, seats_available,
+            theatre_id, theatre_name, audi_id, audi_name)
+        SELECT slot.id, slot.movie_id, slot.date, slot.slot, slot.movie_type, slot.movie_language,
+               slot.seats_available, theatre.id, theatre.name, audi.id, audi.name
+        FROM movies_slot slot
+        JOIN movies_auditorium audi ON audi.id = slot.audi_id
+        JOIN movies_theatre theatre ON theatre.id = audi.theatre_id
+        WHERE slot.movie_id = ANY(%s) AND slot.date >= %s
+        ON CONFLICT (slot_id) DO NOTHING
+    """
+
+    def upcoming(self):
+        today_date = datetime.date.today()
+        current_hour = datetime.datetime.now().hour
+        return self.filter(Q(date__gt=today_date) | Q(date=today_date, hour__gt=current_hour))
+
+    def past(self):
+        return self.filter(date__lt=datetime.date.today())
+
+    def refresh(self, movie_ids):
+        """
+        copies the slots of the given movies from today on that are not in the read model yet, after slots
+        have been created. Deleted slots take their showtime with them.
+        """
+        movie_ids = sorted(set(movie_ids))
+        if movie_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(self.copy_sql, [movie_ids, datetime.date.today()])
+
+    def add_seats(self, slot_id, seats):
+        self.filter(slot_id=slot_id).update(seats_available=F('seats_available') + seats)
+
+
+class Showtime(models.Model):
+    """
+    Denormalized read model of the movie detail, a copy of every slot from today on with the names of its
+    theatre and auditorium. Rows are added after slots are created, follow the seats of their slot and
+    are deleted together with it.
+    """
+    slot = models.OneToOneField(Slot, primary_key=True, related_name='showtime')
+    movie = models.ForeignKey(Movie, db_index=False)
+    date = models.DateField()
+    hour = models.PositiveIntegerField()
+    movie_type = models.CharField(max_length=MAX_LENGTH_DICT["SMALL"])
+    movie_language = models.CharField(max_length=MAX_LENGTH_DICT["LANGUAGE"])
+    seats_available = models.PositiveIntegerField()
+    theatre_id = models.PositiveIntegerField()
+    theatre_name = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
+    audi_id = models.PositiveIntegerField()
+    audi_name = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
+
+    objects = ShowtimeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['movie', 'date', 'hour'], name='movies_showtime_movie_idx'),
+        ]
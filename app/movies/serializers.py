@@ -1,19 +1,20 @@
 import datetime
+import itertools
 
 from rest_framework import serializers
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 
-from app.commons.constants import ERROR_MESSAGES
-from app.movies.models import Auditorium, Theatre, Movie, Slot
-from app.users.models import Booking
+from app.commons.constants import ERROR_MESSAGES, MAX_LENGTH_DICT
+from app.commons.transactions import atomic
+from app.movies.models import Auditorium, Theatre, Movie, NowShowing, Showtime, Slot
+from app.users.models import Booking, BookingRequest, SeatHold
 
-from app.users.tasks import send_cancelled_ticket_task
-from app.movies.utils import FreeSlotUtil
-from app.commons.constants import STATUS
+from app.users.utils import CancellationUtil
+from app.movies.utils import (
+    BookingQueueUtil, MovieCacheUtil, SeatCounterUtil, SeatEventUtil, SeatHoldUtil, ShowtimeUtil, SlotCalendar)
 
 
 class TheatreSerializer(serializers.ModelSerializer):
@@ -22,9 +23,18 @@ class TheatreSerializer(serializers.ModelSerializer):
     """
     class Meta(object):
         model = Theatre
-        fields = ('id', 'name', 'city', 'state', 'zipcode')
+        fields = ('id', 'name', 'city', 'state', 'zipcode', 'latitude', 'longitude')
         read_only_fields = ('id', )
 
+    def validate(self, data):
+        """
+        validates that a location is given with both coordinates or none
+        """
+        coordinates = [data.get(field, getattr(self.instance, field, None)) for field in ('latitude', 'longitude')]
+        if coordinates.count(None) == 1:
+            raise ValidationError(ERROR_MESSAGES["INCOMPLETE_LOCATION"])
+        return data
+
 
 class AudiSerializer(serializers.ModelSerializer):
     """
@@ -51,16 +61,12 @@ class AudiSerializer(serializers.ModelSerializer):
         """
         overriding update to notify users if their booked slots have altered
         """
-        recipient_users = []
         new_slots = range(validated_data["opening_time"], (validated_data["closing_time"]-2), 3)
         booked_slots = Slot.objects.filter(audi_id=self.instance.id).values_list('slot', flat=True)
         removed_slots = list(set(booked_slots)-set(new_slots))
-        slots = Slot.objects.filter(slot__in=removed_slots).values_list('id', flat=True)
-        users_booking = Booking.objects.filter(slot__in=slots).select_related('user').order_by('user').distinct('user')
-        Booking.objects.filter(slot__in=slots).update(booking_status=STATUS["CANCELLED"])
-        for booking in users_booking:
-            recipient_users.append(booking.user.email)
-        send_cancelled_ticket_task.delay(recipient_users)
+        CancellationUtil().cancel(
+            Booking.objects.filter(slot__audi_id=self.instance.id, slot__slot__in=removed_slots)
+        )
         return super(AudiSerializer, self).update(instance, validated_data)
 
 
@@ -72,7 +78,7 @@ class TheatreDetailSerializer(serializers.ModelSerializer):
 
     class Meta(object):
         model = Theatre
-        fields = ('name', 'city', 'state', 'zipcode', 'auditoriums')
+        fields = ('name', 'city', 'state', 'zipcode', 'latitude', 'longitude', 'auditoriums')
 
 
 class MovieSerializer(serializers.ModelSerializer):
@@ -85,22 +91,37 @@ class MovieSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', )
 
 
+class MovieSearchQuerySerializer(serializers.Serializer):
+    """
+    validates a movie search, languages and formats are repeatable parameters that all have to match
+    """
+    q = serializers.CharField(required=False, max_length=MAX_LENGTH_DICT["LONG"])
+    language = serializers.ListField(
+        child=serializers.CharField(max_length=MAX_LENGTH_DICT["LANGUAGE"]), required=False)
+    movie_type = serializers.ListField(
+        child=serializers.CharField(max_length=MAX_LENGTH_DICT["SMALL"]), required=False)
+
+
+class SeatEventQuerySerializer(serializers.Serializer):
+    """
+    validates the slots a seat event stream is limited to, repeatable, all upcoming slots of the movie by default
+    """
+    slot = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+
 class MovieDetailSerializer(serializers.ModelSerializer):
     """
-    Serializer for Movie model fields for retrievaloperation
+    Serializer for Movie model fields for retrievaloperation, the upcoming shows are grouped by date,
+    theatre and auditorium
     """
-    slots = serializers.SerializerMethodField()
+    showtimes = serializers.SerializerMethodField()
 
     class Meta(object):
         model = Movie
-        fields = ('id', 'name', 'duration', 'about', 'language', 'movie_type', 'slots')
+        fields = ('id', 'name', 'duration', 'about', 'language', 'movie_type', 'showtimes')
 
-    def get_slots(self, obj):
-        today_date = datetime.date.today()
-        current_hour = datetime.datetime.now().hour
-        return SlotSerializer(Slot.objects.filter(
-            Q(date__gt=today_date) |
-            Q(date=today_date, slot__gt=current_hour), movie=obj).order_by('date'), many=True).data
+    def get_showtimes(self, obj):
+        return ShowtimeUtil().get_movie_showtimes(obj.id)
 
 
 class SlotSerializer(serializers.ModelSerializer):
@@ -129,6 +150,8 @@ class TotalFreeSlotSerializer(serializers.Serializer):
     serializer returns the free slots of each auditorium along with audi details
     """
     free_slots = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    free_slots_by_date = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()), read_only=True)
+    calendar = serializers.ListField(child=serializers.IntegerField(), read_only=True)
     audi = FreeSlotSerializer(read_only=True)
 
     def validate(self, data):
@@ -140,6 +163,31 @@ class TotalFreeSlotSerializer(serializers.Serializer):
         return data
 
 
+class ShowtimeQuerySerializer(serializers.Serializer):
+    """
+    validates the location and date of a showtime search, the date defaults to today
+    """
+    city = serializers.CharField(required=False)
+    zipcode = serializers.IntegerField(required=False, min_value=0)
+    latitude = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius = serializers.FloatField(required=False, min_value=0.1, max_value=100, default=10)
+    date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        located = 'latitude' in data and 'longitude' in data
+        if not (data.get('city') or data.get('zipcode') or located):
+            raise ValidationError(ERROR_MESSAGES["LOCATION_REQUIRED"])
+        data['date'] = data.get('date') or datetime.date.today()
+        if data['date'] < datetime.date.today():
+            raise ValidationError(ERROR_MESSAGES["PAST_DATE"])
+        if not located:
+            data.pop('latitude', None)
+            data.pop('longitude', None)
+            data.pop('radius')
+        return data
+
+
 class MovieBookingSerializer(serializers.ModelSerializer):
     """
     serializer for user booking for any movie
@@ -149,20 +197,71 @@ class MovieBookingSerializer(serializers.ModelSerializer):
         fields = ('slot', 'seats_booked',)
 
     def validate(self, data):
-        if self.context['slot'].seats_available < data['seats_booked']:
+        if SeatCounterUtil().available(self.context['slot']) < data['seats_booked']:
             raise ValidationError(ERROR_MESSAGES["INADEQUATE_SEATS_REQUESTED"])
         return data
 
-    @transaction.atomic()
+    @atomic()
     def create(self, validated_data):
+        """
+        creates the booking and then takes the seats with a conditional decrement so that
+        the slot row stays locked only for the tail of the transaction and can never oversell
+        """
         validated_data["user"] = self.context['request'].user
         validated_data["booking_status"] = "Confirmed"
         booking_obj = super(MovieBookingSerializer, self).create(validated_data)
-        self.context['slot'].seats_available = self.context['slot'].seats_available - validated_data["seats_booked"]
-        self.context['slot'].save()
+        remaining = SeatCounterUtil().reserve(validated_data["slot"].id, validated_data["seats_booked"])
+        if remaining is None:
+            raise serializers.ValidationError(ERROR_MESSAGES["SOLD_OUT"])
+        MovieCacheUtil().invalidate([validated_data["slot"].movie_id], lists=False)
+        SeatEventUtil().publish(
+            validated_data["slot"].id, validated_data["slot"].movie_id, -validated_data["seats_booked"],
+            seats=remaining)
         return booking_obj
 
 
+class BookingRequestSerializer(serializers.ModelSerializer):
+    """
+    serializer for queued bookings, a request is only admitted while the slot may still have the seats
+    """
+    url = serializers.HyperlinkedIdentityField(view_name='movie:booking_request')
+
+    class Meta(object):
+        model = BookingRequest
+        fields = ('id', 'url', 'slot', 'seats_booked', 'status', 'booking', 'error')
+        read_only_fields = ('id', 'status', 'booking', 'error', )
+
+    def validate(self, data):
+        if data['seats_booked'] < 1:
+            raise ValidationError(ERROR_MESSAGES["INADEQUATE_SEATS_REQUESTED"])
+        if not BookingQueueUtil().admit(data['slot'], data['seats_booked']):
+            raise ValidationError(ERROR_MESSAGES["SOLD_OUT"])
+        return data
+
+    def create(self, validated_data):
+        validated_data["user"] = self.context['request'].user
+        return super(BookingRequestSerializer, self).create(validated_data)
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    """
+    serializer for holding specific seats of a slot before the booking is confirmed
+    """
+    class Meta(object):
+        model = SeatHold
+        fields = ('id', 'slot', 'seats', 'expires_at')
+        read_only_fields = ('id', 'expires_at', )
+
+    def validate(self, data):
+        seats = data['seats']
+        if not seats or len(set(seats)) != len(seats) or min(seats) < 1 or max(seats) > data['slot'].audi.seats:
+            raise ValidationError(ERROR_MESSAGES["INVALID_SEATS"])
+        return data
+
+    def create(self, validated_data):
+        return SeatHoldUtil().hold(self.context['request'].user, validated_data['slot'], validated_data['seats'])
+
+
 class BookingDetailDetailserializer(serializers.ModelSerializer):
     """
     serilaizer for the booking details of the user
@@ -186,6 +285,63 @@ class BookingsSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class BookingMovieSerializer(serializers.Serializer):
+    """
+    movie fields of a booking summary row
+    """
+    id = serializers.IntegerField(source='slot__movie_id')
+    name = serializers.CharField(source='slot__movie__name')
+
+
+class BookingAudiSerializer(serializers.Serializer):
+    """
+    auditorium fields of a booking summary row
+    """
+    id = serializers.IntegerField(source='slot__audi_id')
+    name = serializers.CharField(source='slot__audi__name')
+
+
+class BookingSlotSerializer(serializers.Serializer):
+    """
+    slot fields of a booking summary row
+    """
+    id = serializers.IntegerField(source='slot_id')
+    date = serializers.DateField(source='slot__date')
+    slot = serializers.IntegerField(source='slot__slot')
+    movie_type = serializers.CharField(source='slot__movie_type')
+    movie_language = serializers.CharField(source='slot__movie_language')
+    movie = BookingMovieSerializer(source='*')
+    audi = BookingAudiSerializer(source='*')
+
+
+class BookingSummarySerializer(serializers.Serializer):
+    """
+    read only serializer for the rows of Booking.objects.values(*BookingSummarySerializer.value_fields),
+    keeps only what a ticket shows instead of every field of the slot, movie and auditorium
+    """
+    value_fields = (
+        'id', 'seats_booked', 'booking_status', 'seat_numbers',
+        'slot_id', 'slot__date', 'slot__slot', 'slot__movie_type', 'slot__movie_language',
+        'slot__movie_id', 'slot__movie__name', 'slot__audi_id', 'slot__audi__name',
+    )
+
+    id = serializers.IntegerField()
+    seats_booked = serializers.IntegerField()
+    booking_status = serializers.CharField()
+    seat_numbers = serializers.ListField(child=serializers.IntegerField())
+    slot = BookingSlotSerializer(source='*')
+
+
+class BookingExportSerializer(BookingSummarySerializer):
+    """
+    the booking summary with its booker, for the admin export of every user's bookings
+    """
+    value_fields = BookingSummarySerializer.value_fields + ('user_id', 'user__email')
+
+    user = serializers.IntegerField(source='user_id')
+    user_email = serializers.CharField(source='user__email')
+
+
 class SlotBookingSerializer(serializers.Serializer):
     """
     serializer for booking shows for particular movie
@@ -197,6 +353,8 @@ class SlotBookingSerializer(serializers.Serializer):
     movie = serializers.IntegerField()
     audiSlots = serializers.DictField()
 
+    batch_size = 1000
+
     def validate(self, data):
         """
         validates that the start date should be less than equal to end date
@@ -213,34 +371,55 @@ class SlotBookingSerializer(serializers.Serializer):
             raise ValidationError(ERROR_MESSAGES["INVALID_OPEN_CLOSE_DATE"])
         if (data["opening_date"] <= today_date or data["closing_date"] <= today_date):
             raise ValidationError(ERROR_MESSAGES["INVALID_DATE"])
-        if not ((Auditorium.objects.filter(id__in=data["audiSlots"].keys()).exists())):
+        try:
+            audi_slots = dict((int(audi), [int(slot) for slot in slots]) for audi, slots in data["audiSlots"].items())
+        except (TypeError, ValueError):
+            raise ValidationError(ERROR_MESSAGES["INVALID_SLOT"])
+        if not audi_slots:
+            raise ValidationError(ERROR_MESSAGES["INVALID_AUDI"])
+        if any(not 0 <= slot < SlotCalendar.slots_per_day for slots in audi_slots.values() for slot in slots):
+            raise ValidationError(ERROR_MESSAGES["INVALID_SLOT"])
+        calendar = SlotCalendar(
+            Auditorium.objects.filter(id__in=audi_slots.keys()), data["opening_date"], data["closing_date"])
+        if len(calendar.audis) != len(audi_slots):
             raise ValidationError(ERROR_MESSAGES["INVALID_AUDI"])
-        for audi, slots in data["audiSlots"].items():
-            audi_obj = Auditorium.objects.get(id=audi)
-            free_slots = FreeSlotUtil().get_free_slots(audi_obj, data["opening_date"], data["closing_date"])
-            if not len(set(slots).intersection(set(free_slots))):
+        for audi in calendar.audis:
+            if not calendar.is_free(audi, audi_slots[audi.id]):
                 raise ValidationError(ERROR_MESSAGES["INVALID_SLOT"])
+        self.audis = calendar.audis
+        data["audiSlots"] = dict((str(audi), slots) for audi, slots in audi_slots.items())
         return data
 
+    @transaction.atomic()
     def create(self, validated_data):
-        audis = []
-        slot_objects = []
-        for audi in validated_data["audiSlots"]:
-            audis.append(int(audi))
-        audi_seats = Auditorium.objects.filter(id__in=audis).values_list('id', 'seats')
+        """
+        inserts the slots in chunks, overlapping schedules that slipped past validate are
+        rejected by the unique (date, slot, audi) constraint and roll the whole schedule back.
+        The read models are refreshed in the same transaction, readers never see the slots without them.
+        """
+        slot_objects = self.get_slot_objects(validated_data)
+        try:
+            while True:
+                batch = list(itertools.islice(slot_objects, self.batch_size))
+                if not batch:
+                    break
+                Slot.objects.bulk_create(batch)
+        except IntegrityError:
+            raise serializers.ValidationError(ERROR_MESSAGES["INVALID_SLOT"])
+        NowShowing.objects.refresh([validated_data["movie"]])
+        Showtime.objects.refresh([validated_data["movie"]])
+        return {}
+
+    def get_slot_objects(self, validated_data):
         delta = validated_data["closing_date"] - validated_data["opening_date"]
         for date in range(delta.days+1):
-            for audi_seat in audi_seats:
-                audi = audi_seat[0]
-                for slot in validated_data["audiSlots"][str(audi)]:
-                    slot_object = Slot(
+            for audi in self.audis:
+                for slot in validated_data["audiSlots"][str(audi.id)]:
+                    yield Slot(
                         movie_id=validated_data["movie"],
-                        audi_id=int(audi),
+                        audi_id=audi.id,
                         slot=slot,
-                        seats_available=audi_seat[1],
+                        seats_available=audi.seats,
                         date=validated_data["opening_date"]+datetime.timedelta(days=date),
                         movie_type=validated_data["movie_type"],
                         movie_language=validated_data["movie_language"])
-                    slot_objects.append(slot_object)
-        Slot.objects.bulk_create(slot_objects)
-        return {}
@@ -0,0 +1,45 @@
+from celery.decorators import task
+
+from app.movies.models import NowShowing, Showtime
+from app.movies.serializers import BookingSummarySerializer
+from app.movies.utils import BookingQueueUtil, SeatCounterUtil, SeatHoldUtil
+from app.users.models import Booking
+from app.users.tasks import user_ticket_task
+
+
+@task(name="release_expired_holds_task")
+def release_expired_holds_task():
+    return SeatHoldUtil().release_expired_holds()
+
+
+@task(name="expire_now_showing_task")
+def expire_now_showing_task():
+    NowShowing.objects.expired().delete()
+
+
+@task(name="expire_showtimes_task")
+def expire_showtimes_task():
+    return Showtime.objects.past().delete()[0]
+
+
+@task(name="flush_seat_counters_task")
+def flush_seat_counters_task():
+    return SeatCounterUtil().flush()
+
+
+@task(name="process_booking_queue_task")
+def process_booking_queue_task(slot_id):
+    booking_ids = BookingQueueUtil().process(slot_id)
+    bookings = Booking.objects.filter(id__in=booking_ids).values('user__email', *BookingSummarySerializer.value_fields)
+    for booking in bookings:
+        user_ticket_task.delay(booking['user__email'], BookingSummarySerializer(booking).data)
+    return len(booking_ids)
+
+
+@task(name="process_pending_booking_queues_task")
+def process_pending_booking_queues_task():
+    """
+    picks up the queues whose job was lost, e.g. when the broker was down while the request was admitted
+    """
+    for slot_id in BookingQueueUtil().pending_slots():
+        process_booking_queue_task(slot_id)
@@ -1,18 +1,49 @@
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import datetime
+import logging
+import os
+import threading
+import time
+import unittest
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.db import OperationalError, connection
+import psycopg2
+from psycopg2 import extensions
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django_dynamic_fixture import G
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
 
 from app.movies.models import Theatre
-from app.movies.models import Auditorium, Theatre, Movie
-from app.users.models import User
+from app.movies.models import Auditorium, Theatre, Movie, NowShowing, SeatDelta, Showtime, Slot
+from app.movies.serializers import SlotBookingSerializer
+from app.commons.db.base import DatabaseWrapper as PooledDatabaseWrapper
+from app.commons.db.pool import ConnectionPool, connection_pools
+from app.commons.green import make_wait_callback, select_wait_read, select_wait_write
+from app.commons.metrics import registry, slow_query_logger
+from app.commons.transactions import atomic
+from app.movies.management.commands.benchmark_suite import Command as BenchmarkSuiteCommand
+from app.movies.management.commands.generate_benchmark_data import BenchmarkDataset
+from app.movies.utils import BookingQueueUtil, MovieCacheUtil, SeatCounterUtil, SeatEventUtil, SeatHoldUtil
+from app.users.models import Booking, BookingRequest, CancelledTicket, IdempotencyKey, SeatHold, User
+from app.users.tasks import (
+    user_ticket_task, send_cancelled_ticket_task, send_cancellation_mails_task, expire_idempotency_keys_task
+)
 
 import json
 
+# the configured broker needs a redis, the tests whose transactions commit publish within the process
+LOCAL_BROKER = {'BACKEND': 'app.commons.pubsub.LocalBroker', 'OPTIONS': {}}
+
 
 class TestTheatreCreate(APITestCase):
     """
@@ -101,12 +132,16 @@ class TestListTheatreAPI(APITestCase):
             'city': "noida",
             'state': "Delhi",
             'zipcode': 123456,
+            'latitude': None,
+            'longitude': None,
         }, {
             'id': 2,
             'name': "T2",
             'city': "lko",
             'state': "UP",
             'zipcode': 123356,
+            'latitude': None,
+            'longitude': None,
         },
             {
                 'id': 3,
@@ -114,6 +149,8 @@ class TestListTheatreAPI(APITestCase):
                 'city': "gurugram",
                 'state': "haryana",
                 'zipcode': 111456,
+                'latitude': None,
+                'longitude': None,
             }
         ]
 
@@ -128,6 +165,8 @@ class TestListTheatreAPI(APITestCase):
                     city=self.theatres_data[i]['city'],
                     state=self.theatres_data[i]['state'],
                     zipcode=self.theatres_data[i]['zipcode'],
+                    latitude=self.theatres_data[i]['latitude'],
+                    longitude=self.theatres_data[i]['longitude'],
                 ))
 
     def test_theatre_data(self):
@@ -137,7 +176,7 @@ class TestListTheatreAPI(APITestCase):
         response = self.client.get(self.url)
 
         for i in range(0, 2):
-            self.assertDictEqual(response.data[i], self.theatres_data[i])
+            self.assertDictEqual(response.data['results'][i], self.theatres_data[i])
 
     def test_list_theatre_api(self):
         """
@@ -145,7 +184,7 @@ class TestListTheatreAPI(APITestCase):
         """
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), len(self.theatres))
+        self.assertEqual(len(response.data['results']), len(self.theatres))
 
 
 class TestListAudiAPI(APITestCase):
@@ -281,6 +320,67 @@ class TestUpdateAudiAPI(APITestCase):
         self.assertEqual(response.data["closing_time"], self.data["closing_time"])
 
 
+@override_settings(PUBSUB_BROKER=LOCAL_BROKER)
+class TestCancellationMails(APITransactionTestCase):
+    """
+    this class tests the batched cancellation mails sent when shows are removed
+    """
+    def setUp(self):
+        send_cancellation_mails_task.app.conf.task_always_eager = True
+        self.theatre = G(Theatre)
+        self.audi = G(Auditorium, theatre=self.theatre, opening_time=9, closing_time=21)
+        self.other_audi = G(Auditorium, theatre=self.theatre, opening_time=9, closing_time=21)
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+        self.slots = [G(Slot, audi=self.audi, movie=self.movie, date=self.date, slot=slot) for slot in (9, 18)]
+        self.other_slot = G(Slot, audi=self.other_audi, movie=self.movie, date=self.date, slot=18)
+        self.first, self.second = G(User, is_admin=False), G(User, is_admin=False)
+        for slot in self.slots + [self.other_slot]:
+            G(Booking, user=self.first, slot=slot, seats_booked=2, booking_status="Confirmed")
+        G(Booking, user=self.second, slot=self.slots[0], seats_booked=1, booking_status="Confirmed")
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        self.kwargs = {"pk": self.audi.id, "theatreId": self.theatre.id}
+
+    def test_one_mail_per_user(self):
+        """
+        check that deleting an audi mails each affected user once, listing all of their tickets
+        """
+        response = self.client.delete(reverse('movie:audi-detail', kwargs=self.kwargs))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted([self.first.email, self.second.email]))
+        first_mail = [message for message in mail.outbox if message.to == [self.first.email]][0]
+        self.assertEqual(first_mail.body.count('You had booked 2 tickets'), 2)
+        self.assertFalse(CancelledTicket.objects.exists())
+
+    def test_single_job_per_deletion(self):
+        """
+        check that the deletion enqueues one job, and the job reports its throughput
+        """
+        with self.settings(CANCELLATION_MAIL_BATCH_SIZE=1):
+            self.client.delete(reverse('movie:slot_delete', kwargs={"pk": self.slots[0].id}))
+        self.assertEqual(len(mail.outbox), 2)
+        G(Booking, user=self.first, slot=self.slots[1], seats_booked=1, booking_status="Confirmed")
+        bookings = Booking.objects.filter(slot=self.slots[1])
+        batch = 'manual'
+        CancelledTicket.objects.create_batch(batch, bookings)
+        stats = send_cancellation_mails_task(batch)
+        self.assertEqual((stats['mails'], stats['tickets']), (1, 2))
+        self.assertIn('mails_per_second', stats)
+
+    def test_update_audi_cancels_removed_slots(self):
+        """
+        check that shrinking the timings of an audi only cancels the shows of that audi
+        """
+        data = {"name": "A9", "seats": 10, "opening_time": 9, "closing_time": 15}
+        response = self.client.patch(reverse('movie:audi-detail', kwargs=self.kwargs), data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message.to for message in mail.outbox], [[self.first.email]])
+        self.assertEqual(
+            list(Booking.objects.filter(booking_status="Cancelled").values_list('slot_id', flat=True)),
+            [self.slots[1].id]
+        )
+
+
 class TestCreateMovie(APITestCase):
     """
     this class tests the movie creation API
@@ -369,7 +469,7 @@ class TestMovieListAPI(APITestCase):
         """
         response = self.client.get(self.url)
         for i in range(0, 2):
-            self.assertDictEqual((response.data[i]), self.movie_data[i])
+            self.assertDictEqual((response.data['results'][i]), self.movie_data[i])
 
     def test_list_movie_api(self):
         """
@@ -377,4 +477,1258 @@ class TestMovieListAPI(APITestCase):
         """
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), len(self.movies))
+        self.assertEqual(len(response.data['results']), len(self.movies))
+
+
+class TestMovieBookingAPI(APITestCase):
+    """
+    this class tests the booking of seats in a slot
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.slot = G(Slot, seats_available=5, slot=12)
+        self.url = reverse('movie:booking', kwargs={"movieId": self.slot.movie_id})
+
+    def test_booking_decrements_seats(self):
+        """
+        check that a successful booking takes the seats from the slot
+        """
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 3})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 2)
+
+    def test_booking_more_than_available(self):
+        """
+        check that the slot is never oversold and no booking is left behind
+        """
+        self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 3})
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 2)
+        self.assertEqual(Booking.objects.filter(slot=self.slot).count(), 1)
+
+    def test_booking_query_budget(self):
+        """
+        check that booking does not re-query the bookings of the user to build the ticket mail
+        """
+        for _ in range(5):
+            G(Booking, user=self.user, seats_booked=1)
+        with self.assertNumQueries(8):
+            response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_reserve_seats_is_conditional(self):
+        """
+        check that the conditional decrement refuses to go below zero
+        """
+        self.assertIsNone(Slot.objects.reserve_seats(self.slot.id, 6))
+        self.assertEqual(Slot.objects.reserve_seats(self.slot.id, 5), 0)
+        self.assertIsNone(Slot.objects.reserve_seats(self.slot.id, 1))
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 0)
+
+
+@override_settings(PUBSUB_BROKER=LOCAL_BROKER)
+class TestBookingQueueAPI(APITransactionTestCase):
+    """
+    this class tests the queued booking intake and its workers
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        caches[settings.BOOKING_QUEUE_ALIAS].clear()
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.slot = G(Slot, seats_available=3, slot=12)
+        self.url = reverse('movie:booking_queue', kwargs={"movieId": self.slot.movie_id})
+
+    def test_queued_booking_is_confirmed(self):
+        """
+        check that a queued request is admitted, booked by the worker and reported on the poll url
+        """
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Location'], response.data['url'])
+        poll = self.client.get(response.data['url'])
+        self.assertEqual(poll.data['status'], "Confirmed")
+        self.assertFalse(poll.has_header('Retry-After'))
+        self.assertEqual(Booking.objects.get(id=poll.data['booking']).seats_booked, 2)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 1)
+
+    def test_sold_out_slot_is_refused_at_admission(self):
+        """
+        check that requests beyond the admission count are refused before they are queued
+        """
+        self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(BookingRequest.objects.count(), 1)
+        # the count lives in the cache shared with the workers
+        self.assertEqual(caches[settings.BOOKING_QUEUE_ALIAS].get(BookingQueueUtil().admission_key(self.slot.id)), 1)
+
+    def test_batch_is_processed_in_order(self):
+        """
+        check that the worker books the queue of a slot in arrival order in one batch
+        """
+        requests = [G(BookingRequest, user=self.user, slot=self.slot, seats_booked=seats, status="Pending",
+                      booking=None, error='') for seats in (2, 2, 1)]
+        with self.assertNumQueries(7):
+            booking_ids = BookingQueueUtil().process(self.slot.id)
+        self.assertEqual(len(booking_ids), 2)
+        self.assertEqual(
+            [BookingRequest.objects.get(id=request.id).status for request in requests],
+            ["Confirmed", "Rejected", "Confirmed"]
+        )
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 0)
+
+    def test_pending_request_asks_to_retry(self):
+        booking_request = G(BookingRequest, user=self.user, slot=self.slot, seats_booked=1, status="Pending",
+                            booking=None, error='')
+        with self.assertNumQueries(1):
+            poll = self.client.get(reverse('movie:booking_request', kwargs={"pk": booking_request.id}))
+        self.assertEqual(poll.data['status'], "Pending")
+        self.assertEqual(poll['Retry-After'], str(settings.BOOKING_POLL_RETRY_AFTER))
+
+    def test_requests_of_other_users_are_hidden(self):
+        """
+        check that a user can only poll their own requests
+        """
+        booking_request = G(BookingRequest, slot=self.slot, seats_booked=1, booking=None)
+        response = self.client.get(reverse('movie:booking_request', kwargs={"pk": booking_request.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SEAT_COUNTER_ENABLED=True)
+class TestSeatCounter(APITestCase):
+    """
+    this class tests the in-memory seat counters and their write-behind to the slots
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        caches[settings.SEAT_COUNTER_ALIAS].clear()
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.user = G(User, is_admin=True)
+        self.client.force_authenticate(user=self.user)
+        self.slot = G(Slot, seats_available=5, slot=12, date=datetime.date.today() + datetime.timedelta(days=1))
+        Showtime.objects.refresh([self.slot.movie_id])
+        self.url = reverse('movie:booking', kwargs={"movieId": self.slot.movie_id})
+
+    def test_booking_is_written_behind(self):
+        """
+        check that a booking only journals the seats and the flush writes them back to the slot
+        """
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Slot.objects.get(id=self.slot.id).seats_available, 5)
+        self.assertEqual(SeatCounterUtil().available(self.slot), 3)
+        self.assertEqual(SeatCounterUtil().flush(), 1)
+        self.assertEqual(Slot.objects.get(id=self.slot.id).seats_available, 3)
+        self.assertEqual(Showtime.objects.get(slot=self.slot).seats_available, 3)
+        self.assertFalse(SeatDelta.objects.exists())
+
+    def test_counter_refuses_to_oversell(self):
+        """
+        check that a sold out slot is refused by the counter without any booking left behind
+        """
+        self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 4})
+        self.assertIsNone(SeatCounterUtil().reserve(self.slot.id, 2))
+        response = self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Booking.objects.filter(slot=self.slot).count(), 1)
+        self.assertEqual(SeatCounterUtil().available(self.slot), 1)
+
+    def test_rolled_back_claim_is_given_back(self):
+        """
+        check that seats claimed in a transaction that rolls back return to the counter, also when only an
+        enclosing block fails after the booking block succeeded
+        """
+        counter = SeatCounterUtil()
+        counter.available(self.slot)
+        for nested in (False, True):
+            with self.assertRaises(RuntimeError):
+                with atomic():
+                    if nested:
+                        with atomic():
+                            counter.reserve(self.slot.id, 2)
+                    else:
+                        counter.reserve(self.slot.id, 2)
+                    self.assertEqual(counter.available(self.slot), 3)
+                    raise RuntimeError()
+            self.assertEqual(counter.available(self.slot), 5)
+        self.assertFalse(SeatDelta.objects.exists())
+
+    def test_failed_batch_gives_the_claims_back(self):
+        """
+        check that the seats claimed by a queue batch return to the counter when the bookings cannot be written
+        """
+        counter = SeatCounterUtil()
+        counter.available(self.slot)
+        for seats in (2, 1):
+            G(BookingRequest, user=self.user, slot=self.slot, seats_booked=seats, status="Pending", booking=None,
+              error='')
+
+        def bulk_create(objs, **kwargs):
+            raise RuntimeError()
+
+        Booking.objects.bulk_create = bulk_create
+        try:
+            with self.assertRaises(RuntimeError):
+                BookingQueueUtil().process_batch(self.slot.id)
+        finally:
+            del Booking.objects.bulk_create
+        self.assertEqual(counter.available(self.slot), 5)
+        self.assertEqual(BookingRequest.objects.filter(status="Pending").count(), 2)
+
+    def test_counter_is_reseeded_after_restart(self):
+        """
+        check that a lost counter is rebuilt from the slot and the unflushed journal
+        """
+        self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        caches[settings.SEAT_COUNTER_ALIAS].clear()
+        self.assertEqual(SeatCounterUtil().available(self.slot), 3)
+
+    def test_detail_reads_the_counters(self):
+        """
+        check that the movie detail shows the live seats of the slots before they are written back
+        """
+        self.client.post(self.url, {"slot": self.slot.id, "seats_booked": 2})
+        response = self.client.get(reverse('movie:movie-detail', kwargs={"pk": self.slot.movie_id}))
+        self.assertEqual(response.data['showtimes'][0]['theatres'][0]['audis'][0]['slots'][0]['seats_available'], 3)
+
+
+class TestIdempotentBookingAPI(APITestCase):
+    """
+    this class tests that retried bookings carrying an Idempotency-Key are only booked once
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.slot = G(Slot, seats_available=5, slot=12)
+        self.url = reverse('movie:booking', kwargs={"movieId": self.slot.movie_id})
+        self.data = {"slot": self.slot.id, "seats_booked": 2}
+
+    def book(self, data=None, key='retry-1'):
+        return self.client.post(self.url, data or self.data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_booking(self):
+        """
+        check that a retry gets the original response back from a single lookup and books nothing
+        """
+        first = self.book()
+        with self.assertNumQueries(1):
+            retry = self.book()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 3)
+        self.assertEqual(Booking.objects.filter(slot=self.slot).count(), 1)
+
+    def test_key_is_scoped_to_the_request(self):
+        """
+        check that a key cannot be reused for a different request while new keys book again
+        """
+        self.book()
+        response = self.book({"slot": self.slot.id, "seats_booked": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.book(key='retry-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.filter(slot=self.slot).count(), 2)
+
+    def test_key_is_scoped_to_the_endpoint(self):
+        """
+        check that the same key and body sent to the booking queue is not answered with the booking
+        """
+        self.book()
+        response = self.client.post(
+            reverse('movie:booking_queue', kwargs={"movieId": self.slot.movie_id}), self.data,
+            HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BookingRequest.objects.exists())
+
+    def test_mail_waits_for_the_commit(self):
+        """
+        check that the ticket mail is only queued once the booking and its key are committed
+        """
+        mail.outbox = []
+        # the test case never commits its transaction
+        self.assertEqual(self.book().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_request_keeps_key_free(self):
+        """
+        check that a rejected booking is not stored and the key can be used by the corrected retry
+        """
+        response = self.book({"slot": self.slot.id, "seats_booked": 6})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.book().status_code, status.HTTP_201_CREATED)
+
+    def test_expired_keys_are_evicted(self):
+        """
+        check that keys older than the ttl no longer replay and are removed by the periodic task
+        """
+        self.book()
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 1))
+        self.assertEqual(self.book().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.filter(slot=self.slot).count(), 2)
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 1))
+        self.assertEqual(expire_idempotency_keys_task(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class TestSeatHoldAPI(APITestCase):
+    """
+    this class tests holding specific seats and confirming them into a booking
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.audi = G(Auditorium, seats=20)
+        self.slot = G(Slot, audi=self.audi, seats_available=20, slot=12)
+        self.url = reverse('movie:seat_hold')
+
+    def test_hold_and_confirm(self):
+        """
+        check that held seats are taken from the slot and confirmed into a booking with seat numbers
+        """
+        response = self.client.post(self.url, json.dumps({"slot": self.slot.id, "seats": [1, 2, 9]}), content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 17)
+        url = reverse('movie:seat_hold_confirm', kwargs={"pk": response.data["id"]})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["seat_numbers"], [1, 2, 9])
+        self.assertEqual(response.data["seats_booked"], 3)
+        self.assertFalse(self.slot.seat_map.is_free([9]))
+
+    def test_held_seats_are_unavailable(self):
+        """
+        check that seats held by one user cannot be held again
+        """
+        self.client.post(self.url, json.dumps({"slot": self.slot.id, "seats": [4, 5]}), content_type="application/json")
+        response = self.client.post(self.url, json.dumps({"slot": self.slot.id, "seats": [5, 6]}), content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_seat_numbers(self):
+        """
+        check that seats outside the auditorium are rejected
+        """
+        response = self.client.post(self.url, json.dumps({"slot": self.slot.id, "seats": [21]}), content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_holds_are_released(self):
+        """
+        check that the sweeper gives expired seats back and the expired hold cannot be confirmed
+        """
+        hold = SeatHoldUtil().hold(self.user, self.slot, [3, 4])
+        SeatHold.objects.filter(id=hold.id).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(SeatHoldUtil().release_expired_holds(), 2)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.seats_available, 20)
+        response = self.client.post(reverse('movie:seat_hold_confirm', kwargs={"pk": hold.id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(SeatHoldUtil().hold(self.user, self.slot, [3, 4]))
+
+
+class TestFreeSlotsAPI(APITestCase):
+    """
+    this class tests the free slots of every auditorium for a date range
+    """
+    def setUp(self):
+        user = G(User, is_admin=True)
+        self.client.force_authenticate(user=user)
+        self.url = reverse('movie:free-slots')
+        self.start_date = datetime.date.today() + datetime.timedelta(days=1)
+        self.end_date = self.start_date + datetime.timedelta(days=1)
+        self.audis = [G(Auditorium, opening_time=9, closing_time=21) for _ in range(3)]
+        G(Slot, audi=self.audis[0], date=self.start_date, slot=12)
+
+    def test_free_slots_per_date(self):
+        """
+        check that a booked slot is only missing on its own date and from the whole range slots
+        """
+        response = self.client.get(self.url, {"start_date": self.start_date, "end_date": self.end_date})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audi_free_slots = [data for data in response.data if data["audi"]["id"] == self.audis[0].id][0]
+        self.assertEqual(audi_free_slots["free_slots_by_date"][str(self.start_date)], [9, 15, 18])
+        self.assertEqual(audi_free_slots["free_slots_by_date"][str(self.end_date)], [9, 12, 15, 18])
+        self.assertEqual(audi_free_slots["free_slots"], [9, 15, 18])
+        self.assertEqual(audi_free_slots["calendar"], [(1 << 9) | (1 << 15) | (1 << 18), (1 << 9) | (1 << 12) | (1 << 15) | (1 << 18)])
+
+    def test_free_slots_query_count(self):
+        """
+        check that the number of queries does not grow with the number of auditoriums
+        """
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {"start_date": self.start_date, "end_date": self.end_date})
+        G(Auditorium)
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {"start_date": self.start_date, "end_date": self.end_date})
+
+    def test_invalid_dates(self):
+        response = self.client.get(self.url, {"start_date": "someday", "end_date": self.end_date})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestSlotBookingAPI(APITestCase):
+    """
+    this class tests scheduling a movie in auditorium slots for a date range
+    """
+    def setUp(self):
+        user = G(User, is_admin=True)
+        self.client.force_authenticate(user=user)
+        self.url = reverse('movie:slot_booking')
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        self.audis = [G(Auditorium, opening_time=9, closing_time=21, seats=50) for _ in range(2)]
+        self.opening_date = datetime.date.today() + datetime.timedelta(days=1)
+        self.closing_date = self.opening_date + datetime.timedelta(days=2)
+        self.data = {
+            "opening_date": str(self.opening_date),
+            "closing_date": str(self.closing_date),
+            "movie_type": "2D",
+            "movie_language": "E",
+            "movie": self.movie.id,
+            "audiSlots": {str(self.audis[0].id): [9, 12], str(self.audis[1].id): [15]}
+        }
+
+    def post(self):
+        return self.client.post(self.url, json.dumps(self.data), content_type="application/json")
+
+    def test_schedule_slots(self):
+        """
+        check that every requested slot is created on every date of the range
+        """
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Slot.objects.filter(movie=self.movie).count(), 9)
+        self.assertEqual(Slot.objects.get(audi=self.audis[1], date=self.closing_date).seats_available, 50)
+
+    def test_conflict_on_a_single_date(self):
+        """
+        check that one booked slot on one date of the range rejects the whole request
+        """
+        G(Slot, audi=self.audis[0], date=self.closing_date, slot=12)
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Slot.objects.filter(movie=self.movie).exists())
+
+    def test_slot_outside_schedule(self):
+        """
+        check that slots which are not part of the auditorium schedule are rejected
+        """
+        self.data["audiSlots"][str(self.audis[1].id)] = [10]
+        self.assertEqual(self.post().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_audi(self):
+        """
+        check that every requested auditorium has to exist
+        """
+        self.data["audiSlots"]["0"] = [9]
+        self.assertEqual(self.post().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_empty_schedule(self):
+        self.data["audiSlots"] = {}
+        self.assertEqual(self.post().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_slot_out_of_range(self):
+        """
+        check that hours outside of the day are rejected before they reach the calendar
+        """
+        for slot in (-3, 24):
+            self.data["audiSlots"][str(self.audis[1].id)] = [slot]
+            self.assertEqual(self.post().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Slot.objects.filter(movie=self.movie).exists())
+
+    def test_query_count(self):
+        """
+        check that validation and creation do not issue queries per auditorium or per slot
+        """
+        self.data["audiSlots"].update(dict((str(G(Auditorium, opening_time=9, closing_time=21).id), [9, 12, 15]) for _ in range(5)))
+        with self.assertNumQueries(8):
+            self.assertEqual(self.post().status_code, status.HTTP_201_CREATED)
+
+    def test_conflict_enforced_by_database(self):
+        """
+        check that a slot created between validation and creation rolls the schedule back
+        """
+        serializer = SlotBookingSerializer(data=self.data)
+        serializer.is_valid(raise_exception=True)
+        G(Slot, audi=self.audis[1], date=self.closing_date, slot=15)
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertFalse(Slot.objects.filter(movie=self.movie).exists())
+
+
+@tag('slow')
+@unittest.skipUnless(os.environ.get('RUN_SLOW_TESTS'), 'set RUN_SLOW_TESTS=1 to run the query plan tests')
+class TestSlotQueryPlans(TestCase):
+    """
+    this class checks that the hot slot lookups are served by indexes on a chain sized dataset
+    of 1000 auditoriums with 500 days of four shows each (2 million slots), it only runs with RUN_SLOW_TESTS set
+    """
+    audis = 1000
+    days = 500
+    upcoming_days = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            # foreign keys are checked while inserting instead of queueing millions of deferred checks
+            # that every test teardown would run again
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute("""
+                INSERT INTO movies_theatre (name, city, state, functional_status, city_key, geohash)
+                SELECT 'T' || theatre, 'city', 'state', true, 'city', '' FROM generate_series(1, %s) theatre
+            """, [cls.audis // 10])
+            cursor.execute("""
+                INSERT INTO movies_auditorium (name, seats, opening_time, closing_time, theatre_id)
+                SELECT 'A' || audi, 100, 9, 21, theatre.id
+                FROM movies_theatre theatre, generate_series(1, 10) audi
+            """)
+            cursor.execute("""
+                INSERT INTO movies_movie (name, duration, about, language, movie_type)
+                SELECT 'M' || movie, 2, '', '{E}', '{2D}' FROM generate_series(1, 500) movie
+            """)
+            cursor.execute("""
+                INSERT INTO movies_slot (audi_id, movie_id, seats_available, date, slot, movie_type, movie_language)
+                SELECT audi.id, (SELECT min(id) FROM movies_movie) + (audi.id * 7 + day) %% 500, 100,
+                       current_date + %s + day, hour, '2D', 'E'
+                FROM movies_auditorium audi, generate_series(0, %s) day, (VALUES (9), (12), (15), (18)) hours(hour)
+            """, [cls.upcoming_days - cls.days, cls.days - 1])
+            Showtime.objects.refresh(Movie.objects.values_list('id', flat=True))
+            cursor.execute('ANALYZE')
+        cls.movie = Movie.objects.order_by('id').first()
+        cls.audi_ids = list(Auditorium.objects.order_by('id').values_list('id', flat=True)[:20])
+
+    def get_plan_nodes(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if not isinstance(plan, list):
+            plan = json.loads(plan)
+        nodes = [plan[0]['Plan']]
+        for node in nodes:
+            nodes.extend(node.get('Plans', []))
+        return nodes
+
+    def assertIndexScan(self, queryset, index_names):
+        nodes = self.get_plan_nodes(queryset)
+        for node in nodes:
+            self.assertFalse(node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == 'movies_slot')
+        self.assertTrue([node for node in nodes if node.get('Index Name') in index_names])
+
+    def test_free_slots_plan(self):
+        """
+        the (audi, date) range scan of the free slot calendar uses the unique index
+        """
+        start_date = datetime.date.today() + datetime.timedelta(days=1)
+        queryset = Slot.objects.filter(
+            audi__in=self.audi_ids,
+            date__gte=start_date,
+            date__lte=start_date + datetime.timedelta(days=30)
+        ).values_list('audi_id', 'date', 'slot')
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'movies_slot')
+        self.assertIndexScan(queryset, [
+            name for name, constraint in constraints.items()
+            if constraint['unique'] and constraint['columns'] == ['audi_id', 'date', 'slot']])
+
+    def test_movie_showtimes_plan(self):
+        """
+        the upcoming showtimes of a movie in the detail endpoint use the (movie, date, hour) index
+        """
+        queryset = Showtime.objects.upcoming().filter(movie=self.movie).order_by(
+            'date', 'theatre_name', 'theatre_id', 'audi_name', 'audi_id', 'hour')
+        self.assertIndexScan(queryset, ['movies_showtime_movie_idx'])
+
+
+class TestNowShowingAPI(APITestCase):
+    """
+    this class tests the now showing catalogue behind the movie list of users
+    """
+    def setUp(self):
+        send_cancelled_ticket_task.app.conf.task_always_eager = True
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.admin = G(User, is_admin=True)
+        self.user = G(User, is_admin=False)
+        self.url = reverse('movie:movie-list')
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        self.audi = G(Auditorium, opening_time=9, closing_time=21)
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+        self.client.force_authenticate(user=self.admin)
+        self.client.post(reverse('movie:slot_booking'), json.dumps({
+            "opening_date": str(self.date),
+            "closing_date": str(self.date),
+            "movie_type": "2D",
+            "movie_language": "E",
+            "movie": self.movie.id,
+            "audiSlots": {str(self.audi.id): [9, 15]}
+        }), content_type="application/json")
+        self.client.force_authenticate(user=self.user)
+
+    def test_scheduled_movie_is_listed(self):
+        """
+        check that scheduling slots puts the movie in the catalogue with its last show
+        """
+        now_showing = NowShowing.objects.get(movie=self.movie)
+        self.assertEqual((now_showing.last_date, now_showing.last_slot), (self.date, 15))
+        response = self.client.get(self.url)
+        self.assertEqual([movie["id"] for movie in response.data['results']], [self.movie.id])
+
+    def test_slot_deletion_updates_catalogue(self):
+        """
+        check that deleting slots moves the last show back and removes the movie with its last slot
+        """
+        self.client.force_authenticate(user=self.admin)
+        self.client.delete('/api/movies/delete-slots/{}/'.format(Slot.objects.get(slot=15).id))
+        self.assertEqual(NowShowing.objects.get(movie=self.movie).last_slot, 9)
+        self.client.delete('/api/movies/delete-slots/{}/'.format(Slot.objects.get(slot=9).id))
+        self.assertFalse(NowShowing.objects.filter(movie=self.movie).exists())
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(self.url).data["results"], [])
+
+    def test_expired_movies_are_not_listed(self):
+        """
+        check that a movie whose last show has started is neither listed nor kept by the expiry job
+        """
+        NowShowing.objects.filter(movie=self.movie).update(last_date=datetime.date.today() - datetime.timedelta(days=1))
+        self.assertEqual(self.client.get(self.url).data["results"], [])
+        NowShowing.objects.expired().delete()
+        self.assertFalse(NowShowing.objects.exists())
+
+
+@override_settings(PUBSUB_BROKER=LOCAL_BROKER)
+class TestMovieResponseCache(APITransactionTestCase):
+    """
+    this class tests the cached movie list and detail responses and their invalidation
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        self.slot = G(Slot, movie=self.movie, seats_available=10, date=datetime.date.today() + datetime.timedelta(days=1))
+        NowShowing.objects.refresh([self.movie.id])
+        Showtime.objects.refresh([self.movie.id])
+        self.detail_url = reverse('movie:movie-detail', kwargs={"pk": self.movie.id})
+        self.stats = MovieCacheUtil.response_cache.get_stats()
+
+    def get_stat(self, stat):
+        return MovieCacheUtil.response_cache.get_stats()[stat] - self.stats[stat]
+
+    def test_detail_is_cached(self):
+        """
+        check that the second detail request is a cache hit served without queries
+        """
+        first = self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.detail_url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual((self.get_stat('misses'), self.get_stat('hits')), (1, 1))
+
+    def test_conditional_get(self):
+        """
+        check that a request with the current ETag gets an empty 304
+        """
+        etag = self.client.get(self.detail_url)['ETag']
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_conditional_get_tag_lists(self):
+        """
+        check that weak tags, lists of tags and * match and other tags do not
+        """
+        etag = self.client.get(self.detail_url)['ETag']
+        for header in ('"other", W/{}'.format(etag), '*'):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH='"other", {}'.format(etag.strip('"')))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_unused_parameters_share_the_entry(self):
+        """
+        check that parameters the views do not read, e.g. a random nonce, are served from the cached entry
+        """
+        url = reverse('movie:movie-list')
+        self.client.get(url, {'page_size': 10})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'page_size': 10, 'x': 'nonce'})
+        search_url = reverse('movie:movie-search')
+        self.client.get(search_url, {'language': ['E', 'H'], 'q': 'movie'})
+        with self.assertNumQueries(0):
+            self.client.get(search_url, {'q': 'movie', 'language': ['H', 'E'], 'x': 'nonce'})
+        self.assertEqual(self.get_stat('hits'), 2)
+
+    def test_booking_invalidates_detail(self):
+        """
+        check that a booking drops the cached detail so that the new seat count is served
+        """
+        self.client.get(self.detail_url)
+        self.client.post(reverse('movie:booking', kwargs={"movieId": self.movie.id}), {"slot": self.slot.id, "seats_booked": 4})
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["showtimes"][0]["theatres"][0]["audis"][0]["slots"][0]["seats_available"], 6)
+        self.assertEqual(self.get_stat('misses'), 2)
+        self.assertTrue(self.get_stat('invalidations'))
+
+    def test_movie_update_invalidates_list(self):
+        """
+        check that editing a movie refreshes the cached list
+        """
+        self.client.get(reverse('movie:movie-list'))
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        self.client.patch(self.detail_url, {"name": "renamed"})
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('movie:movie-list'))
+        self.assertEqual(response.data["results"][0]["name"], "renamed")
+
+
+class TestBookingListAPI(APITestCase):
+    """
+    this class tests the cursor paginated booking list and the streamed export of all bookings
+    """
+    def setUp(self):
+        self.user = G(User, is_admin=False)
+        self.bookings = [G(Booking, user=self.user, seats_booked=1) for _ in range(3)]
+        G(Booking, seats_booked=2)
+        self.url = reverse('movie:bookings')
+
+    def test_cursor_pagination(self):
+        """
+        check that the bookings of the user are returned newest first one page at a time
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {"page_size": 2})
+        self.assertEqual([booking["id"] for booking in response.data["results"]], [self.bookings[2].id, self.bookings[1].id])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([booking["id"] for booking in response.data["results"]], [self.bookings[0].id])
+        self.assertIsNone(response.data["next"])
+
+    def test_streamed_export(self):
+        """
+        check that admins get every booking as one streamed JSON array
+        """
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        response = self.client.get(self.url, {"export": "true"})
+        self.assertTrue(response.streaming)
+        bookings = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(len(bookings), Booking.objects.count())
+        self.assertEqual(bookings[0]["slot"]["movie"]["id"], self.bookings[0].slot.movie_id)
+
+    def test_export_identifies_the_booker(self):
+        """
+        check that every exported booking carries its user, while the user's own list stays without it
+        """
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        response = self.client.get(self.url, {"export": "true"})
+        bookings = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(
+            [(booking["id"], booking["user"], booking["user_email"]) for booking in bookings],
+            [(booking.id, booking.user_id, booking.user.email) for booking in Booking.objects.order_by('id')])
+        self.client.force_authenticate(user=self.user)
+        self.assertNotIn("user", self.client.get(self.url).data["results"][0])
+
+    def test_query_and_payload_budget(self):
+        """
+        check that a page of bookings costs one query and a lean payload per booking
+        """
+        for _ in range(20):
+            G(Booking, user=self.user, seats_booked=1, slot=G(Slot, movie=G(Movie, about="a" * 2048)))
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data["results"]), 23)
+        self.assertLess(len(response.content) / 23, 400)
+        self.assertNotIn("about", response.data["results"][0]["slot"]["movie"])
+
+    def test_export_is_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {"export": "true"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestRequestMetrics(APITestCase):
+    """
+    this class tests the per view request metrics and their prometheus endpoint
+    """
+    def setUp(self):
+        registry.reset()
+        self.user = G(User, is_admin=False)
+        self.admin = G(User, is_admin=True)
+        self.bookings = [G(Booking, user=self.user, seats_booked=1) for _ in range(3)]
+
+    def get_metrics(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('movie:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode('utf-8')
+
+    def test_view_metrics(self):
+        """
+        check that latency, query count and response code are recorded under the name of the view
+        """
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('movie:bookings'))
+        self.client.get(reverse('movie:bookings'))
+        metrics = self.get_metrics()
+        self.assertIn('api_request_duration_seconds_count{view="movie:bookings"} 2', metrics)
+        self.assertIn('api_db_queries_sum{view="movie:bookings"} 2', metrics)
+        self.assertIn('api_db_queries_bucket{view="movie:bookings",le="1"} 2', metrics)
+        self.assertIn('api_serializer_duration_seconds_count{view="movie:bookings"} 2', metrics)
+        self.assertIn('api_responses_total{view="movie:bookings",code="200"} 2', metrics)
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('movie:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_SLOW_QUERY_SECONDS=0)
+    def test_slow_query_log(self):
+        """
+        check that queries over the threshold are logged with their sql and view
+        """
+        self.client.force_authenticate(user=self.user)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        slow_query_logger.addHandler(handler)
+        try:
+            self.client.get(reverse('movie:bookings'))
+        finally:
+            slow_query_logger.removeHandler(handler)
+        seconds, view, sql = records[-1].args
+        self.assertEqual(view, 'movie:bookings')
+        self.assertIn('SELECT', sql)
+
+
+class TestBenchmarkData(TestCase):
+    """
+    this class tests the synthetic benchmark dataset and the baseline comparison of the suite
+    """
+    def test_generate_and_flush(self):
+        """
+        check that the dataset has the requested size, keeps one free slot per auditorium and day and is flushed
+        """
+        BenchmarkDataset(theatres=3, audis_per_theatre=2, movies=4, days=2, users=5, bookings=40).generate()
+        counts = BenchmarkDataset.counts()
+        self.assertEqual(counts, {
+            'theatres': 3, 'audis': 6, 'movies': 4, 'slots': 6 * 2 * 3, 'users': 6, 'bookings': 40})
+        self.assertEqual(NowShowing.objects.count(), Slot.objects.values('movie').distinct().count())
+        BenchmarkDataset.flush()
+        self.assertEqual(set(BenchmarkDataset.counts().values()), {0})
+
+    def test_compare(self):
+        baseline = {'scenarios': [{'scenario': 'movie_list', 'p50_ms': 10.0, 'queries': 2, 'errors': 0}]}
+        results = {'scenarios': [{'scenario': 'movie_list', 'p50_ms': 20.0, 'queries': 3, 'errors': 0}]}
+        self.assertEqual(len(BenchmarkSuiteCommand().compare(results, baseline, 0.25)), 2)
+        self.assertEqual(BenchmarkSuiteCommand().compare(baseline, baseline, 0.25), [])
+
+
+@override_settings(DB_POOL_SIZE=1, DB_POOL_TIMEOUT=0.05)
+class TestConnectionPool(TestCase):
+    """
+    this class tests the pooled database backend and the health check of idle connections
+    """
+    def setUp(self):
+        connection_pools.close()
+        self.settings_dict = dict(connection.settings_dict, ENGINE='app.commons.db', POOL=True, CONN_MAX_AGE=0)
+
+    def tearDown(self):
+        connection_pools.close()
+
+    def get_wrapper(self):
+        return PooledDatabaseWrapper(self.settings_dict, alias='pooled')
+
+    def test_connection_is_reused(self):
+        wrapper = self.get_wrapper()
+        wrapper.ensure_connection()
+        backend_pid = wrapper.connection.get_backend_pid()
+        wrapper.close()
+        other = self.get_wrapper()
+        other.ensure_connection()
+        self.assertEqual(other.connection.get_backend_pid(), backend_pid)
+        other.close()
+        self.assertEqual(other.get_pool().get_stats()['opened'], 1)
+
+    def test_exhausted_pool(self):
+        wrapper = self.get_wrapper()
+        wrapper.ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.get_wrapper().ensure_connection()
+        wrapper.close()
+
+    def test_waiting_callers_go_first(self):
+        """
+        check that a returned connection goes to the caller waiting for it, not to one arriving just then
+        """
+        pool = ConnectionPool(1)
+        pool.checkout(lambda: 'first')
+        checked_out = []
+        waiter = threading.Thread(target=lambda: checked_out.append(pool.checkout(lambda: 'waiting')))
+        with self.settings(DB_POOL_TIMEOUT=5):
+            waiter.start()
+            while not pool.waiting:
+                time.sleep(0.01)
+        pool.release()
+        self.assertRaises(psycopg2.OperationalError, pool.checkout, lambda: 'arriving')
+        waiter.join()
+        self.assertEqual(checked_out, ['waiting'])
+
+    @override_settings(DB_HEALTH_CHECK_IDLE=0)
+    def test_dead_connection_is_replaced(self):
+        """
+        check that an idle connection the server dropped is discarded instead of handed out
+        """
+        wrapper = self.get_wrapper()
+        wrapper.ensure_connection()
+        backend_pid = wrapper.connection.get_backend_pid()
+        wrapper.close()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [backend_pid])
+        wrapper.ensure_connection()
+        self.assertNotEqual(wrapper.connection.get_backend_pid(), backend_pid)
+        self.assertEqual(wrapper.get_pool().get_stats()['discarded'], 1)
+        wrapper.close()
+
+
+class TestGreenDatabase(TestCase):
+    """
+    this class tests the wait callback the gevent entry point gives psycopg2
+    """
+    def test_queries_wait_through_the_callback(self):
+        waits = []
+
+        def wait_read(fileno, timeout=None):
+            waits.append(fileno)
+            select_wait_read(fileno, timeout)
+
+        extensions.set_wait_callback(make_wait_callback(wait_read, select_wait_write))
+        self.addCleanup(extensions.set_wait_callback, None)
+        wrapper = PooledDatabaseWrapper(dict(connection.settings_dict, CONN_MAX_AGE=0), alias='green')
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_sleep(0.05), %s', [1])
+            self.assertEqual(cursor.fetchone()[1], 1)
+        wrapper.close()
+        self.assertTrue(waits)
+
+
+class TestShowtimesAPI(APITestCase):
+    """
+    this class tests the showtime search by city, zipcode and location
+    """
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client.force_authenticate(user=G(User, is_admin=False))
+        self.url = reverse('movie:showtimes')
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+        self.near = G(Theatre, name="T1", city=" Bombay ", zipcode=400001, latitude=19.0760, longitude=72.8777)
+        self.far = G(Theatre, name="T2", city="Mumbai", zipcode=400002, latitude=19.2183, longitude=72.9781)
+        self.other = G(Theatre, name="T3", city="Pune", zipcode=411001, latitude=18.5204, longitude=73.8567)
+        self.movie = G(Movie, name="M1", language=["E"], movie_type=["2D"])
+        for theatre in (self.near, self.far, self.other):
+            audi = G(Auditorium, theatre=theatre, name="A1")
+            for slot in (12, 9):
+                G(Slot, audi=audi, movie=self.movie, date=self.date, slot=slot, movie_type="2D", movie_language="E")
+
+    def test_city_key(self):
+        self.assertEqual(self.near.city_key, "mumbai")
+        self.assertEqual(self.near.geohash[:5], "te7ud")
+
+    def test_city_showtimes(self):
+        """
+        check that the theatres of the city are returned with their shows in one query and cached
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"city": "mumbai", "date": self.date})
+        self.assertEqual([theatre["name"] for theatre in response.data], ["T1", "T2"])
+        self.assertEqual([show["slot"] for show in response.data[0]["movies"][0]["shows"]], [9, 12])
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {"city": "MUMBAI", "date": self.date})
+        self.assertEqual(cached.content, response.content)
+
+    def test_zipcode_showtimes(self):
+        response = self.client.get(self.url, {"zipcode": 411001, "date": self.date})
+        self.assertEqual([theatre["name"] for theatre in response.data], ["T3"])
+
+    def test_nearby_showtimes(self):
+        """
+        check that a location search returns the theatres within the radius nearest first
+        """
+        response = self.client.get(self.url, {"latitude": 19.08, "longitude": 72.88, "radius": 25, "date": self.date})
+        self.assertEqual([theatre["name"] for theatre in response.data], ["T1", "T2"])
+        self.assertLess(response.data[0]["distance_km"], response.data[1]["distance_km"])
+        response = self.client.get(self.url, {"latitude": 19.08, "longitude": 72.88, "radius": 5, "date": self.date})
+        self.assertEqual([theatre["name"] for theatre in response.data], ["T1"])
+
+    def test_schedule_change_invalidates(self):
+        self.client.get(self.url, {"city": "mumbai", "date": self.date})
+        MovieCacheUtil().response_cache.invalidate_version('list')
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {"city": "mumbai", "date": self.date})
+
+    def test_location_required(self):
+        response = self.client.get(self.url, {"date": self.date})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"city": "mumbai", "date": datetime.date.today() - datetime.timedelta(days=1)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(PUBSUB_BROKER=LOCAL_BROKER)
+class TestMovieSearchAPI(APITransactionTestCase):
+    """
+    this class tests the full text movie search with its language and format filters and facets
+    """
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        self.url = reverse('movie:movie-search')
+        self.rescue = G(Movie, name="Ocean Rescue", about="divers at sea", language=["E", "H"], movie_type=["2D", "3D"])
+        self.desert = G(Movie, name="Desert Storm", about="a story of the oceans", language=["E"], movie_type=["2D"])
+        self.city = G(Movie, name="City Lights", about="a silent comedy", language=["H"], movie_type=["2D"])
+
+    def test_text_search(self):
+        """
+        check that stemmed words are matched in name and about with name matches ranked first
+        """
+        response = self.client.get(self.url, {"q": "oceans"})
+        self.assertEqual([movie["id"] for movie in response.data["results"]], [self.rescue.id, self.desert.id])
+        self.assertEqual(response.data["count"], 2)
+        self.client.patch(
+            reverse('movie:movie-detail', kwargs={"pk": self.city.id}), {"about": "lights on the ocean"}, format='json')
+        response = self.client.get(self.url, {"q": "ocean"})
+        self.assertEqual(response.data["count"], 3)
+
+    def test_filters_and_facets(self):
+        """
+        check that every given language and format has to match and that the facets count the matches
+        """
+        response = self.client.get(self.url, {"language": ["E", "H"]})
+        self.assertEqual([movie["id"] for movie in response.data["results"]], [self.rescue.id])
+        response = self.client.get(self.url, {"movie_type": "2D"})
+        self.assertEqual(
+            [movie["name"] for movie in response.data["results"]], ["City Lights", "Desert Storm", "Ocean Rescue"])
+        self.assertEqual(response.data["facets"], {
+            "language": [{"value": "E", "count": 2}, {"value": "H", "count": 2}],
+            "movie_type": [{"value": "2D", "count": 3}, {"value": "3D", "count": 1}],
+        })
+
+    def test_search_is_cached_and_paginated(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"language": "E", "page_size": 1})
+        self.assertEqual(response.data["count"], 2)
+        self.assertIsNotNone(response.data["next"])
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {"language": "E", "page_size": 1})
+        self.assertEqual(cached.content, response.content)
+
+
+class TestShowtimeReadModel(APITestCase):
+    """
+    this class tests the showtime read model behind the movie detail
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        send_cancelled_ticket_task.app.conf.task_always_eager = True
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.admin = G(User, is_admin=True)
+        self.client.force_authenticate(user=self.admin)
+        self.theatre = G(Theatre, name="T1")
+        self.audis = [G(Auditorium, theatre=self.theatre, name=name, seats=50, opening_time=9, closing_time=21)
+                      for name in ("A2", "A1")]
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+        self.client.post(reverse('movie:slot_booking'), json.dumps({
+            "opening_date": str(self.date),
+            "closing_date": str(self.date + datetime.timedelta(days=1)),
+            "movie_type": "2D",
+            "movie_language": "E",
+            "movie": self.movie.id,
+            "audiSlots": dict((str(audi.id), [15, 9]) for audi in self.audis)
+        }), content_type="application/json")
+        self.detail_url = reverse('movie:movie-detail', kwargs={"pk": self.movie.id})
+
+    def test_detail_groups_showtimes(self):
+        """
+        check that the detail reads the shows from the read model grouped by date, theatre and auditorium
+        """
+        self.assertEqual(Showtime.objects.filter(movie=self.movie).count(), 8)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.detail_url)
+        showtimes = response.data["showtimes"]
+        self.assertEqual([day["date"] for day in showtimes], [self.date, self.date + datetime.timedelta(days=1)])
+        theatre = showtimes[0]["theatres"][0]
+        self.assertEqual((theatre["id"], theatre["name"]), (self.theatre.id, "T1"))
+        self.assertEqual([audi["name"] for audi in theatre["audis"]], ["A1", "A2"])
+        self.assertEqual(
+            [(slot["slot"], slot["seats_available"]) for slot in theatre["audis"][0]["slots"]], [(9, 50), (15, 50)])
+
+    def test_seats_follow_bookings(self):
+        slot = Slot.objects.get(audi=self.audis[0], date=self.date, slot=9)
+        self.client.force_authenticate(user=G(User, is_admin=False))
+        self.client.post(reverse('movie:booking', kwargs={"movieId": self.movie.id}), {"slot": slot.id, "seats_booked": 3})
+        self.assertEqual(Showtime.objects.get(slot=slot).seats_available, 47)
+
+    def test_names_and_deletions_follow(self):
+        """
+        check that renamed theatres and auditoriums are copied and deleted slots take their showtime along
+        """
+        self.client.patch(reverse('movie:theatre-detail', kwargs={"pk": self.theatre.id}), {"name": "T9"})
+        self.assertEqual(set(Showtime.objects.values_list('theatre_name', flat=True)), {"T9"})
+        slot = Slot.objects.filter(movie=self.movie).first()
+        self.client.delete(reverse('movie:slot_delete', kwargs={"pk": slot.id}))
+        self.assertFalse(Showtime.objects.filter(slot_id=slot.id).exists())
+        self.assertEqual(Showtime.objects.count(), 7)
+
+    def test_admin_slots_are_copied(self):
+        """
+        check that slots added and deleted through the django admin reach the read models
+        """
+        date = self.date + datetime.timedelta(days=5)
+        self.client.force_login(G(User, is_staff=True, is_superuser=True))
+        response = self.client.post(reverse('admin:movies_slot_add'), {
+            "audi": self.audis[0].id, "movie": self.movie.id, "seats_available": 50, "date": str(date),
+            "slot": 12, "movie_type": "2D", "movie_language": "E"})
+        self.assertEqual(response.status_code, 302)
+        slot = Slot.objects.get(date=date)
+        self.assertEqual(Showtime.objects.get(slot=slot).audi_name, "A2")
+        self.assertEqual(NowShowing.objects.get(movie=self.movie).last_date, date)
+        self.client.post(reverse('admin:movies_slot_delete', args=(slot.id, )), {"post": "yes"})
+        self.assertEqual(NowShowing.objects.get(movie=self.movie).last_date, self.date + datetime.timedelta(days=1))
+
+
+@override_settings(
+    SEAT_EVENTS_INTERVAL=0.2, SEAT_EVENTS_HEARTBEAT=1, SEAT_EVENTS_LOW_SEATS=3, PUBSUB_BROKER=LOCAL_BROKER)
+class TestSeatEvents(APITransactionTestCase):
+    """
+    this class tests the server-sent seat events of a movie
+    """
+    def setUp(self):
+        user_ticket_task.app.conf.task_always_eager = True
+        self.user = G(User, is_admin=False)
+        self.client.force_authenticate(user=self.user)
+        self.movie = G(Movie, language=["E"], movie_type=["2D"])
+        date = datetime.date.today() + datetime.timedelta(days=1)
+        self.slots = [G(Slot, movie=self.movie, seats_available=6, date=date, slot=hour) for hour in (9, 12)]
+        Showtime.objects.refresh([self.movie.id])
+        self.events_url = reverse('movie:seat_events', kwargs={"movieId": self.movie.id})
+
+    def open(self, **params):
+        response = self.client.get(self.events_url, params)
+        self.addCleanup(response.close)
+        events = iter(response.streaming_content)
+        self.assertEqual(next(events), b'retry: 3000\n\n')
+        return response, events
+
+    def read(self, events):
+        """
+        returns the name and data of the next event, skipping keep-alive comments
+        """
+        for chunk in events:
+            chunk = chunk.decode('utf-8')
+            if not chunk.startswith(':'):
+                name, data = chunk.strip().split('\n')
+                return name[len('event: '):], json.loads(data[len('data: '):])
+
+    def book(self, slot, seats):
+        return self.client.post(
+            reverse('movie:booking', kwargs={"movieId": self.movie.id}), {"slot": slot.id, "seats_booked": seats})
+
+    def test_snapshot(self):
+        """
+        check that the stream starts with the seats of the watched slots
+        """
+        response, events = self.open(slot=self.slots[1].id)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(self.read(events), ('snapshot', [{
+            'slot': self.slots[1].id, 'movie': self.movie.id, 'seats_available': 6, 'delta': 0, 'status': 'available'
+        }]))
+
+    def test_booking_is_pushed(self):
+        """
+        check that a committed booking reaches the stream with the seats left and a low availability status
+        """
+        _, events = self.open()
+        self.read(events)
+        self.book(self.slots[0], 4)
+        self.assertEqual(self.read(events), ('seats', {
+            'slot': self.slots[0].id, 'movie': self.movie.id, 'seats_available': 2, 'delta': -4, 'status': 'low'
+        }))
+
+    def test_events_are_coalesced(self):
+        """
+        check that the changes of a slot within the interval arrive merged into one event
+        """
+        _, events = self.open(slot=self.slots[0].id)
+        self.read(events)
+        for seats in (1, 2, 3):
+            self.book(self.slots[0], seats)
+        self.book(self.slots[1], 1)
+        self.assertEqual(self.read(events)[1]['delta'], -1)
+        message = self.read(events)[1]
+        self.assertEqual((message['delta'], message['seats_available'], message['status']), (-5, 0, 'sold_out'))
+
+    def test_deleted_slot_is_pushed(self):
+        """
+        check that watchers learn about a deleted slot
+        """
+        _, events = self.open()
+        self.read(events)
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        self.client.delete(reverse('movie:slot_delete', kwargs={"pk": self.slots[1].id}))
+        self.assertEqual(self.read(events)[1]['status'], 'cancelled')
+
+    def test_deleted_theatre_is_pushed(self):
+        """
+        check that deleting an auditorium or a theatre cancels their slots for the watchers
+        """
+        _, events = self.open()
+        self.read(events)
+        self.client.force_authenticate(user=G(User, is_admin=True))
+        audi = self.slots[0].audi
+        self.client.delete(reverse('movie:audi-detail', kwargs={"theatreId": audi.theatre_id, "pk": audi.id}))
+        self.assertEqual(self.read(events)[1], {
+            'slot': self.slots[0].id, 'movie': self.movie.id, 'seats_available': 0, 'delta': 0, 'status': 'cancelled'
+        })
+        self.client.delete(reverse('movie:theatre-detail', kwargs={"pk": self.slots[1].audi.theatre_id}))
+        message = self.read(events)[1]
+        self.assertEqual((message['slot'], message['status']), (self.slots[1].id, 'cancelled'))
+
+    def test_booking_is_pushed_without_reading_the_slot(self):
+        """
+        check that the seats of the event come from the conditional update, not from a query after the commit
+        """
+        _, events = self.open()
+        self.read(events)
+        with CaptureQueriesContext(connection) as queries:
+            self.book(self.slots[0], 4)
+        self.assertEqual(self.read(events)[1]['seats_available'], 2)
+        self.assertFalse([query for query in queries if 'SELECT "movies_slot"."seats_available"' in query['sql']])
+
+    def test_streams_are_capped(self):
+        """
+        check that streams beyond SEAT_EVENTS_MAX_STREAMS are asked to come back later
+        """
+        self.open()
+        with self.settings(SEAT_EVENTS_MAX_STREAMS=1):
+            response = self.client.get(self.events_url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '3')
+
+    def test_closed_stream_stops_watching(self):
+        """
+        check that a closed stream leaves the hub, even one that was never read
+        """
+        self.client.get(self.events_url).close()
+        self.assertNotIn(self.movie.id, SeatEventUtil.hub.streams)
@@ -10,16 +10,32 @@ from app.movies.views import(
      FreeSlotsApiView,
      MovieBookingViewSet,
      BookingViewSet,
-     DeleteSlotViewSet
+     DeleteSlotViewSet,
+     SeatHoldViewSet,
+     ConfirmSeatHoldViewSet,
+     CacheStatsApiView,
+     MetricsApiView,
+     ShowtimesApiView,
+     SeatEventsApiView,
+     BookingQueueViewSet,
+     BookingRequestViewSet
 )
 
 router = routers.SimpleRouter()
 urlpatterns = [
     url(r'^slots-booking/$', SlotBookingViewSet.as_view(), name="slot_booking"),
-    url(r'^delete-slots/(?P<pk>\d+)/$', DeleteSlotViewSet.as_view()),
+    url(r'^delete-slots/(?P<pk>\d+)/$', DeleteSlotViewSet.as_view(), name="slot_delete"),
     url(r'^free-slots/$', FreeSlotsApiView.as_view(), name="free-slots"),
+    url(r'^showtimes/$', ShowtimesApiView.as_view(), name="showtimes"),
+    url(r'^movie/(?P<movieId>\d+)/seat-events/$', SeatEventsApiView.as_view(), name="seat_events"),
+    url(r'^book/(?P<movieId>\d+)/queue/$', BookingQueueViewSet.as_view(), name="booking_queue"),
     url(r'^book/(?P<movieId>\d+)/', MovieBookingViewSet.as_view(), name="booking"),
-    url(r'^bookings/$', BookingViewSet.as_view())
+    url(r'^booking-requests/(?P<pk>\d+)/$', BookingRequestViewSet.as_view(), name="booking_request"),
+    url(r'^bookings/$', BookingViewSet.as_view(), name="bookings"),
+    url(r'^hold/$', SeatHoldViewSet.as_view(), name="seat_hold"),
+    url(r'^hold/(?P<pk>\d+)/confirm/$', ConfirmSeatHoldViewSet.as_view(), name="seat_hold_confirm"),
+    url(r'^cache-stats/$', CacheStatsApiView.as_view(), name="cache_stats"),
+    url(r'^metrics/$', MetricsApiView.as_view(), name="metrics")
 ]
 router.register(r'movie', MovieViewSet, basename='movie')
 router.register(r'theatre/(?P<theatreId>\d+)/audi', AudiViewSet, basename='audi')
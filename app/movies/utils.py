@@ -1,10 +1,44 @@
-from app.movies.models import Auditorium
-from app.movies.models import Slot
+import datetime
+import json
+import logging
+import operator
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.six.moves import queue
+
+from rest_framework.exceptions import Throttled, ValidationError
+
+from app.commons.cache import ResponseCache
+from app.commons.constants import ERROR_MESSAGES, STATUS
+from app.commons.geo import covering_geohashes, distance_km, normalize_city
+from app.commons.pubsub import brokers
+from app.commons.transactions import atomic, on_rollback
+from app.movies.models import Auditorium, Theatre
+from app.movies.models import SeatDelta, SeatMap
+from app.movies.models import Showtime, Slot
+from app.users.models import Booking, BookingRequest, SeatHold
+
+logger = logging.getLogger(__name__)
 
 
 class FreeSlotUtil():
+    @staticmethod
+    def get_audi_slots(audi):
+        return range(audi.opening_time, (audi.closing_time-2), 3)
+
     def get_free_slots(self, audi, start_date, end_date):
-        audi_available_slot = range(audi.opening_time, (audi.closing_time-2), 3)
+        audi_available_slot = self.get_audi_slots(audi)
         audi_booked_slots = Slot.objects.filter(
             audi=audi,
             date__gte=start_date,
@@ -12,3 +46,785 @@ class FreeSlotUtil():
         ).values_list('slot', flat=True)
         audi_free_slots = list(set(audi_available_slot)-set(audi_booked_slots))
         return audi_free_slots
+
+    def get_free_slots_by_date(self, audis, start_date, end_date):
+        """
+        computes the free slots of every given auditorium for every date of the range
+        from a single query over the booked (audi, date, slot) tuples
+        """
+        calendar = SlotCalendar(audis, start_date, end_date)
+        free_slots = OrderedDict()
+        for audi in calendar.audis:
+            free_slots[audi] = OrderedDict(
+                (date, SlotCalendar.to_slots(mask)) for date, mask in zip(calendar.dates, calendar.free_masks(audi)))
+        return free_slots
+
+
+class SlotCalendar():
+    """
+    availability grid of auditoriums x dates x slots built in a single pass over the booked slots of the range.
+    Every (audi, date) cell is an integer bitset in which bit n is set when the slot starting at hour n is booked.
+    """
+    slots_per_day = 24
+
+    def __init__(self, audis, start_date, end_date):
+        booked_slots = Slot.objects.filter(
+            audi__in=audis,
+            date__gte=start_date,
+            date__lte=end_date
+        ).values_list('audi_id', 'date', 'slot')
+        self.audis = list(audis)
+        self.start_date = start_date
+        self.dates = [start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+        self.booked = dict((audi.id, [0] * len(self.dates)) for audi in self.audis)
+        for audi_id, date, slot in booked_slots:
+            self.booked[audi_id][(date - start_date).days] |= 1 << slot
+
+    @staticmethod
+    def to_mask(slots):
+        mask = 0
+        for slot in slots:
+            mask |= 1 << slot
+        return mask
+
+    @staticmethod
+    def to_slots(mask):
+        slots = []
+        slot = 0
+        while mask:
+            if mask & 1:
+                slots.append(slot)
+            mask >>= 1
+            slot += 1
+        return slots
+
+    def schedule_mask(self, audi):
+        return self.to_mask(FreeSlotUtil.get_audi_slots(audi))
+
+    def free_masks(self, audi):
+        """
+        returns the bitset of free slots of the auditorium for every date of the range
+        """
+        schedule = self.schedule_mask(audi)
+        return [schedule & ~booked for booked in self.booked[audi.id]]
+
+    def is_free(self, audi, slots):
+        """
+        returns True if every requested slot belongs to the auditorium schedule and is free on every date
+        """
+        requested = self.to_mask(slots)
+        if requested & ~self.schedule_mask(audi):
+            return False
+        return not any(booked & requested for booked in self.booked[audi.id])
+
+
+class SeatCounterUtil():
+    """
+    hot seat counters of the slots kept in the SEAT_COUNTER_ALIAS cache when SEAT_COUNTER_ENABLED. Reservations
+    decrement the counter atomically and journal the change as a SeatDelta row in the caller's transaction instead
+    of updating the slot row, flush() writes the journal back to the slots. A missing counter, e.g. after a
+    restart, is seeded from the slot and its unflushed journal. With the counters disabled every call goes
+    straight to the conditional updates of the slot row.
+    """
+    @property
+    def enabled(self):
+        return settings.SEAT_COUNTER_ENABLED
+
+    @property
+    def cache(self):
+        return caches[settings.SEAT_COUNTER_ALIAS]
+
+    def key(self, slot_id):
+        return 'seats:{}'.format(slot_id)
+
+    def seed(self, slot_id):
+        seats = Slot.objects.filter(id=slot_id).annotate(
+            pending=Coalesce(Sum('seat_deltas__delta'), 0)).values_list('seats_available', 'pending').first()
+        if seats is not None:
+            self.cache.add(self.key(slot_id), seats[0] + seats[1], None)
+
+    def available(self, slot):
+        if not self.enabled:
+            return slot.seats_available
+        seats = self.cache.get(self.key(slot.id))
+        if seats is None:
+            self.seed(slot.id)
+            seats = self.cache.get(self.key(slot.id), slot.seats_available)
+        return seats
+
+    def get_many(self, seats):
+        """
+        returns the given {slot id: seats} with the seats of the slots that have a counter replaced by it
+        """
+        seats = dict(seats)
+        if self.enabled and seats:
+            keys = dict((self.key(slot_id), slot_id) for slot_id in seats)
+            for key, value in self.cache.get_many(list(keys)).items():
+                seats[keys[key]] = value
+        return seats
+
+    def claim(self, slot_id, seats):
+        """
+        takes the seats from the counter only and returns the seats left, None instead of going below zero
+        """
+        try:
+            remaining = self.cache.decr(self.key(slot_id), seats)
+        except ValueError:
+            self.seed(slot_id)
+            remaining = self.cache.decr(self.key(slot_id), seats)
+        if remaining < 0:
+            self.cache.incr(self.key(slot_id), seats)
+            return None
+        return remaining
+
+    def record(self, slot_id, delta):
+        if delta:
+            SeatDelta.objects.create(slot_id=slot_id, delta=delta)
+
+    def reserve(self, slot_id, seats):
+        """
+        returns the seats left after taking the given ones, None when there are not enough
+        """
+        if not self.enabled:
+            return Slot.objects.reserve_seats(slot_id, seats)
+        remaining = self.claim(slot_id, seats)
+        if remaining is None:
+            return None
+        try:
+            self.record(slot_id, -seats)
+        except Exception:
+            self.cache.incr(self.key(slot_id), seats)
+            raise
+        # the journal row goes away with a rollback of the caller's transactions.atomic, so do the seats
+        on_rollback(lambda: self.unclaim(slot_id, seats))
+        return remaining
+
+    def release(self, slot_id, seats):
+        """
+        returns the seats available after giving the given ones back, None while that is only known on commit
+        """
+        if not self.enabled:
+            return Slot.objects.release_seats(slot_id, seats)
+        self.record(slot_id, seats)
+        # the seats only become available to others once the release is committed
+        transaction.on_commit(lambda: self.unclaim(slot_id, seats))
+        return None
+
+    def unclaim(self, slot_id, seats):
+        try:
+            self.cache.incr(self.key(slot_id), seats)
+        except ValueError:
+            # not seeded, the next seed reads the committed journal
+            pass
+
+    def flush(self):
+        """
+        writes the journal back to the slots, one short transaction per slot, and returns the slots updated
+        """
+        slot_ids = list(SeatDelta.objects.values_list('slot_id', flat=True).distinct())
+        for slot_id in slot_ids:
+            with transaction.atomic():
+                deltas = list(SeatDelta.objects.select_for_update().filter(slot_id=slot_id).values_list('id', 'delta'))
+                seats = sum(delta for _, delta in deltas)
+                Slot.objects.filter(id=slot_id).update(seats_available=F('seats_available') + seats)
+                Showtime.objects.add_seats(slot_id, seats)
+                SeatDelta.objects.filter(id__in=[delta_id for delta_id, _ in deltas]).delete()
+        return len(slot_ids)
+
+    def reconcile(self, slot_ids):
+        """
+        overwrites the counters of the slots from the database, only safe while no booking is in flight
+        """
+        for slot_id in slot_ids:
+            self.cache.delete(self.key(slot_id))
+            self.seed(slot_id)
+
+
+class SeatHoldUtil():
+    """
+    two phase seat reservation, seats are held for a few minutes and then confirmed into a booking.
+    Every operation locks only the seat map row of its slot and touches only the requested seats.
+    """
+    def _locked_seat_map(self, slot):
+        try:
+            return SeatMap.objects.select_for_update().get(slot=slot)
+        except SeatMap.DoesNotExist:
+            bitmap = SeatMap.empty_bitmap(slot.audi.seats)
+            SeatMap.objects.get_or_create(slot=slot, defaults={'booked': bitmap, 'held': bitmap})
+            return SeatMap.objects.select_for_update().get(slot=slot)
+
+    def _release(self, seat_map, holds):
+        """
+        frees the seats of the given holds, the seat map row has to be locked by the caller
+        """
+        seats = [seat for hold in holds for seat in hold.seats]
+        if not seats:
+            return 0
+        seat_map.release(seats)
+        seat_map.save(update_fields=['held'])
+        SeatHold.objects.filter(id__in=[hold.id for hold in holds]).update(status=STATUS["EXPIRED"])
+        remaining = SeatCounterUtil().release(seat_map.slot_id, len(seats))
+        MovieCacheUtil().invalidate([seat_map.slot.movie_id], lists=False)
+        SeatEventUtil().publish(seat_map.slot_id, seat_map.slot.movie_id, len(seats), seats=remaining)
+        return len(seats)
+
+    def _expired_holds(self, slot_id):
+        return SeatHold.objects.filter(slot_id=slot_id, status=STATUS["HELD"], expires_at__lte=timezone.now())
+
+    @atomic()
+    def hold(self, user, slot, seats, minutes=None):
+        minutes = minutes or settings.SEAT_HOLD_MINUTES
+        seat_map = self._locked_seat_map(slot)
+        if not seat_map.is_free(seats):
+            # expired holds the sweeper has not reached yet should not block new customers
+            self._release(seat_map, list(self._expired_holds(slot.id).select_for_update()))
+            if not seat_map.is_free(seats):
+                raise ValidationError(ERROR_MESSAGES["SEATS_UNAVAILABLE"])
+        remaining = SeatCounterUtil().reserve(slot.id, len(seats))
+        if remaining is None:
+            raise ValidationError(ERROR_MESSAGES["SOLD_OUT"])
+        seat_map.hold(seats)
+        seat_map.save(update_fields=['held'])
+        MovieCacheUtil().invalidate([slot.movie_id], lists=False)
+        SeatEventUtil().publish(slot.id, slot.movie_id, -len(seats), seats=remaining)
+        return SeatHold.objects.create(
+            user=user,
+            slot=slot,
+            seats=seats,
+            expires_at=timezone.now() + datetime.timedelta(minutes=minutes))
+
+    @transaction.atomic()
+    def confirm(self, hold):
+        seat_map = SeatMap.objects.select_for_update().get(slot_id=hold.slot_id)
+        hold = SeatHold.objects.select_for_update().get(id=hold.id)
+        if hold.status != STATUS["HELD"] or hold.expires_at <= timezone.now():
+            raise ValidationError(ERROR_MESSAGES["HOLD_EXPIRED"])
+        seat_map.book(hold.seats)
+        seat_map.save(update_fields=['booked', 'held'])
+        hold.status = STATUS["CONFIRMED"]
+        hold.save(update_fields=['status'])
+        return Booking.objects.create(
+            user_id=hold.user_id,
+            slot_id=hold.slot_id,
+            seats_booked=len(hold.seats),
+            seat_numbers=hold.seats,
+            booking_status=STATUS["CONFIRMED"])
+
+    def release_expired_holds(self):
+        """
+        sweeps the expired holds slot by slot and returns the number of seats given back
+        """
+        released = 0
+        expired_slots = SeatHold.objects.filter(
+            status=STATUS["HELD"], expires_at__lte=timezone.now()).values_list('slot_id', flat=True).distinct()
+        for slot_id in expired_slots:
+            with transaction.atomic():
+                seat_map = SeatMap.objects.select_for_update().get(slot_id=slot_id)
+                released += self._release(seat_map, list(self._expired_holds(slot_id).select_for_update()))
+        return released
+
+
+class MovieCacheUtil():
+    """
+    response cache of the movie list and detail endpoints. Keys carry the current hour, since the
+    upcoming shows change every hour, and the scope, since admins see every movie.
+    """
+    response_cache = ResponseCache('movies')
+    scopes = ('admin', 'user')
+
+    @staticmethod
+    def get_scope(user):
+        return 'admin' if user.is_admin else 'user'
+
+    def get_hour(self):
+        return datetime.datetime.now().strftime('%Y%m%d%H')
+
+    def get_query(self, query_params, names):
+        """
+        the given parameters in a fixed order, any other parameter leaves the response as it is and must not
+        make a new cache entry
+        """
+        return urlencode([(name, value) for name in names for value in sorted(query_params.getlist(name))])
+
+    def list_key(self, scope, query=''):
+        """
+        lists are cached per query, see get_query, so they are invalidated by moving to a new version
+        """
+        return self.response_cache.make_key(
+            'list', self.response_cache.get_version('list'), scope, self.get_hour(), query)
+
+    def search_key(self, scope, query=''):
+        """
+        searches are cached per query under the list version
+        """
+        return self.response_cache.make_key(
+            'search', self.response_cache.get_version('list'), scope, self.get_hour(), query)
+
+    def detail_key(self, movie_id, scope):
+        return self.response_cache.make_key('detail', movie_id, scope, self.get_hour())
+
+    def showtimes_key(self, location, date):
+        """
+        showtimes follow the schedule like the lists do, so they share the list version
+        """
+        return self.response_cache.make_key(
+            'showtimes', self.response_cache.get_version('list'), location, date, self.get_hour())
+
+    def invalidate(self, movie_ids=(), lists=True):
+        """
+        drops the cached detail of the given movies and the movie lists once the current transaction commits
+        """
+        keys = [self.detail_key(movie_id, scope) for movie_id in set(movie_ids) for scope in self.scopes]
+        if keys:
+            transaction.on_commit(lambda: self.response_cache.invalidate(keys))
+        if lists:
+            transaction.on_commit(lambda: self.response_cache.invalidate_version('list'))
+
+
+class MovieSearchUtil():
+    """
+    full text search over the name and about of movies with containment filters on their languages and
+    formats, served by the GIN indexes on search_vector, language and movie_type
+    """
+    config = 'english'
+    facets = ('language', 'movie_type')
+
+    def search(self, movies, q=None, language=(), movie_type=()):
+        """
+        narrows the movies to those matching every search term, language and format, best matches first
+        when searching by text and by name otherwise
+        """
+        if language:
+            movies = movies.filter(language__contains=language)
+        if movie_type:
+            movies = movies.filter(movie_type__contains=movie_type)
+        if not q:
+            return movies.order_by('name', 'id')
+        query = SearchQuery(q, config=self.config)
+        return movies.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)).order_by('-rank', 'id')
+
+    def get_facets(self, movies):
+        """
+        counts the given movies per language and per format in a single pass over them, most common first
+        """
+        sql, params = movies.order_by().values(*self.facets).query.sql_with_params()
+        facets = dict((facet, []) for facet in self.facets)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT facet, value, count(*) FROM ({}) AS movie, LATERAL ({}) AS facets (facet, value) '
+                'GROUP BY facet, value ORDER BY count(*) DESC, value'.format(sql, ' UNION ALL '.join(
+                    "SELECT '{0}', unnest(movie.{0})".format(facet) for facet in self.facets)),
+                params)
+            for facet, value, count in cursor.fetchall():
+                facets[facet].append({'value': value, 'count': count})
+        return facets
+
+
+class ShowtimeUtil():
+    """
+    showtimes of the functional theatres of a city, zipcode or area on one date, read in a single query that
+    walks the theatre city_key, zipcode or geohash index, the auditorium foreign key and the (audi, date, slot)
+    index of the slots, and the showtimes of a movie read from the Showtime read model
+    """
+    fields = (
+        'id', 'slot', 'movie_type', 'movie_language', 'audi__name', 'audi__theatre_id', 'audi__theatre__name',
+        'audi__theatre__city', 'audi__theatre__latitude', 'audi__theatre__longitude', 'movie_id', 'movie__name',
+        'movie__duration',
+    )
+
+    def get_theatres(self, city=None, zipcode=None, latitude=None, longitude=None, radius=None):
+        theatres = Theatre.objects.filter(functional_status=True)
+        if city:
+            theatres = theatres.filter(city_key=normalize_city(city))
+        if zipcode:
+            theatres = theatres.filter(zipcode=zipcode)
+        if latitude is not None and longitude is not None:
+            theatres = theatres.filter(reduce(operator.or_, [
+                Q(geohash__startswith=cell) for cell in covering_geohashes(latitude, longitude, radius)]))
+        return theatres
+
+    def get_rows(self, theatres, date):
+        slots = Slot.objects.filter(audi__theatre__in=theatres, date=date)
+        if date == datetime.date.today():
+            slots = slots.filter(slot__gt=datetime.datetime.now().hour)
+        # tuples instead of dicts, a city holds thousands of shows a day
+        return slots.values_list(*self.fields).order_by(
+            'audi__theatre__name', 'audi__theatre_id', 'movie__name', 'movie_id', 'slot', 'audi__name')
+
+    def get_showtimes(self, date, latitude=None, longitude=None, radius=None, **location):
+        """
+        returns the theatres with their movies and shows, nearest first and within the radius in km
+        when searching around a location
+        """
+        theatres = OrderedDict()
+        located = latitude is not None and longitude is not None
+        theatre = movie = None
+        rows = self.get_rows(self.get_theatres(latitude=latitude, longitude=longitude, radius=radius, **location), date)
+        for (slot_id, slot, movie_type, movie_language, audi, theatre_id, theatre_name, city, theatre_latitude,
+             theatre_longitude, movie_id, movie_name, duration) in rows:
+            if theatre is None or theatre['id'] != theatre_id:
+                theatre = theatres[theatre_id] = {'id': theatre_id, 'name': theatre_name, 'city': city, 'movies': []}
+                movie = None
+                if located:
+                    theatre['distance_km'] = round(
+                        distance_km(latitude, longitude, theatre_latitude, theatre_longitude), 2)
+            if movie is None or movie['id'] != movie_id:
+                # as the movie serializers render it
+                movie = {'id': movie_id, 'name': movie_name, 'duration': str(duration), 'shows': []}
+                theatre['movies'].append(movie)
+            movie['shows'].append({
+                'slot_id': slot_id,
+                'slot': slot,
+                'audi': audi,
+                'movie_type': movie_type,
+                'movie_language': movie_language,
+            })
+        if not located:
+            return list(theatres.values())
+        return sorted(
+            (theatre for theatre in theatres.values() if theatre['distance_km'] <= radius),
+            key=lambda theatre: theatre['distance_km'])
+
+    def get_movie_showtimes(self, movie_id):
+        """
+        returns the upcoming shows of a movie by date, theatre and auditorium with the live seats of every
+        show, read from the showtime read model alone
+        """
+        rows = list(Showtime.objects.upcoming().filter(movie_id=movie_id).order_by(
+            'date', 'theatre_name', 'theatre_id', 'audi_name', 'audi_id', 'hour').values_list(
+            'slot_id', 'date', 'hour', 'movie_type', 'movie_language', 'seats_available', 'theatre_id',
+            'theatre_name', 'audi_id', 'audi_name'))
+        seats = SeatCounterUtil().get_many((row[0], row[5]) for row in rows)
+        dates = []
+        day = theatre = audi = None
+        for (slot_id, date, hour, movie_type, movie_language, _, theatre_id, theatre_name, audi_id,
+             audi_name) in rows:
+            if day is None or day['date'] != date:
+                day = {'date': date, 'theatres': []}
+                dates.append(day)
+                theatre = None
+            if theatre is None or theatre['id'] != theatre_id:
+                theatre = {'id': theatre_id, 'name': theatre_name, 'audis': []}
+                day['theatres'].append(theatre)
+                audi = None
+            if audi is None or audi['id'] != audi_id:
+                audi = {'id': audi_id, 'name': audi_name, 'slots': []}
+                theatre['audis'].append(audi)
+            audi['slots'].append({
+                'id': slot_id,
+                'slot': hour,
+                'movie_type': movie_type,
+                'movie_language': movie_language,
+                'seats_available': seats[slot_id],
+            })
+        return dates
+
+
+class BookingQueueUtil():
+    """
+    queued booking intake for on-sale spikes. Requests are admitted against a cached count of the seats
+    left in the slot, so an effectively sold out slot is refused without touching the slot row, and
+    workers confirm the admitted requests of a slot in arrival order, a batch per slot lock.
+    """
+    batch_size = 500
+
+    @property
+    def cache(self):
+        return caches[settings.BOOKING_QUEUE_ALIAS]
+
+    def admission_key(self, slot_id):
+        return 'booking-queue:admission:{}'.format(slot_id)
+
+    def schedule_key(self, slot_id):
+        return 'booking-queue:scheduled:{}'.format(slot_id)
+
+    def admit(self, slot, seats):
+        """
+        takes the seats from the admission count of the slot, seeded from the slot row the request was
+        validated against and resynced every BOOKING_ADMISSION_TTL seconds
+        """
+        key = self.admission_key(slot.id)
+        self.cache.add(key, SeatCounterUtil().available(slot), settings.BOOKING_ADMISSION_TTL)
+        try:
+            remaining = self.cache.decr(key, seats)
+        except ValueError:
+            # the count expired in between, the worker still checks the slot row
+            return True
+        if remaining < 0:
+            self.cache.incr(key, seats)
+            return False
+        return True
+
+    def schedule(self, slot_id):
+        """
+        returns True when no worker job is queued for the slot yet, so a burst enqueues one job per slot
+        """
+        return self.cache.add(self.schedule_key(slot_id), True, settings.BOOKING_QUEUE_SCHEDULE_TTL)
+
+    def process(self, slot_id):
+        """
+        confirms or rejects every pending request of the slot and returns the ids of the new bookings
+        """
+        self.cache.delete(self.schedule_key(slot_id))
+        booking_ids = []
+        while True:
+            processed, confirmed = self.process_batch(slot_id)
+            booking_ids.extend(confirmed)
+            if processed < self.batch_size:
+                return booking_ids
+
+    @atomic()
+    def process_batch(self, slot_id):
+        slot = Slot.objects.select_for_update().filter(id=slot_id).first()
+        if slot is None:
+            return 0, []
+        requests = list(
+            BookingRequest.objects.filter(slot_id=slot_id, status=STATUS["PENDING"]).order_by('id')[:self.batch_size]
+        )
+        counter = SeatCounterUtil()
+        available = slot.seats_available
+        confirmed, rejected = [], []
+        for request in requests:
+            if counter.enabled:
+                remaining = counter.claim(slot_id, request.seats_booked)
+                granted = remaining is not None
+                available = remaining if granted else available
+                if granted:
+                    # given back if anything below fails, the bookings and the journal row go with the rollback
+                    on_rollback(lambda seats=request.seats_booked: counter.unclaim(slot_id, seats))
+            else:
+                granted = request.seats_booked <= available
+                available -= request.seats_booked if granted else 0
+            if granted:
+                confirmed.append(request)
+            else:
+                rejected.append(request.id)
+        bookings = Booking.objects.bulk_create([
+            Booking(user_id=request.user_id, slot_id=slot_id, seats_booked=request.seats_booked,
+                    booking_status=STATUS["CONFIRMED"])
+            for request in confirmed
+        ])
+        if bookings:
+            if counter.enabled:
+                counter.record(slot_id, -sum(request.seats_booked for request in confirmed))
+            else:
+                Slot.objects.filter(id=slot_id).update(seats_available=available)
+                Showtime.objects.filter(slot_id=slot_id).update(seats_available=available)
+            BookingRequest.objects.filter(id__in=[request.id for request in confirmed]).update(
+                status=STATUS["CONFIRMED"],
+                booking_id=Case(
+                    *[When(id=request.id, then=Value(booking.id)) for request, booking in zip(confirmed, bookings)],
+                    output_field=IntegerField()
+                )
+            )
+            MovieCacheUtil().invalidate([slot.movie_id], lists=False)
+            SeatEventUtil().publish(
+                slot_id, slot.movie_id, -sum(request.seats_booked for request in confirmed), seats=available)
+        if rejected:
+            BookingRequest.objects.filter(id__in=rejected).update(
+                status=STATUS["REJECTED"], error=ERROR_MESSAGES["SOLD_OUT"])
+            # the admission count was too optimistic, let the next request reseed it
+            transaction.on_commit(lambda: self.cache.delete(self.admission_key(slot_id)))
+        return len(requests), [booking.id for booking in bookings]
+
+    def pending_slots(self):
+        return BookingRequest.objects.filter(status=STATUS["PENDING"]).values_list('slot_id', flat=True).distinct()
+
+
+class SeatEventHub(object):
+    """
+    the seat event streams of this process by movie. The hub subscribes to the broker channel of a movie while
+    the movie has streams and hands them at most one event per slot every SEAT_EVENTS_INTERVAL seconds, changes
+    in between are merged into the next event. Beyond SEAT_EVENTS_MAX_STREAMS streams new ones are throttled.
+    """
+    def __init__(self):
+        self.count = 0
+        self.streams = defaultdict(set)
+        self.pending = {}
+        self.sent_at = {}
+        self.lock = threading.Lock()
+
+    def channel(self, movie_id):
+        return 'seats:{}'.format(movie_id)
+
+    def watch(self, movie_id):
+        events = queue.Queue()
+        with self.lock:
+            if self.count >= settings.SEAT_EVENTS_MAX_STREAMS:
+                raise Throttled(wait=settings.SEAT_EVENTS_RETRY_MS // 1000)
+            if not self.streams[movie_id]:
+                brokers.get().subscribe(self.channel(movie_id), self.receive)
+            self.streams[movie_id].add(events)
+            self.count += 1
+        return events
+
+    def unwatch(self, movie_id, events):
+        with self.lock:
+            if events in self.streams.get(movie_id, ()):
+                self.count -= 1
+            self.streams[movie_id].discard(events)
+            if not self.streams[movie_id]:
+                del self.streams[movie_id]
+                brokers.get().unsubscribe(self.channel(movie_id), self.receive)
+
+    def receive(self, channel, message):
+        slot_id = message['slot']
+        with self.lock:
+            pending = self.pending.get(slot_id)
+            if pending is not None:
+                # the latest seats and status win, the deltas add up
+                self.pending[slot_id] = dict(message, delta=pending['delta'] + message['delta'])
+                return
+            self.pending[slot_id] = message
+            wait = self.sent_at.get(slot_id, 0) + settings.SEAT_EVENTS_INTERVAL - time.time()
+        if wait > 0:
+            timer = threading.Timer(wait, self.send, (slot_id, ))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.send(slot_id)
+
+    def send(self, slot_id):
+        with self.lock:
+            message = self.pending.pop(slot_id, None)
+            if message is None:
+                return
+            now = time.time()
+            self.sent_at[slot_id] = now
+            if len(self.sent_at) > 10000:
+                self.sent_at = dict(
+                    (key, sent_at) for key, sent_at in self.sent_at.items()
+                    if sent_at > now - settings.SEAT_EVENTS_INTERVAL)
+            streams = list(self.streams.get(message['movie'], ()))
+        for events in streams:
+            events.put(message)
+
+
+class SeatEventStream(object):
+    """
+    the server-sent events of one client, a snapshot of the watched slots followed by their seat events.
+    The stream watches the movie from its creation so that no change after the snapshot is missed, and
+    stops watching when it is closed even if it was never read.
+    """
+    def __init__(self, hub, movie_id, slot_ids=()):
+        self.hub = hub
+        self.movie_id = movie_id
+        self.slot_ids = set(slot_ids)
+        self.events = hub.watch(movie_id)
+        self.snapshot = []
+        self.closed = False
+        self.iterator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.iterator is None:
+            self.iterator = self.iter_events()
+        return next(self.iterator)
+
+    next = __next__
+
+    def format(self, event, data):
+        return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data, separators=(',', ':')))
+
+    def iter_events(self):
+        yield 'retry: {}\n\n'.format(settings.SEAT_EVENTS_RETRY_MS)
+        yield self.format('snapshot', self.snapshot)
+        ends_at = time.time() + settings.SEAT_EVENTS_STREAM_SECONDS
+        while not self.closed:
+            timeout = min(settings.SEAT_EVENTS_HEARTBEAT, ends_at - time.time())
+            if timeout <= 0:
+                return
+            try:
+                message = self.events.get(timeout=timeout)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if not self.slot_ids or message['slot'] in self.slot_ids:
+                yield self.format('seats', message)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unwatch(self.movie_id, self.events)
+            if self.iterator is not None:
+                self.iterator.close()
+
+
+class SeatEventUtil():
+    """
+    publishes the seat changes of the slots once their transaction commits, one broker message per change
+    whatever the number of clients watching, and opens the event streams of the clients
+    """
+    hub = SeatEventHub()
+
+    def get_status(self, seats):
+        if seats <= 0:
+            return 'sold_out'
+        if seats <= settings.SEAT_EVENTS_LOW_SEATS:
+            return 'low'
+        return 'available'
+
+    def get_message(self, slot_id, movie_id, seats, delta=0, status=None):
+        return {
+            'slot': slot_id,
+            'movie': movie_id,
+            'seats_available': seats,
+            'delta': delta,
+            'status': status or self.get_status(seats),
+        }
+
+    def publish(self, slot_id, movie_id, delta, seats=None):
+        """
+        seats are the ones left by the conditional update or the counter, when only the commit settles them,
+        e.g. a release through the counters, they are read once the change is committed
+        """
+        if seats is None:
+            transaction.on_commit(lambda: self.send(slot_id, movie_id, delta))
+        else:
+            transaction.on_commit(lambda: self.broadcast(self.get_message(slot_id, movie_id, seats, delta)))
+
+    def publish_cancelled(self, slot_id, movie_id):
+        transaction.on_commit(
+            lambda: self.broadcast(self.get_message(slot_id, movie_id, 0, status='cancelled')))
+
+    def publish_cancelled_slots(self, **filters):
+        """
+        cancels the upcoming slots matching the filters, to be called before they are deleted
+        """
+        for slot_id, movie_id in Slot.objects.upcoming().filter(**filters).values_list('id', 'movie_id'):
+            self.publish_cancelled(slot_id, movie_id)
+
+    def send(self, slot_id, movie_id, delta):
+        seats = Slot.objects.filter(id=slot_id).values_list('seats_available', flat=True).first()
+        if seats is not None:
+            seats = SeatCounterUtil().get_many({slot_id: seats})[slot_id]
+            self.broadcast(self.get_message(slot_id, movie_id, seats, delta))
+
+    def broadcast(self, message):
+        try:
+            brokers.get().publish(self.hub.channel(message['movie']), message)
+        except Exception:
+            # the change is committed already, the clients catch up with the snapshot when they reconnect
+            logger.exception('could not publish the seats of slot %s', message['slot'])
+
+    def get_snapshot(self, movie_id, slot_ids=()):
+        showtimes = Showtime.objects.upcoming().filter(movie_id=movie_id)
+        if slot_ids:
+            showtimes = showtimes.filter(slot_id__in=slot_ids)
+        seats = SeatCounterUtil().get_many(showtimes.values_list('slot_id', 'seats_available'))
+        return [self.get_message(slot_id, movie_id, seats[slot_id]) for slot_id in sorted(seats)]
+
+    def stream(self, movie_id, slot_ids=()):
+        """
+        watches the movie before reading the snapshot, so the stream holds every change made after it
+        """
+        stream = SeatEventStream(self.hub, movie_id, slot_ids)
+        try:
+            stream.snapshot = self.get_snapshot(movie_id, slot_ids)
+        except Exception:
+            stream.close()
+            raise
+        return stream
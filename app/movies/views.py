@@ -1,45 +1,67 @@
 from __future__ import unicode_literals
 
 import datetime
+import operator
+from collections import OrderedDict
+from functools import reduce
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
-from django.db.models import Q
+from django.utils.dateparse import parse_date
 
 from rest_framework import mixins, status, viewsets
-from rest_framework.generics import DestroyAPIView, ListAPIView, CreateAPIView
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import DestroyAPIView, ListAPIView, CreateAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from app.movies.models import Auditorium, Movie, Theatre, Slot
-from app.users.models import Booking
+from app.movies.models import Auditorium, Movie, NowShowing, Showtime, Theatre, Slot
+from app.users.models import Booking, BookingRequest, SeatHold
+from app.commons.authentication import CachedTokenAuthentication
+from app.commons.mixins import IdempotentCreateMixin, StreamingExportMixin
+from app.commons.pagination import IdCursorPagination, NameCursorPagination, SearchPagination
 from app.commons.permissions import AdminPermissions
-from app.commons.constants import STATUS
+from app.commons.constants import ERROR_MESSAGES, STATUS
+from app.commons.geo import normalize_city
+from app.commons.metrics import registry
 
 from app.movies.serializers import(
     TheatreSerializer,
     TheatreDetailSerializer,
     AudiSerializer,
     MovieSerializer,
+    MovieSearchQuerySerializer,
     FreeSlotSerializer,
     MovieBookingSerializer,
     MovieDetailSerializer,
-    BookingsSerializer,
+    BookingExportSerializer,
+    BookingSummarySerializer,
     TotalFreeSlotSerializer,
-    SlotBookingSerializer
+    SlotBookingSerializer,
+    SeatHoldSerializer,
+    SeatEventQuerySerializer,
+    ShowtimeQuerySerializer,
+    BookingRequestSerializer
 )
 
-from app.users.tasks import user_ticket_task, send_cancelled_ticket_task
-from app.movies.utils import FreeSlotUtil
+from app.movies.tasks import process_booking_queue_task
+from app.users.tasks import user_ticket_task
+from app.users.utils import CancellationUtil
+from app.movies.utils import (
+    BookingQueueUtil, MovieCacheUtil, MovieSearchUtil, SeatEventUtil, SeatHoldUtil, ShowtimeUtil, SlotCalendar)
 
 
-class TheatreViewSet(viewsets.ModelViewSet):
+class TheatreViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     the viewset handles create and list operation on Theatre model
     """
     permission_classes = (IsAuthenticated, AdminPermissions, )
     serializer_class = TheatreSerializer
+    pagination_class = NameCursorPagination
     queryset = Theatre.objects.all().prefetch_related('auditoriums').order_by('name')
     serializer_classes = {
         'list': TheatreSerializer,
@@ -51,6 +73,36 @@ class TheatreViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         return self.serializer_classes[self.action]
 
+    def get_queryset(self):
+        queryset = super(TheatreViewSet, self).get_queryset()
+        if self.request.query_params.get('city'):
+            queryset = queryset.filter(city_key=normalize_city(self.request.query_params['city']))
+        if self.request.query_params.get('zipcode', '').isdigit():
+            queryset = queryset.filter(zipcode=self.request.query_params['zipcode'])
+        return queryset
+
+    def perform_create(self, serializer):
+        super(TheatreViewSet, self).perform_create(serializer)
+        MovieCacheUtil().invalidate()
+
+    def perform_update(self, serializer):
+        super(TheatreViewSet, self).perform_update(serializer)
+        # through the slots of its auditoriums, which are indexed by auditorium
+        showtimes = Showtime.objects.filter(slot__audi__theatre=serializer.instance).exclude(
+            theatre_name=serializer.instance.name)
+        movie_ids = list(showtimes.values_list('movie_id', flat=True).distinct())
+        showtimes.update(theatre_name=serializer.instance.name)
+        MovieCacheUtil().invalidate(movie_ids)
+
+    def perform_destroy(self, instance):
+        CancellationUtil().cancel(Booking.objects.filter(slot__audi__theatre=instance.id))
+        movie_ids = list(
+            Slot.objects.filter(audi__theatre=instance.id).values_list('movie_id', flat=True).distinct())
+        SeatEventUtil().publish_cancelled_slots(audi__theatre=instance.id)
+        instance.delete()
+        NowShowing.objects.refresh(movie_ids)
+        MovieCacheUtil().invalidate(movie_ids)
+
 
 class AudiViewSet(viewsets.ModelViewSet):
     """
@@ -68,20 +120,29 @@ class AudiViewSet(viewsets.ModelViewSet):
         context["theatre"] = theatre
         return context
 
+    def perform_update(self, serializer):
+        super(AudiViewSet, self).perform_update(serializer)
+        showtimes = Showtime.objects.filter(slot__audi=serializer.instance).exclude(
+            audi_name=serializer.instance.name)
+        movie_ids = list(showtimes.values_list('movie_id', flat=True).distinct())
+        showtimes.update(audi_name=serializer.instance.name)
+        MovieCacheUtil().invalidate(movie_ids, lists=False)
+
     def perform_destroy(self, instance):
-        slots = Slot.objects.filter(audi=instance.id).values_list('id', flat=True)
-        users_booking = Booking.objects.filter(slot__in=slots).select_related('user', 'slot', 'slot__audi__theatre', 'slot__movie')        
-        Booking.objects.filter(slot__in=slots).update(booking_status=STATUS["CANCELLED"])
-        for booking in users_booking:
-            booking_details = BookingsSerializer(booking)
-            send_cancelled_ticket_task.delay(booking.user.email, booking_details.data)
+        CancellationUtil().cancel(Booking.objects.filter(slot__audi=instance.id))
+        movie_ids = list(Slot.objects.filter(audi=instance.id).values_list('movie_id', flat=True).distinct())
+        SeatEventUtil().publish_cancelled_slots(audi=instance.id)
         instance.delete()
+        NowShowing.objects.refresh(movie_ids)
+        MovieCacheUtil().invalidate(movie_ids)
 
 
-class MovieViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class MovieViewSet(StreamingExportMixin, mixins.CreateModelMixin, mixins.ListModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """
     this viewset handles the creation operation on Movie Model
     """
+    pagination_class = NameCursorPagination
+
     def get_permissions(self):
         if ((self.request.method == 'POST') | (self.request.method == 'PATCH')):
             self.permission_classes = [IsAuthenticated, AdminPermissions, ]
@@ -91,7 +152,8 @@ class MovieViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.Update
         'create': MovieSerializer,
         'list': MovieSerializer,
         'retrieve': MovieDetailSerializer,
-        'partial_update': MovieSerializer
+        'partial_update': MovieSerializer,
+        'search': MovieSerializer
     }
 
     def get_serializer_class(self):
@@ -100,11 +162,57 @@ class MovieViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.Update
     def get_queryset(self):
         if self.request.user.is_admin:
             return Movie.objects.all().order_by('name')
-        today_date = datetime.date.today()
-        current_hour = datetime.datetime.now().hour
-        return Movie.objects.filter(
-            Q(slot__date__gt=today_date) |
-            Q(slot__date=today_date, slot__slot__gt=current_hour)).distinct()
+        return Movie.objects.filter(id__in=NowShowing.objects.showing().values('movie_id')).order_by('name')
+
+    def list(self, request, *args, **kwargs):
+        if self.is_export(request):
+            return self.export(request)
+        cache_util = MovieCacheUtil()
+        return cache_util.response_cache.response(
+            request,
+            cache_util.list_key(cache_util.get_scope(request.user), cache_util.get_query(request.query_params, (
+                self.paginator.cursor_query_param, self.paginator.page_size_query_param))),
+            lambda: super(MovieViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        cache_util = MovieCacheUtil()
+        return cache_util.response_cache.response(
+            request,
+            cache_util.detail_key(kwargs["pk"], cache_util.get_scope(request.user)),
+            lambda: super(MovieViewSet, self).retrieve(request, *args, **kwargs))
+
+    @action(detail=False, pagination_class=SearchPagination)
+    def search(self, request, *args, **kwargs):
+        """
+        searches the movies by the words of ?q in their name and about, keeping those in every ?language and
+        ?movie_type given, along with the number of matches per language and format
+        """
+        query_serializer = MovieSearchQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        search_util = MovieSearchUtil()
+        movies = search_util.search(self.get_queryset(), **query_serializer.validated_data)
+
+        def build_response():
+            response = self.get_paginated_response(
+                self.get_serializer(self.paginate_queryset(movies), many=True).data)
+            response.data['facets'] = search_util.get_facets(movies)
+            return response
+
+        cache_util = MovieCacheUtil()
+        return cache_util.response_cache.response(
+            request,
+            cache_util.search_key(cache_util.get_scope(request.user), cache_util.get_query(request.query_params, (
+                self.paginator.page_query_param, self.paginator.page_size_query_param) + tuple(
+                query_serializer.fields))),
+            build_response)
+
+    def perform_create(self, serializer):
+        super(MovieViewSet, self).perform_create(serializer)
+        MovieCacheUtil().invalidate()
+
+    def perform_update(self, serializer):
+        super(MovieViewSet, self).perform_update(serializer)
+        MovieCacheUtil().invalidate([serializer.instance.id])
 
 
 class SlotBookingViewSet(CreateAPIView):
@@ -118,6 +226,7 @@ class SlotBookingViewSet(CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        MovieCacheUtil().invalidate([serializer.validated_data["movie"]])
         return Response(status=status.HTTP_201_CREATED)
 
 
@@ -129,12 +238,11 @@ class DeleteSlotViewSet(DestroyAPIView):
     queryset = Slot.objects.all()
 
     def perform_destroy(self, instance):
-        recipient_users = []
-        users_booking = Booking.objects.filter(slot=instance.id).select_related('user', 'slot', 'slot__audi__theatre', 'slot__movie')
-        for booking in users_booking:
-            booking_details = BookingsSerializer(booking)
-            send_cancelled_ticket_task.delay(booking.user.email, booking_details.data)
+        CancellationUtil().cancel(Booking.objects.filter(slot=instance.id))
         instance.delete()
+        NowShowing.objects.refresh([instance.movie_id])
+        MovieCacheUtil().invalidate([instance.movie_id])
+        SeatEventUtil().publish_cancelled(instance.id, instance.movie_id)
 
 
 class FreeSlotsApiView(APIView):
@@ -147,29 +255,115 @@ class FreeSlotsApiView(APIView):
     def get(self, request, *args, **kwargs):
         serializer = TotalFreeSlotSerializer(data=request.data, context=self.request.query_params)
         serializer.is_valid(raise_exception=True)
+        try:
+            start_date = parse_date(request.query_params.get("start_date", ""))
+            end_date = parse_date(request.query_params.get("end_date", ""))
+        except ValueError:
+            start_date = end_date = None
+        if not (start_date and end_date) or start_date > end_date:
+            raise ValidationError(ERROR_MESSAGES["INVALID_DATE"])
         total_free_slots = []
         audis = Auditorium.objects.select_related('theatre').all()
 
-        for audi in audis:
-            audi_free_slots = FreeSlotUtil().get_free_slots(audi, request.query_params["start_date"], request.query_params["end_date"])
-            total_free_slots.append({'free_slots': audi_free_slots, 'audi': audi})
+        calendar = SlotCalendar(audis, start_date, end_date)
+
+        for audi in calendar.audis:
+            free_masks = calendar.free_masks(audi)
+            # slots free on every date of the range can be scheduled for the whole range
+            audi_free_slots = SlotCalendar.to_slots(reduce(operator.and_, free_masks))
+            total_free_slots.append({
+                'free_slots': audi_free_slots,
+                'free_slots_by_date': OrderedDict(
+                    (date, SlotCalendar.to_slots(mask)) for date, mask in zip(calendar.dates, free_masks)),
+                'calendar': free_masks,
+                'audi': audi
+            })
 
         return Response(self.serializer_class(total_free_slots, many=True).data, status=status.HTTP_200_OK)
 
 
-class MovieBookingViewSet(CreateAPIView):
+class ShowtimesApiView(APIView):
+    """
+    returns the showtimes of a city, zipcode or the area around a location on a date. City and zipcode
+    searches are cached per location and date, seats are left out so that bookings do not invalidate them.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, *args, **kwargs):
+        serializer = ShowtimeQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        def build_response():
+            return Response(ShowtimeUtil().get_showtimes(**query), status=status.HTTP_200_OK)
+
+        if 'latitude' in query:
+            return build_response()
+        cache_util = MovieCacheUtil()
+        location = normalize_city(query.get('city')) + ':' + str(query.get('zipcode', ''))
+        return cache_util.response_cache.response(
+            request, cache_util.showtimes_key(location, query['date']), build_response)
+
+
+class SeatEventsApiView(APIView):
+    """
+    streams the seat changes of the upcoming slots of a movie, or of the ?slot given, as server-sent events.
+    The stream starts with a snapshot of the slots and then sends at most one event per slot every
+    SEAT_EVENTS_INTERVAL seconds, so clients stop polling the movie. Every open stream holds a server thread
+    until it ends after SEAT_EVENTS_STREAM_SECONDS, the database connection is given back before streaming.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, *args, **kwargs):
+        serializer = SeatEventQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        movie = get_object_or_404(Movie.objects.all(), id=kwargs["movieId"])
+        stream = SeatEventUtil().stream(movie.id, serializer.validated_data.get('slot', ()))
+        if not connection.in_atomic_block:
+            connection.close()
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class CacheStatsApiView(APIView):
+    """
+    returns the hit, miss and invalidation counters of the response and token caches of this process
+    """
+    permission_classes = (IsAuthenticated, AdminPermissions, )
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'movies': MovieCacheUtil.response_cache.get_stats(),
+            'auth_tokens': CachedTokenAuthentication.token_cache.get_stats()
+        }, status=status.HTTP_200_OK)
+
+
+class MetricsApiView(APIView):
+    """
+    exposes the request metrics of this process in the prometheus text format
+    """
+    permission_classes = (IsAuthenticated, AdminPermissions, )
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MovieBookingViewSet(IdempotentCreateMixin, CreateAPIView):
     """
     this viewset handles the booking of the movie tickets for the user
     """
     permission_classes = (IsAuthenticated, )
     serializer_class = MovieBookingSerializer
 
-    def create(self, request, *args, **kwargs):
-        response = super(MovieBookingViewSet, self).create(request, *args, **kwargs)
-        users_booking = Booking.objects.filter(user=self.request.user).select_related('user', 'slot', 'slot__audi__theatre', 'slot__movie')
-        booking_details = BookingsSerializer(users_booking[0])
-        user_ticket_task.delay(self.request.user.email, booking_details.data)
-        return response
+    def perform_create(self, serializer):
+        booking = serializer.save()
+        booking_details = BookingSummarySerializer(
+            Booking.objects.values(*BookingSummarySerializer.value_fields).get(id=booking.id)).data
+        # the mixin may still roll the booking back, only mail it once it is committed
+        email = self.request.user.email
+        transaction.on_commit(lambda: user_ticket_task.delay(email, booking_details))
 
     def get_serializer_context(self):
         slot_object = get_object_or_404(Slot.objects.all(), id=self.request.data['slot'])
@@ -178,12 +372,75 @@ class MovieBookingViewSet(CreateAPIView):
         return context
 
 
-class BookingViewSet(ListAPIView):
+class BookingQueueViewSet(IdempotentCreateMixin, CreateAPIView):
+    """
+    this viewset queues a booking for the workers and answers with the url to poll for its result
+    """
+    permission_classes = (IsAuthenticated, )
+    serializer_class = BookingRequestSerializer
+
+    def perform_create(self, serializer):
+        slot_id = serializer.save().slot_id
+        if BookingQueueUtil().schedule(slot_id):
+            transaction.on_commit(lambda: process_booking_queue_task.delay(slot_id))
+
+
+class BookingRequestViewSet(RetrieveAPIView):
     """
-    this viewset fetches list of all the movie bokings made by users
+    returns the state of a queued booking, a pending one comes with a Retry-After header telling the client
+    when to poll again
     """
     permission_classes = (IsAuthenticated, )
-    serializer_class = BookingsSerializer
+    serializer_class = BookingRequestSerializer
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).select_related('slot__audi', 'slot__movie')
+        return BookingRequest.objects.filter(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        booking_request = self.get_object()
+        response = Response(self.get_serializer(booking_request).data)
+        if booking_request.status == STATUS["PENDING"]:
+            response['Retry-After'] = str(settings.BOOKING_POLL_RETRY_AFTER)
+        return response
+
+
+class SeatHoldViewSet(CreateAPIView):
+    """
+    this viewset holds specific seats of a slot for the user for a few minutes
+    """
+    permission_classes = (IsAuthenticated, )
+    serializer_class = SeatHoldSerializer
+
+
+class ConfirmSeatHoldViewSet(APIView):
+    """
+    this viewset converts the seats held by the user into a confirmed booking
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, *args, **kwargs):
+        hold = get_object_or_404(SeatHold.objects.all(), id=kwargs["pk"], user=request.user)
+        booking = SeatHoldUtil().confirm(hold)
+        booking_details = BookingSummarySerializer(
+            Booking.objects.values(*BookingSummarySerializer.value_fields).get(id=booking.id)).data
+        user_ticket_task.delay(request.user.email, booking_details)
+        return Response(booking_details, status=status.HTTP_201_CREATED)
+
+
+class BookingViewSet(StreamingExportMixin, ListAPIView):
+    """
+    this viewset fetches list of all the movie bokings made by users,
+    the export mode streams the bookings of every user to admins
+    """
+    permission_classes = (IsAuthenticated, )
+    serializer_class = BookingSummarySerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        return Booking.objects.filter(user=self.request.user).values(*BookingSummarySerializer.value_fields)
+
+    def get_export_queryset(self):
+        return Booking.objects.values(*BookingExportSerializer.value_fields).order_by('id')
+
+    def get_export_serializer_class(self):
+        return BookingExportSerializer
@@ -6,7 +6,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.contrib.auth.models import Group
 
-from app.users.models import User, Booking
+from app.users.models import User, Booking, BookingRequest, IdempotencyKey, SeatHold
 
 
 class UserCreationForm(forms.ModelForm):
@@ -68,3 +68,6 @@ class UserAdmin(BaseUserAdmin):
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Booking)
+admin.site.register(SeatHold)
+admin.site.register(IdempotencyKey)
+admin.site.register(BookingRequest)
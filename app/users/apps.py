@@ -4,4 +4,11 @@ from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
-    name = 'users'
+    name = 'app.users'
+    label = 'users'
+
+    def ready(self):
+        # connects the receivers ending cached tokens, also in processes that never import the views
+        from app.users import signals  # noqa
+        from app.commons.hashing import warm_password_validators
+        warm_password_validators()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 10:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20261018_1524'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CancelledTicket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(max_length=64)),
+                ('booking_id', models.PositiveIntegerField()),
+                ('email', models.EmailField(max_length=128)),
+                ('movie', models.CharField(max_length=64)),
+                ('audi', models.CharField(blank=True, max_length=64)),
+                ('date', models.DateField()),
+                ('slot', models.PositiveIntegerField()),
+                ('seats_booked', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='cancelledticket',
+            unique_together=set([('batch', 'booking_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='cancelledticket',
+            index_together=set([('batch', 'email')]),
+        ),
+    ]
@@ -1,9 +1,15 @@
 from __future__ import unicode_literals
 
+import datetime
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, models
+from django.utils import timezone
 
-from app.commons.constants import MAX_LENGTH_DICT
+from app.commons.constants import MAX_LENGTH_DICT, STATUS
 from app.movies.models import Slot
 
 
@@ -81,3 +87,109 @@ class Booking(models.Model):
     slot = models.ForeignKey(Slot)
     seats_booked = models.PositiveIntegerField()
     booking_status = models.CharField(max_length=MAX_LENGTH_DICT["LONG"], default="Confirmed")
+    seat_numbers = ArrayField(models.PositiveIntegerField(), default=list, blank=True)
+
+
+class SeatHold(models.Model):
+    """
+    model to store seats temporarily held by a user during checkout
+    """
+
+    user = models.ForeignKey(User)
+    slot = models.ForeignKey(Slot)
+    seats = ArrayField(models.PositiveIntegerField())
+    expires_at = models.DateTimeField()
+    status = models.CharField(max_length=MAX_LENGTH_DICT["SMALL"], default=STATUS["HELD"])
+
+    class Meta:
+        index_together = ('status', 'expires_at')
+
+
+class BookingRequest(models.Model):
+    """
+    model to queue a booking of a user until a worker confirms it into a Booking or rejects it
+    """
+
+    user = models.ForeignKey(User)
+    slot = models.ForeignKey(Slot)
+    seats_booked = models.PositiveIntegerField()
+    status = models.CharField(max_length=MAX_LENGTH_DICT["SMALL"], default=STATUS["PENDING"])
+    booking = models.OneToOneField(Booking, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.CharField(max_length=MAX_LENGTH_DICT["LONG"], blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = ('slot', 'status')
+
+
+class IdempotencyKeyManager(models.Manager):
+
+    def get_cutoff(self):
+        return timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+    def live(self):
+        return self.filter(created_at__gte=self.get_cutoff())
+
+    def expired(self):
+        return self.filter(created_at__lt=self.get_cutoff())
+
+
+class IdempotencyKey(models.Model):
+    """
+    model to remember the response of a create request made with an Idempotency-Key header
+    so that retries of the request replay it instead of repeating the work
+    """
+
+    user = models.ForeignKey(User)
+    key = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
+    fingerprint = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = IdempotencyKeyManager()
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+
+class CancelledTicketManager(models.Manager):
+
+    def create_batch(self, batch, bookings):
+        """
+        copies what the cancellation mail needs from the given bookings into the outbox
+        with a single INSERT ... SELECT, before their slots are deleted
+        """
+        try:
+            sql, params = bookings.values_list(
+                'id', 'user__email', 'slot__movie__name', 'slot__audi__name', 'slot__date', 'slot__slot', 'seats_booked'
+            ).query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} (batch, booking_id, email, movie, audi, date, slot, seats_booked) '
+                'SELECT %s, bookings.* FROM ({}) bookings'.format(self.model._meta.db_table, sql),
+                [batch] + list(params))
+            return cursor.rowcount
+
+
+class CancelledTicket(models.Model):
+    """
+    outbox of cancelled tickets waiting for their cancellation mail
+    """
+
+    batch = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
+    booking_id = models.PositiveIntegerField()
+    email = models.EmailField(max_length=MAX_LENGTH_DICT["EMAIL"])
+    movie = models.CharField(max_length=MAX_LENGTH_DICT["NAME"])
+    audi = models.CharField(max_length=MAX_LENGTH_DICT["NAME"], blank=True)
+    date = models.DateField()
+    slot = models.PositiveIntegerField()
+    seats_booked = models.PositiveIntegerField()
+
+    objects = CancelledTicketManager()
+
+    class Meta:
+        unique_together = ('batch', 'booking_id')
+        index_together = ('batch', 'email')
@@ -1,9 +1,9 @@
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth.hashers import make_password, check_password
 
 from rest_framework.authtoken.models import Token
 from rest_framework import serializers, exceptions
 
+from app.commons.hashing import password_pool
 from app.users.models import User
 from app.commons.constants import ERROR_MESSAGES
 
@@ -30,7 +30,7 @@ class UserSerializer(serializers.ModelSerializer):
         user = User(name=data['name'],
                     email=data['email'])
         validate_password(data['password'], user)
-        data['password'] = make_password(data['password'])
+        data['password'] = password_pool.make_password(data['password'])
         return data
 
 
@@ -56,7 +56,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         """
         check whether old password is correct and if so new password matches it or not
         """
-        if check_password(data['password'], self.instance.password):
+        if password_pool.check_password(data['password'], self.instance.password):
             if data['password'] == data['new_password']:
                 raise exceptions.ValidationError(ERROR_MESSAGES["SAME_PASSWORD_ERROR"])
         else:
@@ -64,6 +64,6 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         return data
 
     def update(self, instance, validated_data):
-        validated_data['password'] = make_password(validated_data['new_password'])
+        validated_data['password'] = password_pool.make_password(validated_data['new_password'])
         validated_data.pop('new_password')
         return super(ChangePasswordSerializer, self).update(instance, validated_data)
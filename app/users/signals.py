@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from app.commons.authentication import CachedTokenAuthentication
+from app.users.models import User
+
+
+# the fields whose change has to end the cached authentication of a user, last_login is not one of them
+AUTH_FIELDS = ('password', 'email', 'is_staff', 'is_admin', 'is_superuser')
+
+
+def get_auth_state(user):
+    # deferred fields are left out instead of loaded
+    return tuple(user.__dict__.get(field.attname) for field in user._meta.concrete_fields if field.name in AUTH_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_auth_state(sender, instance, **kwargs):
+    instance._auth_state = get_auth_state(instance)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    CachedTokenAuthentication.token_cache.invalidate(instance.key)
+    CachedTokenAuthentication.token_cache.versions.bump(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user(sender, instance, created, **kwargs):
+    state = get_auth_state(instance)
+    if not created and state != instance._auth_state:
+        CachedTokenAuthentication.token_cache.versions.bump(instance.pk)
+    instance._auth_state = state
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    CachedTokenAuthentication.token_cache.versions.bump(instance.pk)
@@ -1,9 +1,24 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+import logging
+import time
+from itertools import groupby
+
 from django.conf import settings
 from celery.decorators import task
+from celery.signals import worker_process_shutdown
+
+from app.commons.mail import MailBatcher, MailConnectionPool, MailTemplates
+from app.users.models import Booking, CancelledTicket, IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+mail_templates = MailTemplates()
+mail_pool = MailConnectionPool()
+mail_batcher = MailBatcher(mail_pool)
 
-from app.users.models import Booking
+
+@worker_process_shutdown.connect
+def close_mail_pool(**kwargs):
+    mail_pool.close()
 
 
 @task(name="user_ticket_task")
@@ -15,14 +30,7 @@ def user_ticket_task(user_email, ticket_details):
         'seats': ticket_details['seats_booked'],
         'audi': ticket_details['slot']['audi']['name']
     }
-    send_mail(
-            subject='Ticket Confirmation',
-            message=render_to_string('ticketConfirmation.txt', context),
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user_email],
-            html_message=render_to_string('ticketConfirmation.html', context),
-            fail_silently=False,
-        )
+    mail_batcher.send(mail_templates.message('Ticket Confirmation', 'ticketConfirmation', context, [user_email]))
 
 
 @task(name="send_cancelled_ticket_task")
@@ -34,13 +42,64 @@ def send_cancelled_ticket_task(user, ticket_details):
         'seats': ticket_details['seats_booked'],
         'audi': ticket_details['slot']['audi']['name']
     }
-    recipient_users = []
-    recipient_users.append(user)
-    send_mail(
-        subject='Ticket Cancellation',
-        message=render_to_string('ticketCancellation.txt', context),
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=recipient_users,
-        html_message=render_to_string('ticketCancellation.html', context),
-        fail_silently=False,
-    )
+    mail_batcher.send(mail_templates.message('Ticket Cancellation', 'ticketCancellation', {'tickets': [context]}, [user]))
+
+
+def cancellation_message(email, tickets):
+    """
+    builds a single cancellation mail listing every cancelled ticket of the user
+    """
+    context = {
+        'tickets': [{
+            'movie': ticket.movie,
+            'date': ticket.date,
+            'time': ticket.slot,
+            'seats': ticket.seats_booked,
+            'audi': ticket.audi
+        } for ticket in tickets]
+    }
+    return mail_templates.message('Ticket Cancellation', 'ticketCancellation', context, [email])
+
+
+@task(name="send_cancellation_mails_task")
+def send_cancellation_mails_task(batch):
+    """
+    mails the cancelled tickets of one deletion, a page of users at a time over a single
+    smtp connection, so that a user with several tickets receives one mail
+    """
+    batch_size = settings.CANCELLATION_MAIL_BATCH_SIZE
+    tickets = CancelledTicket.objects.filter(batch=batch)
+    stats = {'batch': batch, 'mails': 0, 'tickets': 0, 'seconds': 0.0}
+    last_email = ''
+    with mail_pool.connection() as connection:
+        while True:
+            started = time.time()
+            emails = list(
+                tickets.filter(email__gt=last_email).order_by('email').values_list('email', flat=True).distinct()[:batch_size]
+            )
+            if not emails:
+                break
+            last_email = emails[-1]
+            page = list(tickets.filter(email__in=emails).order_by('email', 'id'))
+            messages = [
+                cancellation_message(email, list(user_tickets))
+                for email, user_tickets in groupby(page, key=lambda ticket: ticket.email)
+            ]
+            sent = connection.send_messages(messages)
+            mail_pool.count('mails', sent or 0)
+            tickets.filter(id__in=[ticket.id for ticket in page]).delete()
+            elapsed = time.time() - started
+            stats['mails'] += len(messages)
+            stats['tickets'] += len(page)
+            stats['seconds'] += elapsed
+            logger.info(
+                'cancellation batch %s: %d mails for %d tickets in %.3fs (%.1f mails/sec)',
+                batch, len(messages), len(page), elapsed, len(messages) / elapsed if elapsed else 0.0
+            )
+    stats['mails_per_second'] = stats['mails'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+@task(name="expire_idempotency_keys_task")
+def expire_idempotency_keys_task():
+    return IdempotencyKey.objects.expired().delete()[0]
@@ -1,14 +1,24 @@
 from __future__ import unicode_literals
 
-from django.contrib.auth.hashers import make_password
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import update_last_login
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from django_dynamic_fixture import G
 from rest_framework import status
+from rest_framework.exceptions import Throttled
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
+from app.commons.authentication import CachedTokenAuthentication
+from app.commons.hashing import password_pool
+from app.commons.mail import MailBatcher, MailConnectionPool, MailTemplates
+from app.commons.smtpstub import SMTPStub
 from app.users.models import User
 
 
@@ -52,3 +62,243 @@ class TestLogoutApi(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class TestPasswordHashing(APITestCase):
+    """
+    this class tests the pooled password hashing and the rehash on login
+    """
+    def setUp(self):
+        self.user = G(User, email='hash@example.com', is_active=True)
+
+    def test_pool_round_trip(self):
+        """
+        check that hashes made in the pool verify there and outside of it
+        """
+        with self.settings(PASSWORD_HASHING_PROCESSES=1):
+            encoded = password_pool.make_password('jtg12345')
+            self.assertTrue(password_pool.check_password('jtg12345', encoded))
+            self.assertFalse(password_pool.check_password('wrong-pass', encoded))
+            password_pool.close()
+        self.assertTrue(check_password('jtg12345', encoded))
+
+    def test_timed_out_hash_keeps_its_slot(self):
+        """
+        check that a hash given up on by its request still counts against the queue until the pool finished it
+        """
+        password_pool.close()
+        with self.settings(PASSWORD_HASHING_PROCESSES=1, PASSWORD_HASHING_QUEUE=1, PASSWORD_HASHING_TIMEOUT=0.1):
+            self.addCleanup(password_pool.close)
+            self.assertRaises(Throttled, password_pool.run, time.sleep, 1)
+            self.assertRaises(Throttled, password_pool.run, abs, -1)
+            time.sleep(1.5)
+            self.assertEqual(password_pool.run(abs, -1), 1)
+
+    @override_settings(PASSWORD_HASHING_PROCESSES=0)
+    def test_login_rehashes_outdated_password(self):
+        """
+        check that logging in upgrades a hash made with another work factor
+        """
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            User.objects.filter(id=self.user.id).update(password=make_password('jtg12345'))
+        response = self.client.post(reverse('user:login'), {'username': 'hash@example.com', 'password': 'jtg12345'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password.split('$')[1], str(settings.PASSWORD_HASH_ITERATIONS))
+        self.assertTrue(check_password('jtg12345', self.user.password))
+
+    @override_settings(PASSWORD_HASHING_PROCESSES=0)
+    def test_wrong_password_is_refused(self):
+        """
+        check that a wrong password neither logs in nor touches the stored hash
+        """
+        User.objects.filter(id=self.user.id).update(password=make_password('jtg12345'))
+        self.user.refresh_from_db()
+        response = self.client.post(reverse('user:login'), {'username': 'hash@example.com', 'password': 'nope12345'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(User.objects.get(id=self.user.id).password, self.user.password)
+
+
+class TestTokenCache(APITestCase):
+    """
+    this class tests the cached token authentication
+    """
+    def setUp(self):
+        self.cache = CachedTokenAuthentication.token_cache
+        self.cache.clear()
+        self.cache.versions.cache.clear()
+        self.user = G(User, is_admin=True, is_active=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        self.url = reverse('movie:cache_stats')
+
+    def test_repeated_token_needs_no_query(self):
+        """
+        check that only the first request of a token reads it from the database
+        """
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['auth_tokens']['hits'], self.cache.stats['hits'])
+
+    def test_logout_invalidates_token(self):
+        """
+        check that a token stops working right after logout
+        """
+        self.client.get(self.url)
+        response = self.client.delete(reverse('user:logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_user(self):
+        """
+        check that changing the password drops the cached user
+        """
+        self.user.set_password('old-pass-123')
+        self.user.save()
+        self.client.get(self.url)
+        response = self.client.patch(
+            reverse('user:user_change_password'), {'password': 'old-pass-123', 'new_password': 'new-pass-456'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(self.cache.get(self.token.key))
+
+    def test_password_changed_outside_a_request_ends_token(self):
+        """
+        check that a password changed from a shell or a task makes the next request read the token again
+        """
+        self.client.get(self.url)
+        user = User.objects.get(id=self.user.id)
+        user.set_password('new-pass-456')
+        user.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_change_in_another_process_invalidates_token(self):
+        """
+        check that a version bumped elsewhere, e.g. by a logout handled by another worker, ends the cached entry
+        """
+        self.client.get(self.url)
+        self.cache.versions.incr(self.user.id)
+        self.assertIsNone(self.cache.get(self.token.key))
+
+    def test_last_login_keeps_token_cached(self):
+        """
+        check that saves leaving the authentication fields alone keep the cached entry
+        """
+        self.client.get(self.url)
+        update_last_login(None, User.objects.get(id=self.user.id))
+        user = User.objects.get(id=self.user.id)
+        user.name = 'renamed'
+        user.save()
+        self.assertIsNotNone(self.cache.get(self.token.key))
+        user.is_admin = False
+        user.save()
+        self.assertIsNone(self.cache.get(self.token.key))
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=1, AUTH_TOKEN_CACHE_TTL=0)
+    def test_entries_expire_and_are_evicted(self):
+        """
+        check that entries are bounded both in number and in age
+        """
+        self.cache.set('a', self.user, self.token, 0)
+        self.cache.set('b', self.user, self.token, 0)
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+        self.assertIsNone(self.cache.get('b'))
+
+
+class TestMailDelivery(TestCase):
+    """
+    this class tests the pooled and batched mail delivery against a local smtp stub
+    """
+    def setUp(self):
+        self.stub = SMTPStub().start()
+        self.addCleanup(self.stub.stop)
+        self.templates = MailTemplates()
+        self.context = {'movie': 'M1', 'date': '2026-10-19', 'time': 9, 'seats': 2, 'audi': 'A1'}
+
+    def confirmation(self, index):
+        return self.templates.message(
+            'Ticket Confirmation', 'ticketConfirmation', self.context, ['user{}@example.com'.format(index)])
+
+    def test_templates_are_compiled_once(self):
+        """
+        check that the compiled template is reused across mails
+        """
+        template = self.templates.get('ticketConfirmation.txt')
+        self.confirmation(1)
+        self.assertIs(self.templates.get('ticketConfirmation.txt'), template)
+
+    def test_batched_mails_share_a_connection(self):
+        """
+        check that mails handed in concurrently are sent together over one pooled connection
+        """
+        with self.settings(**self.stub.settings()):
+            pool = MailConnectionPool(size=1)
+            batcher = MailBatcher(pool, window=0.5, size=5)
+            threads = [threading.Thread(target=batcher.send, args=(self.confirmation(index),)) for index in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            batcher.send(self.confirmation(5))
+            pool.close()
+        self.assertEqual(len(self.stub.messages), 6)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(pool.get_stats()['opened'], 1)
+
+    def test_refused_mail_fails_alone(self):
+        """
+        check that a mail refused in the middle of a batch fails only its own caller and nothing is sent twice
+        """
+        self.stub.refused.add('user1@example.com')
+        errors = {}
+
+        def send(index):
+            try:
+                batcher.send(self.confirmation(index))
+            except Exception as error:
+                errors[index] = error
+
+        with self.settings(**self.stub.settings()):
+            pool = MailConnectionPool(size=1)
+            batcher = MailBatcher(pool, window=0.5, size=3)
+            batcher.concurrent = True
+            threads = [threading.Thread(target=send, args=(index, )) for index in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            pool.close()
+        self.assertEqual(list(errors), [1])
+        self.assertEqual(sorted(rcpttos for _, rcpttos, _ in self.stub.messages),
+                         [['user0@example.com'], ['user2@example.com']])
+        self.assertEqual(pool.get_stats()['mails'], 2)
+
+    def test_lone_mail_does_not_wait(self):
+        """
+        check that a caller without company sends right away instead of waiting for the window
+        """
+        with self.settings(**self.stub.settings()):
+            pool = MailConnectionPool(size=1)
+            batcher = MailBatcher(pool, window=5, size=5)
+            start = time.time()
+            for index in range(2):
+                batcher.send(self.confirmation(index))
+            pool.close()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(len(self.stub.messages), 2)
+
+    def test_idle_connections_are_replaced(self):
+        """
+        check that a connection idle for longer than the limit is not reused
+        """
+        with self.settings(**self.stub.settings()):
+            pool = MailConnectionPool(size=1, max_idle=-1)
+            pool.send_messages([self.confirmation(1)])
+            pool.send_messages([self.confirmation(2)])
+            pool.close()
+        self.assertEqual(len(self.stub.messages), 2)
+        self.assertEqual(pool.get_stats()['opened'], 2)
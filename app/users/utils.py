@@ -0,0 +1,27 @@
+import uuid
+
+from django.db import transaction
+
+from app.commons.constants import STATUS
+from app.users.models import CancelledTicket
+from app.users.tasks import send_cancellation_mails_task
+
+
+class CancellationUtil(object):
+    """
+    cancels bookings and queues a single notification job for all of them
+    """
+
+    def cancel(self, bookings):
+        """
+        snapshots the bookings into the cancellation outbox, marks them cancelled and
+        enqueues one mail job for the whole batch once the transaction commits
+        """
+        batch = uuid.uuid4().hex
+        bookings = bookings.exclude(booking_status=STATUS["CANCELLED"])
+        with transaction.atomic():
+            count = CancelledTicket.objects.create_batch(batch, bookings)
+            bookings.update(booking_status=STATUS["CANCELLED"])
+        if count:
+            transaction.on_commit(lambda: send_cancellation_mails_task.delay(batch))
+        return count
@@ -0,0 +1,21 @@
+"""
+cooperative entry point, e.g. gunicorn -k gevent --worker-connections 1000 gevent_wsgi. Every request runs in a
+greenlet of the worker and waits for the database without blocking the others, see app.commons.green.
+Database connections belong to a greenlet, so share DB_POOL_SIZE of them with 'POOL': True and
+'CONN_MAX_AGE': 0 instead of opening one per concurrent request. Requests beyond the pool queue for a
+connection for DB_POOL_GREEN_TIMEOUT seconds rather than DB_POOL_TIMEOUT, see benchmarks/concurrency.json for
+the benchmark_concurrency numbers.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+from app.commons.green import patch_psycopg
+patch_psycopg()
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+application = get_wsgi_application()
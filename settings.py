@@ -24,7 +24,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'app.commons.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -32,6 +32,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'app.commons.metrics.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -84,6 +85,23 @@ TIME_ZONE = 'Asia/Kolkata'
 
 AUTH_USER_MODEL = 'users.User'
 
+AUTHENTICATION_BACKENDS = ['app.commons.hashing.PooledModelBackend']
+
+PASSWORD_HASHERS = [
+    'app.commons.hashing.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+]
+
+PASSWORD_HASH_ITERATIONS = 36000
+# processes hashing passwords for each web process, 0 hashes in the request thread
+PASSWORD_HASHING_PROCESSES = 2
+PASSWORD_HASHING_QUEUE = 32
+PASSWORD_HASHING_TIMEOUT = 5
+
 USE_I18N = True
 
 USE_L10N = True
@@ -91,3 +109,122 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+    'seats': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'seats',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+    'booking-queue': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'booking-queue',
+    },
+    'auth-tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth-tokens',
+        'TIMEOUT': None,
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 300
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+# every cached token is checked against the version of its user in this cache, it has to be shared by all
+# processes or a logout only takes effect in the process that handled it
+AUTH_TOKEN_VERSION_ALIAS = 'auth-tokens'
+
+SEAT_HOLD_MINUTES = 10
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# the seat counters are only safe on a cache shared by every process, or with a single process
+SEAT_COUNTER_ENABLED = False
+SEAT_COUNTER_ALIAS = 'seats'
+
+# the admission counts and queued job markers of the booking queue are shared by the web processes and the
+# celery workers, so the alias has to be a cache all of them reach as soon as there is more than one process
+BOOKING_QUEUE_ALIAS = 'booking-queue'
+BOOKING_ADMISSION_TTL = 60
+BOOKING_QUEUE_SCHEDULE_TTL = 30
+# seconds a client is asked to wait before polling a pending booking request again
+BOOKING_POLL_RETRY_AFTER = 1
+
+# seat change events are published through this broker, the streams are served by every web process and the
+# bookings confirmed by the celery workers, so it has to reach all of them. LocalBroker only reaches the
+# streams of the publishing process, deployments switch to the RedisBroker in local_settings.py.
+PUBSUB_BROKER = {
+    'BACKEND': 'app.commons.pubsub.LocalBroker',
+    'OPTIONS': {},
+}
+# a stream sends at most one event per slot every SEAT_EVENTS_INTERVAL seconds, marks slots with this few
+# seats left as low, sends a comment line when idle for SEAT_EVENTS_HEARTBEAT seconds and ends after
+# SEAT_EVENTS_STREAM_SECONDS, clients reconnect with the retry delay
+SEAT_EVENTS_INTERVAL = 1.0
+SEAT_EVENTS_LOW_SEATS = 10
+SEAT_EVENTS_HEARTBEAT = 15
+SEAT_EVENTS_STREAM_SECONDS = 300
+SEAT_EVENTS_RETRY_MS = 3000
+# every open stream holds a server thread, a process serves at most this many at once and asks the other
+# clients to retry later
+SEAT_EVENTS_MAX_STREAMS = 50
+
+CANCELLATION_MAIL_BATCH_SIZE = 200
+
+EMAIL_POOL_SIZE = 2
+EMAIL_POOL_MAX_IDLE = 30
+EMAIL_BATCH_WINDOW = 0.005
+EMAIL_BATCH_SIZE = 50
+
+# the app.commons.db engine keeps up to DB_POOL_SIZE connections per web process and DB_WORKER_POOL_SIZE
+# per celery worker process when its POOL option is on, requests wait DB_POOL_TIMEOUT seconds for a free one
+DB_POOL_SIZE = 10
+DB_WORKER_POOL_SIZE = 2
+DB_POOL_TIMEOUT = 5
+# a waiting greenlet of gevent_wsgi holds no thread, so under gevent requests queue this long instead and
+# None waits until a connection is returned
+DB_POOL_GREEN_TIMEOUT = None
+# connections idle for longer are checked with SELECT 1 before they are used again
+DB_HEALTH_CHECK_IDLE = 30
+
+METRICS_PATH_PREFIX = '/api/'
+# queries slower than this many seconds are logged with the view, None turns the slow query log off
+METRICS_SLOW_QUERY_SECONDS = None
+METRICS_SLOW_QUERY_SAMPLE_RATE = 1.0
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-seat-counters': {
+        'task': 'flush_seat_counters_task',
+        'schedule': 5.0,
+    },
+    'process-pending-booking-queues': {
+        'task': 'process_pending_booking_queues_task',
+        'schedule': 30.0,
+    },
+    'release-expired-seat-holds': {
+        'task': 'release_expired_holds_task',
+        'schedule': 60.0,
+    },
+    'expire-now-showing': {
+        'task': 'expire_now_showing_task',
+        'schedule': 60 * 60.0,
+    },
+    'expire-showtimes': {
+        'task': 'expire_showtimes_task',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'expire-idempotency-keys': {
+        'task': 'expire_idempotency_keys_task',
+        'schedule': 60 * 60.0,
+    },
+}